@@ -39,10 +39,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'H_app.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'H_app.branches.BranchMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +72,27 @@ WSGI_APPLICATION = 'E_Hospitality.wsgi.application'
 
 
 
+# A shared cache is required whenever more than one process runs: web workers
+# and cron commands. Rate limits are counted in it, and it keeps cached pages,
+# agendas, analytics and calendar feeds coherent, since whichever process writes
+# invalidates them there (generation counters, see H_app/versioned_cache.py).
+# LocMemCache is per process: fine for runserver on its own, and reported as an
+# error by `manage.py check --deploy`.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -79,6 +102,22 @@ DATABASES = {
 
 
 
+# Hospital branches (H_app/branches.py). Each branch keeps its appointments,
+# records, prescriptions and bills in its own database alias, e.g.
+#     HOSPITAL_BRANCHES = {'north': {'name': 'North Campus', 'database': 'north',
+#                                    'locations': ['North Campus']}}
+# with DATABASES['north'] defined; then run `manage.py migrate --database=north`
+# and `manage.py sync_branch_directories`.
+HOSPITAL_BRANCHES = {}
+DATABASE_ROUTERS = ['H_app.branches.BranchRouter']
+
+# Loads request.user together with its profiles in one query. ModelBackend stays
+# listed for the sessions logged in through it before, which Django would
+# otherwise end; they move over at their next login.
+AUTHENTICATION_BACKENDS = [
+    'H_app.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -114,3 +153,41 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "H_app.CustomUser"
 STRIPE_SECRET_KEY = 'your-secret-key'
 STRIPE_PUBLIC_KEY = 'your-public-key'
+
+# Archiving (manage.py archive_cold_rows)
+ARCHIVE_APPOINTMENTS_AFTER_DAYS = 90
+ARCHIVE_CLINICAL_RECORDS_AFTER_DAYS = 730
+
+# Delta sync (H_app/sync.py): change log entries older than this are removed by
+# manage.py prune_change_log; clients that were offline longer get a new snapshot.
+CHANGE_LOG_RETENTION_DAYS = 30
+
+# Appointment reminders (manage.py send_appointment_reminders): 'console', 'file',
+# 'smtp' or an email backend path. The SMTP backend uses the EMAIL_* settings.
+REMINDER_EMAIL_BACKEND = os.environ.get('REMINDER_EMAIL_BACKEND', 'console')
+REMINDER_FILE_PATH = os.path.join(BASE_DIR, 'sent_reminders')
+REMINDER_FROM_EMAIL = 'reminders@e-hospitality.example'
+
+# Medical record attachments (H_app/attachments.py), stored by content hash.
+ATTACHMENT_ROOT = os.path.join(BASE_DIR, 'attachments')
+ATTACHMENT_MAX_SIZE = 50 * 1024 * 1024
+
+# Rendered printable prescriptions, named by content hash (H_app/printing.py).
+PRESCRIPTION_PRINT_ROOT = os.path.join(BASE_DIR, 'printed_prescriptions')
+
+# How long a freed slot is held for the waitlisted patient it was offered to.
+WAITLIST_HOLD_MINUTES = 30
+
+# Audit log of clinical record reads (H_app/audit.py): entries are buffered per
+# worker and bulk-inserted when the buffer is full or every interval seconds.
+AUDIT_LOG_BUFFER_SIZE = 100
+AUDIT_LOG_FLUSH_INTERVAL = 5
+
+# Token-bucket rate limits per scope ('count/period'); None disables a scope.
+# Attempted usernames get ten times their scope's rate unless '<scope>-username'
+# is set, so that one address cannot lock an account out (H_app/ratelimit.py).
+RATELIMITS = {
+    'login': '10/m',
+    'signup': '5/h',
+    'booking': '20/h',
+}
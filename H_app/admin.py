@@ -1,3 +1,44 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.utils import timezone
 
-# Register your models here.
+from .deletion import start_deletion
+from .models import CustomUser, DeletionJob
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(UserAdmin):
+    fieldsets = UserAdmin.fieldsets + (('Hospital', {'fields': ('user_type', 'branch')}),)
+    list_display = ('username', 'email', 'user_type', 'branch', 'is_active', 'is_staff')
+    list_filter = UserAdmin.list_filter + ('user_type', 'branch')
+    actions = ['remove_in_background']
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting a user cascades through all their clinical rows in one transaction;
+        # removal goes through a DeletionJob instead.
+        return False
+
+    @admin.action(description="Remove selected users (in the background)", permissions=['change'])
+    def remove_in_background(self, request, queryset):
+        jobs = [start_deletion(user, requested_by=request.user) for user in queryset.exclude(pk=request.user.pk)]
+        self.message_user(
+            request,
+            f"Deactivated {len(jobs)} users; manage.py process_deletion_jobs removes them in batches.",
+            messages.SUCCESS,
+        )
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('username', 'status', 'step', 'processed_rows', 'total_rows', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = [field.name for field in DeletionJob._meta.fields]
+    actions = ['requeue']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected failed jobs", permissions=['change'])
+    def requeue(self, request, queryset):
+        count = queryset.filter(status='Failed').update(status='Pending', error='', updated_at=timezone.now())
+        self.message_user(request, f"Requeued {count} jobs.", messages.SUCCESS)
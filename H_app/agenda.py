@@ -0,0 +1,115 @@
+"""
+Per-doctor daily agenda.
+
+The agenda of one doctor-day is built with a single query (slots, patient name and
+age, and whether the patient already has prescriptions or records from this
+doctor), rendered once and kept in the cache. The entry is dropped by the signals
+in signals.py only when one of that doctor's appointments on that day changes,
+when a prescription or record changes a flag shown on it, or when the name or age
+of a patient on it changes. Entries are dropped once the write commits, so that a
+request reading in the meantime cannot cache the agenda from before it again.
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+
+from .branches import databases
+from .models import Appointment, MedicalRecord, Prescription
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# Patient fields shown on the agenda, by model.
+PATIENT_FIELDS = {'customuser': {'username'}, 'patientprofile': {'name', 'age'}}
+
+
+def agenda_key(doctor_id, day):
+    return f'agenda:{doctor_id}:{day.isoformat()}'
+
+
+def agenda_rows(doctor_id, day):
+    return list(
+        Appointment.objects
+        .filter(doctor_id=doctor_id, date=day)
+        .annotate(
+            has_prescription=Exists(
+                Prescription.objects.filter(patient=OuterRef('patient'), doctor=OuterRef('doctor'))
+            ),
+            has_record=Exists(
+                MedicalRecord.objects.filter(patient=OuterRef('patient'), doctor=OuterRef('doctor'))
+            ),
+        )
+        .order_by('time')
+        .values(
+            'id', 'time', 'duration_minutes', 'status', 'is_virtual', 'location', 'patient_id',
+            'patient__username', 'patient__patient_profile__name', 'patient__patient_profile__age',
+            'has_prescription', 'has_record',
+        )
+    )
+
+
+def render_agenda(doctor_id, day):
+    """
+    Returns the rendered agenda table, from the cache when possible.
+    """
+    key = agenda_key(doctor_id, day)
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string('appointments/doctor_agenda_table.html', {
+            'rows': agenda_rows(doctor_id, day),
+        })
+        cache.set(key, html, CACHE_TIMEOUT)
+    return html
+
+
+def invalidate(doctor_id, days, using=None):
+    invalidate_slots(((doctor_id, day) for day in days), using)
+
+
+def invalidate_slots(slots, using=None):
+    """
+    Drops the agendas of (doctor_id, day) pairs once the transaction on `using`
+    commits.
+    """
+    keys = [agenda_key(doctor_id, day) for doctor_id, day in set(slots)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys), using=using or router.db_for_write(Appointment))
+
+
+def invalidate_for_patient(doctor_id, patient_id, using=None):
+    invalidate_for_patients([(doctor_id, patient_id)], using)
+
+
+def invalidate_for_patients(pairs, using=None):
+    """
+    Prescriptions and records are flagged on every upcoming agenda the patient is
+    on; drops those of (doctor_id, patient_id) pairs, with one query.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return
+    rows = (
+        Appointment.objects.db_manager(using)
+        .filter(doctor_id__in={doctor_id for doctor_id, _ in pairs},
+                patient_id__in={patient_id for _, patient_id in pairs}, date__gte=date.today())
+        .values_list('doctor_id', 'patient_id', 'date')
+    )
+    invalidate_slots(
+        ((doctor_id, day) for doctor_id, patient_id, day in rows if (doctor_id, patient_id) in pairs), using
+    )
+
+
+def invalidate_patient(patient_id, using=None):
+    """
+    The patient's name and age are shown on every upcoming agenda they are on, in
+    any database: profiles are copied to the branch databases without signals.
+    """
+    slots = set()
+    for alias in databases():
+        slots.update(
+            Appointment.objects.using(alias)
+            .filter(patient_id=patient_id, date__gte=date.today())
+            .values_list('doctor_id', 'date')
+        )
+    invalidate_slots(slots, using)
@@ -0,0 +1,242 @@
+"""
+Appointment analytics for the admin dashboard: occupancy heatmaps by weekday and
+hour, no-show and cancellation rates, and booking lead times, per doctor or per
+specialization.
+
+`load` reads the few columns these need for every appointment of the period, hot
+and archived, with one values_list() query per table and turns each column into a
+NumPy array. All statistics are then computed on whole columns: grouping is done
+with np.bincount over integer group indices, never with a Python loop over rows.
+
+Occupancy is the share of doctor-hours booked: minutes of non-canceled
+appointments falling into each weekday-hour cell, divided by 60 minutes for every
+doctor of the group on every such weekday of the period. A no-show is an
+appointment in the past that is still Scheduled or Confirmed, i.e. was neither
+completed nor canceled. Lead time is the number of days from booking
+(Appointment.created_at) to the appointment; appointments booked before
+created_at was recorded are left out.
+
+Results are cached per period and grouping until appointments, doctors or
+specializations change.
+Everything is computed for the current branch database.
+"""
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Coalesce, Substr
+
+from .models import Appointment, ArchivedAppointment, DoctorProfile, Specialization
+from .versioned_cache import CachedValue
+
+ANALYTICS = CachedValue(
+    'appointment-analytics', [Appointment, ArchivedAppointment, DoctorProfile, Specialization]
+)
+
+GROUPINGS = ('specialization', 'doctor')
+# Statuses of past appointments that never happened.
+NOT_ATTENDED = ('Scheduled', 'Confirmed')
+DEFAULT_PERIOD_DAYS = 90
+MAX_PERIOD_DAYS = 3 * 366
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+HOURS = np.arange(24) * 60
+LEAD_TIME_BINS = (0, 1, 2, 4, 8, 15, 31, 61)
+LEAD_TIME_LABELS = (
+    'same day', '1 day', '2-3 days', '4-7 days', '8-14 days', '15-30 days', '31-60 days', '61+ days'
+)
+
+Columns = namedtuple('Columns', 'doctor day status start duration booked')
+
+FIELDS = ('doctor_id', 'day_text', 'status', 'time_text', 'duration_minutes', 'booked_text')
+
+
+def _text(field, length):
+    # Dates and times are read as text, which skips Django's per-row converters;
+    # NumPy then parses the whole column at once.
+    return Substr(Cast(field, output_field=CharField()), 1, length)
+
+
+def _fetch(queryset, start, end):
+    return list(
+        queryset.filter(date__range=(start, end))
+        .annotate(
+            day_text=_text('date', 10),
+            time_text=_text('time', 5),
+            # The UTC date; TIME_ZONE is UTC as well.
+            booked_text=Coalesce(_text('created_at', 10), Value('NaT')),
+        )
+        .values_list(*FIELDS)
+    )
+
+
+def minutes(times):
+    """
+    Minutes since midnight of 'HH:MM' strings.
+    """
+    digits = np.array(times, dtype='S5').view(np.uint8).reshape(-1, 5).astype(np.int64) - ord('0')
+    return (digits[:, 0] * 10 + digits[:, 1]) * 60 + digits[:, 3] * 10 + digits[:, 4]
+
+
+def load(start, end):
+    """
+    The appointments from `start` to `end` (inclusive) as Columns of NumPy arrays.
+    """
+    rows = _fetch(Appointment.objects, start, end) + _fetch(ArchivedAppointment.objects, start, end)
+    doctor, day, status, time, duration, booked = zip(*rows) if rows else ((),) * 6
+    return Columns(
+        doctor=np.array(doctor, dtype=np.int64),
+        day=np.array(day, dtype='datetime64[D]'),
+        status=np.array(status, dtype='U9'),
+        start=minutes(time),
+        duration=np.array(duration, dtype=np.int64),
+        # Unknown booking dates are NaT.
+        booked=np.array(booked, dtype='datetime64[D]'),
+    )
+
+
+def weekday(days):
+    """
+    0 for Monday to 6 for Sunday; 1970-01-01, day 0, was a Thursday.
+    """
+    return (days.astype(np.int64) + 3) % 7
+
+
+def weekday_counts(start, end):
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    return np.bincount(weekday(days), minlength=7)
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    return np.divide(numerator, denominator, out=np.full(numerator.shape, np.nan), where=denominator > 0)
+
+
+def _json(values, decimals=4):
+    """
+    Rounded nested lists, with None for undefined ratios (JSON has no NaN).
+    """
+    values = np.round(values, decimals)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def booked_minutes(columns, group, n_groups):
+    """
+    Minutes booked per (group, weekday, hour), shape (n_groups, 7, 24).
+    """
+    kept = columns.status != 'Canceled'
+    start = columns.start[kept]
+    end = start + columns.duration[kept]
+    # Minutes of each appointment inside each hour of its day, shape (appointments, 24).
+    overlap = np.clip(np.minimum(end[:, None], HOURS + 60) - np.maximum(start[:, None], HOURS), 0, None)
+    cell = group[kept] * 7 + weekday(columns.day[kept])
+    grid = np.empty((n_groups * 7, 24))
+    for hour in range(24):
+        grid[:, hour] = np.bincount(cell, weights=overlap[:, hour], minlength=n_groups * 7)
+    return grid.reshape(n_groups, 7, 24)
+
+
+def lead_times(columns):
+    """
+    Days from booking to appointment, for appointments with a known booking date.
+    Appointments entered after the fact (negative lead time) are left out.
+    """
+    known = ~np.isnat(columns.booked)
+    days = (columns.day - columns.booked).astype(np.int64)
+    return known & (days >= 0), days
+
+
+def _groups(columns, group_by):
+    """
+    (group index per appointment, labels, doctors per group).
+    """
+    doctors = list(DoctorProfile.objects.order_by('pk').values_list('pk', 'user__username', 'specialization__name'))
+    ids = np.array([pk for pk, _, _ in doctors], dtype=np.int64)
+    if not len(ids):
+        return np.full(len(columns.doctor), -1), [], np.zeros(0, dtype=np.int64)
+    # Appointments of doctors missing from the directory are left out by the callers.
+    position = np.searchsorted(ids, columns.doctor)
+    known = position < len(ids)
+    known[known] = ids[position[known]] == columns.doctor[known]
+    if group_by == 'doctor':
+        labels = [{'doctor_id': pk, 'username': username, 'specialization': specialization}
+                  for pk, username, specialization in doctors]
+        return np.where(known, position, -1), labels, np.ones(len(ids), dtype=np.int64)
+    names, doctor_group = np.unique(
+        np.array([specialization or '' for _, _, specialization in doctors], dtype=str), return_inverse=True
+    )
+    labels = [{'specialization': name or None} for name in names.tolist()]
+    group = np.where(known, doctor_group[np.minimum(position, len(ids) - 1)], -1)
+    return group, labels, np.bincount(doctor_group, minlength=len(names))
+
+
+def compute(start, end, group_by='specialization', today=None):
+    today = np.datetime64(today or date.today(), 'D')
+    columns = load(start, end)
+    group, labels, doctor_counts = _groups(columns, group_by)
+    columns = Columns(*(column[group >= 0] for column in columns))
+    group = group[group >= 0]
+    n_groups = len(labels)
+
+    canceled = columns.status == 'Canceled'
+    past = columns.day < today
+    no_show = past & np.isin(columns.status, NOT_ATTENDED)
+    attendable = past & ~canceled
+    with_lead, lead = lead_times(columns)
+
+    def per_group(mask, weights=None):
+        return np.bincount(group[mask], weights=None if weights is None else weights[mask], minlength=n_groups)
+
+    appointments = np.bincount(group, minlength=n_groups)
+    booked = booked_minutes(columns, group, n_groups)
+    available = weekday_counts(start, end)[None, :, None] * 60 * doctor_counts[:, None, None]
+    occupancy = _ratio(booked, available)
+    overall = _ratio(booked.sum(axis=0), available.sum(axis=0))
+
+    cancellation_rates = _ratio(per_group(canceled), appointments)
+    no_show_rates = _ratio(per_group(no_show), per_group(attendable))
+    mean_lead = _ratio(per_group(with_lead, lead), per_group(with_lead))
+
+    known_lead = lead[with_lead]
+    histogram = np.bincount(np.searchsorted(LEAD_TIME_BINS, known_lead, side='right') - 1,
+                            minlength=len(LEAD_TIME_BINS))
+    groups = [
+        {
+            **label,
+            'doctors': int(doctor_counts[index]),
+            'appointments': int(appointments[index]),
+            'cancellation_rate': _json(cancellation_rates[index]),
+            'no_show_rate': _json(no_show_rates[index]),
+            'mean_lead_days': _json(mean_lead[index], 1),
+            'occupancy': _json(occupancy[index]),
+        }
+        for index, label in enumerate(labels)
+        if appointments[index]
+    ]
+    return {
+        'start': str(start),
+        'end': str(end),
+        'group_by': group_by,
+        'weekdays': WEEKDAYS,
+        'hours': list(range(24)),
+        'appointments': len(group),
+        'cancellation_rate': _json(_ratio(canceled.sum(), len(group))),
+        'no_show_rate': _json(_ratio(no_show.sum(), attendable.sum())),
+        'occupancy': _json(overall),
+        'lead_time': {
+            'appointments': len(known_lead),
+            'median_days': _json(np.median(known_lead), 1) if len(known_lead) else None,
+            'p90_days': _json(np.percentile(known_lead, 90), 1) if len(known_lead) else None,
+            'mean_days': _json(known_lead.mean(), 1) if len(known_lead) else None,
+            'histogram': dict(zip(LEAD_TIME_LABELS, histogram.tolist())),
+        },
+        'groups': groups,
+    }
+
+
+def appointment_analytics(start, end, group_by='specialization'):
+    """
+    compute() for the current branch database, cached until its inputs change.
+    """
+    today = date.today()
+    return ANALYTICS.get_or_set(lambda: compute(start, end, group_by, today), start, end, group_by, today)
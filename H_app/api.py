@@ -0,0 +1,201 @@
+"""
+Versioned, read-only JSON API used by the mobile app.
+
+Every collection supports:
+  ?fields=a,b,c   only the listed columns are selected from the database
+  ?cursor=...     opaque cursor returned as `next_cursor` by the previous page
+  ?limit=N        page size (default 50, max 200)
+
+Responses carry a weak ETag built from max(updated_at) and the row count of the
+collection, so an unchanged collection is answered with 304 before any row is read.
+"""
+import base64
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Appointment, Billing, Facility, MedicalRecord, Prescription
+
+API_VERSION = 'v1'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ApiResource:
+    """
+    Describes one collection: the model, the columns clients may request and how
+    rows are scoped to the requesting user.
+    """
+
+    def __init__(self, model, fields, default_fields=None, patient_field='patient', doctor_field='doctor'):
+        self.model = model
+        self.fields = tuple(fields)
+        self.default_fields = tuple(default_fields or fields)
+        self.patient_field = patient_field
+        self.doctor_field = doctor_field
+
+    def queryset_for(self, user):
+        queryset = self.model.objects.all()
+        if user.is_staff or user.user_type == 'admin':
+            return queryset
+        if user.user_type == 'doctor' and self.doctor_field:
+            return queryset.filter(**{f'{self.doctor_field}__user': user})
+        if self.patient_field:
+            return queryset.filter(**{self.patient_field: user})
+        return queryset
+
+    def parse_fields(self, raw):
+        if not raw:
+            return self.default_fields
+        requested = [field.strip() for field in raw.split(',') if field.strip()]
+        unknown = [field for field in requested if field not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if 'id' not in requested:
+            requested.insert(0, 'id')
+        return tuple(requested)
+
+
+RESOURCES = {
+    'appointments': ApiResource(
+        Appointment,
+        fields=['id', 'patient_id', 'doctor_id', 'series_id', 'date', 'time', 'status', 'duration_minutes',
+                'is_virtual', 'location', 'appointment_notes', 'updated_at'],
+        default_fields=['id', 'doctor_id', 'date', 'time', 'status', 'duration_minutes', 'is_virtual', 'location'],
+    ),
+    'prescriptions': ApiResource(
+        Prescription,
+        fields=['id', 'patient_id', 'doctor_id', 'medication_name', 'dosage_instructions', 'medicines',
+                'created_at', 'updated_at'],
+        default_fields=['id', 'doctor_id', 'medication_name', 'created_at'],
+    ),
+    'medical-records': ApiResource(
+        MedicalRecord,
+        fields=['id', 'patient_id', 'doctor_id', 'diagnosis', 'treatment_plan', 'medications', 'allergies',
+                'created_at', 'updated_at'],
+        default_fields=['id', 'doctor_id', 'diagnosis', 'created_at'],
+    ),
+    'billing': ApiResource(
+        Billing,
+        fields=['id', 'patient_id', 'total_amount', 'payment_status', 'date_issued', 'payment_date',
+                'updated_at'],
+        doctor_field=None,
+    ),
+    'facilities': ApiResource(
+        Facility,
+        fields=['id', 'name', 'location', 'department', 'resources', 'resource_quantity',
+                'resource_available', 'updated_at'],
+        default_fields=['id', 'name', 'location', 'department', 'resource_available'],
+        patient_field=None,
+        doctor_field=None,
+    ),
+}
+
+
+def encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return int(base64.urlsafe_b64decode(padded.encode()).decode())
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _collection_etag(queryset, request):
+    """
+    One aggregate query over the collection; the request's query string is mixed in
+    because different projections and pages of the same data are different bodies.
+    """
+    stats = queryset.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    fingerprint = '|'.join([
+        API_VERSION,
+        request.path,
+        request.META.get('QUERY_STRING', ''),
+        stats['last_modified'].isoformat() if stats['last_modified'] else '',
+        str(stats['count']),
+    ])
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()
+    return f'W/"{digest}"', stats['last_modified']
+
+
+def _conditional(request, queryset):
+    etag, last_modified = _collection_etag(queryset, request)
+    last_modified = last_modified.timestamp() if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return response, etag, last_modified
+
+
+def _finish(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    if last_modified:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def api_view(view_func):
+    @wraps(view_func)
+    def wrapper(request, resource, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return _error('Method not allowed.', 405)
+        if not request.user.is_authenticated:
+            return _error('Authentication required.', 401)
+        api_resource = RESOURCES.get(resource)
+        if api_resource is None:
+            return _error(f"Unknown resource '{resource}'.", 404)
+        return view_func(request, api_resource, *args, **kwargs)
+    return wrapper
+
+
+@api_view
+def api_list(request, resource):
+    try:
+        fields = resource.parse_fields(request.GET.get('fields'))
+        limit = min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        after = decode_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
+    except (ValueError, UnicodeDecodeError) as e:
+        return _error(str(e) or 'Invalid parameters.', 400)
+    if limit < 1:
+        return _error('limit must be positive.', 400)
+
+    queryset = resource.queryset_for(request.user)
+    not_modified, etag, last_modified = _conditional(request, queryset)
+    if not_modified is not None:
+        return not_modified
+
+    page = queryset.order_by('id')
+    if after is not None:
+        page = page.filter(id__gt=after)
+    rows = list(page.values(*fields)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]['id']) if len(rows) > limit else None
+
+    return _finish(JsonResponse({
+        'results': rows[:limit],
+        'next_cursor': next_cursor,
+    }), etag, last_modified)
+
+
+@api_view
+def api_detail(request, resource, pk):
+    try:
+        fields = resource.parse_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    queryset = resource.queryset_for(request.user).filter(id=pk)
+    not_modified, etag, last_modified = _conditional(request, queryset)
+    if not_modified is not None:
+        return not_modified
+
+    row = queryset.values(*fields).first()
+    if row is None:
+        return _error('Not found.', 404)
+    return _finish(JsonResponse(row), etag, last_modified)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'H_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,149 @@
+"""
+Moves cold rows out of the hot clinical tables into the Archived* tables.
+
+Each batch copies at most `batch_size` rows with one bulk insert and removes them
+from the hot table in the same transaction, so the job can be run from cron at any
+time and interrupted safely. Archived rows are only read through the explicit
+"include archived" helpers below.
+
+Archiving is not deletion: the hot rows are removed without the delete signals,
+which would free slots, tell sync clients the rows are gone and so on, once per
+row. Receivers of `rows_archived` are sent each batch instead.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import (
+    Appointment, ArchivedAppointment, ArchivedMedicalRecord, ArchivedPrescription, MedicalRecord, Prescription
+)
+
+DEFAULT_BATCH_SIZE = 500
+
+# Sent once per batch with `rows`, the archived rows as dicts of 'pk' and the
+# policy's fields, and `using`, inside the batch's transaction.
+rows_archived = Signal()
+
+
+def _remove(model, ids, using):
+    """
+    Deletes rows without sending delete signals. Rows referring to them go as
+    their foreign keys' on_delete says; DO_NOTHING ones keep the archived id.
+    """
+    if not ids:
+        return
+    for relation in model._meta.get_fields(include_hidden=True):
+        if not (relation.auto_created and not relation.concrete and relation.related_model):
+            continue
+        referring = relation.related_model._base_manager.using(using).filter(**{f'{relation.field.name}__in': ids})
+        if relation.on_delete is models.CASCADE:
+            _remove(relation.related_model, list(referring.values_list('pk', flat=True)), using)
+        elif relation.on_delete is models.SET_NULL:
+            referring.update(**{relation.field.name: None})
+        elif relation.on_delete is not models.DO_NOTHING:
+            raise ImproperlyConfigured(
+                f"{relation.related_model.__name__}.{relation.field.name} does not let {model.__name__} "
+                "rows be archived."
+            )
+    model._base_manager.using(using).filter(pk__in=ids)._raw_delete(using)
+
+
+class ArchivePolicy:
+    def __init__(self, model, archive_model, fields, cold_filter, setting, default_days):
+        self.model = model
+        self.archive_model = archive_model
+        self.fields = fields
+        self.cold_filter = cold_filter
+        self.setting = setting
+        self.default_days = default_days
+
+    @property
+    def name(self):
+        return self.model._meta.verbose_name_plural
+
+    def cutoff(self, now=None):
+        days = getattr(settings, self.setting, self.default_days)
+        return (now or timezone.now()) - timedelta(days=days)
+
+    def cold_rows(self, cutoff):
+        return self.model.objects.filter(self.cold_filter(cutoff))
+
+    def archive_batch(self, cutoff, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Archives one batch and returns the number of rows moved (0 when done).
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            rows = list(
+                self.cold_rows(cutoff).order_by('pk').values('pk', *self.fields)[:batch_size]
+            )
+            if not rows:
+                return 0
+            self.archive_model.objects.bulk_create([
+                self.archive_model(original_id=row['pk'], **{field: row[field] for field in self.fields})
+                for row in rows
+            ])
+            _remove(self.model, [row['pk'] for row in rows], using)
+            rows_archived.send(sender=self.model, rows=rows, using=using)
+        return len(rows)
+
+    def archive(self, cutoff=None, batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+        cutoff = cutoff or self.cutoff()
+        total = batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = self.archive_batch(cutoff, batch_size)
+            if not moved:
+                break
+            total += moved
+            batches += 1
+        return total
+
+
+POLICIES = [
+    ArchivePolicy(
+        Appointment,
+        ArchivedAppointment,
+        fields=['patient_id', 'doctor_id', 'series_id', 'date', 'time', 'status', 'appointment_notes',
+                'duration_minutes', 'is_virtual', 'location', 'created_at', 'updated_at'],
+        cold_filter=lambda cutoff: Q(status__in=['Completed', 'Canceled'], date__lt=cutoff.date()),
+        setting='ARCHIVE_APPOINTMENTS_AFTER_DAYS',
+        default_days=90,
+    ),
+    ArchivePolicy(
+        MedicalRecord,
+        ArchivedMedicalRecord,
+        fields=['patient_id', 'doctor_id', 'diagnosis', 'treatment_plan', 'medications', 'allergies',
+                'created_at', 'updated_at'],
+        cold_filter=lambda cutoff: Q(updated_at__lt=cutoff),
+        setting='ARCHIVE_CLINICAL_RECORDS_AFTER_DAYS',
+        default_days=730,
+    ),
+    ArchivePolicy(
+        Prescription,
+        ArchivedPrescription,
+        fields=['patient_id', 'doctor_id', 'medication_name', 'dosage_instructions', 'medicines',
+                'created_at', 'updated_at'],
+        cold_filter=lambda cutoff: Q(updated_at__lt=cutoff),
+        setting='ARCHIVE_CLINICAL_RECORDS_AFTER_DAYS',
+        default_days=730,
+    ),
+]
+
+
+def wants_archived(request):
+    return request.GET.get('include_archived') in ('1', 'true', 'yes')
+
+
+def with_archived(hot, archived, order_by):
+    """
+    Combines a hot queryset with the matching archive queryset, newest first by
+    `order_by`. Only used on the explicit "include archived" path.
+    """
+    rows = list(hot) + list(archived)
+    rows.sort(key=lambda row: getattr(row, order_by), reverse=True)
+    return rows
@@ -0,0 +1,177 @@
+"""
+Medical record attachments: streaming uploads, content-addressed storage and
+range-capable downloads.
+
+Uploads are written to a temporary file chunk by chunk while their SHA-256 is
+computed (HashingUploadHandler), so no file is ever held in memory. The temporary
+file is then moved to ATTACHMENT_ROOT/ab/cd/<sha256>; a file whose content is
+already stored is not written again. Thumbnails are made later by
+`manage.py process_attachments`.
+"""
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date
+
+from .models import AttachmentBlob
+
+THUMBNAIL_SIZE = (256, 256)
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/tiff')
+ALLOWED_TYPES = IMAGE_TYPES + ('application/pdf',)
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def attachment_root():
+    return getattr(settings, 'ATTACHMENT_ROOT', os.path.join(settings.BASE_DIR, 'attachments'))
+
+
+def blob_path(sha256):
+    return os.path.join(attachment_root(), sha256[:2], sha256[2:4], sha256)
+
+
+def thumbnail_path(sha256):
+    return os.path.join(attachment_root(), 'thumbnails', sha256[:2], f'{sha256}.jpg')
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams each uploaded file to a temporary file and sets `sha256` on it.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.hasher.hexdigest()
+        return uploaded
+
+
+def store(uploaded):
+    """
+    Returns the blob for a file received through HashingUploadHandler, moving the
+    temporary file into place unless identical content is already stored.
+    """
+    path = blob_path(uploaded.sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            file_move_safe(uploaded.temporary_file_path(), path, allow_overwrite=False)
+        except FileExistsError:
+            pass  # Stored concurrently by another upload of the same content.
+    blob, _ = AttachmentBlob.objects.get_or_create(
+        sha256=uploaded.sha256,
+        defaults={'size': uploaded.size, 'content_type': uploaded.content_type},
+    )
+    return blob
+
+
+class _FileRange:
+    """
+    File-like view of `length` bytes of `file` starting at `start`, for FileResponse.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) inclusive for a single satisfiable 'bytes=' range, None
+    for no or an unsupported range (serve the whole file) and False if unsatisfiable.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def serve_file(request, path, content_type, filename, etag, as_attachment=False):
+    """
+    FileResponse with a strong ETag and single-range (206) support.
+    """
+    size = os.path.getsize(path)
+    if_range = request.headers.get('If-Range')
+    byte_range = None
+    if not if_range or if_range == etag:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(_FileRange(file, start, end - start + 1), status=206,
+                                content_type=content_type, filename=filename, as_attachment=as_attachment)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(file, content_type=content_type, filename=filename, as_attachment=as_attachment)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(os.path.getmtime(path))
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def make_thumbnail(blob):
+    """
+    Renders the thumbnail of an image blob; returns the new thumbnail status.
+    """
+    if blob.content_type not in IMAGE_TYPES:
+        return 'Unsupported'
+    from PIL import Image
+
+    target = thumbnail_path(blob.sha256)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        with Image.open(blob_path(blob.sha256)) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            image.convert('RGB').save(target, 'JPEG', quality=80)
+    except (OSError, Image.DecompressionBombError):
+        return 'Failed'
+    return 'Done'
+
+
+def process_pending(limit=100):
+    """
+    Makes thumbnails for up to `limit` pending blobs; returns how many were processed.
+    """
+    blobs = list(AttachmentBlob.objects.filter(thumbnail_status='Pending').order_by('id')[:limit])
+    for blob in blobs:
+        blob.thumbnail_status = make_thumbnail(blob)
+        # save() rather than update(): its post_save copies the status to the branch databases.
+        blob.save(update_fields=['thumbnail_status'])
+    return len(blobs)
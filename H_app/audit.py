@@ -0,0 +1,129 @@
+"""
+Write-behind audit log of clinical record reads.
+
+`audit_access` appends an AccessLogEntry to a per-process buffer instead of
+inserting it during the request. The buffer is written with one bulk_create once it
+holds AUDIT_LOG_BUFFER_SIZE entries, by a background thread every
+AUDIT_LOG_FLUSH_INTERVAL seconds, and at interpreter shutdown. A flush that fails
+with an OperationalError (database locked or unreachable) keeps the entries for the
+next attempt, up to AUDIT_LOG_MAX_PENDING entries. Any other database error means
+some entries cannot be written at all, e.g. because their user was deleted in the
+meantime: the batch is then written one entry at a time, and the entries that fail
+are logged and dropped so that they do not block the ones after them.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, OperationalError, connections, transaction
+
+from .models import AccessLogEntry
+from .ratelimit import client_ip
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    def __init__(self, size=None, interval=None, max_pending=None):
+        self.size = size or getattr(settings, 'AUDIT_LOG_BUFFER_SIZE', 100)
+        self.interval = interval or getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 5)
+        self.max_pending = max_pending or getattr(settings, 'AUDIT_LOG_MAX_PENDING', 10000)
+        self.lock = threading.Lock()
+        self.entries = []
+        self.flusher_pid = None
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+            full = len(self.entries) >= self.size
+        self._ensure_flusher()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered entries; returns how many were written.
+        """
+        with self.lock:
+            entries, self.entries = self.entries, []
+        if not entries:
+            return 0
+        try:
+            AccessLogEntry.objects.bulk_create(entries)
+        except OperationalError:
+            logger.exception("Could not write %d access log entries", len(entries))
+            with self.lock:
+                self.entries = (entries + self.entries)[-self.max_pending:]
+            return 0
+        except DatabaseError:
+            return self._write_each(entries)
+        return len(entries)
+
+    def _write_each(self, entries):
+        written = 0
+        for index, entry in enumerate(entries):
+            try:
+                with transaction.atomic():
+                    AccessLogEntry.objects.bulk_create([entry])
+            except OperationalError:
+                logger.exception("Could not write access log entries")
+                with self.lock:
+                    self.entries = (entries[index:] + self.entries)[-self.max_pending:]
+                return written
+            except DatabaseError:
+                logger.exception(
+                    "Dropped access log entry: user %s read %s of patient %s at %s",
+                    entry.user_id, entry.view_name, entry.patient_id, entry.accessed_at,
+                )
+            else:
+                written += 1
+        return written
+
+    def _ensure_flusher(self):
+        # Started lazily and once per process: threads do not survive a fork, so
+        # pre-forking servers get one flusher per worker.
+        if self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name='audit-log-flusher', daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+            connections.close_all()
+
+
+buffer = AuditBuffer()
+atexit.register(buffer.flush)
+
+
+def record_access(request, view_name, patient_id):
+    user = request.user if request.user.is_authenticated else None
+    buffer.add(AccessLogEntry(
+        user=user,
+        patient_id=patient_id,
+        view_name=view_name,
+        path=request.get_full_path()[:255],
+        ip_address=client_ip(request) or None,
+    ))
+
+
+def audit_access(view_func):
+    """
+    Logs successful reads by views taking a `patient_id` argument.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200:
+            record_access(request, view_func.__name__, kwargs.get('patient_id'))
+        return response
+    return wrapper
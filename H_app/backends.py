@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+PROFILE_RELATIONS = ('patient_profile', 'doctor_profile', 'admin_profile')
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    Loads the session user together with their patient, doctor and admin profiles
+    in one joined query. AuthenticationMiddleware memoizes the result on
+    `request.user`, so profile lookups in views cost no further queries, and a
+    missing profile is known without a query as well.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related(*PROFILE_RELATIONS).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,159 @@
+"""
+Helpers shared by the benchmark and load-test management commands.
+"""
+import http.cookiejar
+import os
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+
+@contextmanager
+def scratch_database(verbosity=0, on_disk=False):
+    """
+    Runs the block against freshly created test databases so benchmarks can seed
+    as much data as they like without touching the configured ones.
+
+    SQLite test databases live in a shared-cache in-memory database, which locks
+    whole tables between threads; pass on_disk=True when a live server writes
+    from several threads at once.
+    """
+    temp_dir = tempfile.TemporaryDirectory() if on_disk else None
+    if temp_dir:
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'].endswith('sqlite3'):
+                settings_dict['TEST']['NAME'] = os.path.join(temp_dir.name, f'{alias}.sqlite3')
+    setup_test_environment()
+    old_config = setup_databases(verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity)
+        teardown_test_environment()
+        if temp_dir:
+            temp_dir.cleanup()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """
+    Latencies in seconds -> dict of count and mean/p50/p95/p99 in milliseconds.
+    """
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'mean': statistics.fmean(values) * 1000 if values else 0.0,
+        'p50': percentile(values, 50) * 1000,
+        'p95': percentile(values, 95) * 1000,
+        'p99': percentile(values, 99) * 1000,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label:<28} n={summary['count']:<6} mean={summary['mean']:8.1f}ms "
+        f"p50={summary['p50']:8.1f}ms p95={summary['p95']:8.1f}ms p99={summary['p99']:8.1f}ms"
+    )
+
+
+@contextmanager
+def live_server(host='127.0.0.1', port=0):
+    """
+    Serves the project's WSGI application from a background thread, one thread per
+    request, and yields its base URL.
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer((host, port), QuietRequestHandler, allow_reuse_address=False)
+    server.daemon_threads = True
+    server.set_app(WSGIHandler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+HttpResult = namedtuple('HttpResult', ['status', 'body', 'elapsed', 'headers'])
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpSession:
+    """
+    Minimal cookie-keeping HTTP client that speaks Django's CSRF protocol, so load
+    tests exercise the same middleware stack as a browser.
+    """
+
+    def __init__(self, base_url, timeout=30, headers=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect()
+        )
+
+    def cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return None
+
+    def request(self, method, path, data=None, headers=None):
+        """
+        Returns an HttpResult; redirects and HTTP errors are returned, not followed or raised.
+        """
+        url = path if path.startswith('http') else self.base_url + path
+        headers = {**self.headers, **(headers or {})}
+        body = None
+        if method == 'POST':
+            data = dict(data or {})
+            token = self.cookie('csrftoken')
+            if token:
+                data.setdefault('csrfmiddlewaretoken', token)
+                headers.setdefault('X-CSRFToken', token)
+            headers.setdefault('Referer', url)
+            body = urllib.parse.urlencode(data, doseq=True).encode()
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, content, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as error:
+            status, content, response_headers = error.code, error.read(), error.headers
+        return HttpResult(status, content, time.perf_counter() - started, response_headers)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, data=None, **kwargs):
+        return self.request('POST', path, data, **kwargs)
@@ -0,0 +1,276 @@
+"""
+Hospital branches, each with its own database for clinical rows.
+
+settings.HOSPITAL_BRANCHES maps a branch key to its database alias and to the
+Facility.location values it covers, e.g.
+
+    HOSPITAL_BRANCHES = {
+        'north': {'name': 'North Campus', 'database': 'north', 'locations': ['North Campus']},
+    }
+
+Every user belongs to one branch (CustomUser.branch; blank is the main branch,
+which lives in the 'default' database). Admins are assigned the branch of the
+facilities of their AdminProfile.department. BranchMiddleware selects the user's
+branch database for the request and BranchRouter sends the SHARDED_MODELS there;
+everything else stays in 'default'.
+
+The DIRECTORY_MODELS (users, profiles, specializations, attachment blobs) are
+shared: they are read from and written to 'default' only, and each write is
+copied to every branch database so that clinical rows there keep their foreign
+keys and joins. `manage.py sync_branch_directories` copies them in bulk, for a
+new branch database or after bulk imports, which send no signals.
+
+Reports across branches use `fan_out`, which queries every branch database in
+parallel.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+MAIN_BRANCH = ''
+
+SHARDED_MODELS = {
+    'appointment', 'appointmentseries', 'appointmentreminder', 'waitlistentry',
+    'medicalrecord', 'medicalrecordattachment', 'prescription', 'billing',
+    'archivedappointment', 'archivedmedicalrecord', 'archivedprescription', 'changelogentry',
+}
+
+DIRECTORY_MODELS = {'customuser', 'patientprofile', 'doctorprofile', 'specialization', 'attachmentblob'}
+
+_database = ContextVar('branch_database', default=DEFAULT_DB_ALIAS)
+
+
+def get_branches():
+    return getattr(settings, 'HOSPITAL_BRANCHES', {})
+
+
+def branch_choices():
+    return [(MAIN_BRANCH, 'Main hospital')] + [
+        (key, config.get('name', key)) for key, config in get_branches().items()
+    ]
+
+
+def database_for(branch):
+    config = get_branches().get(branch)
+    return config['database'] if config else DEFAULT_DB_ALIAS
+
+
+def databases():
+    """
+    Every database holding clinical rows, 'default' first.
+    """
+    aliases = [DEFAULT_DB_ALIAS]
+    for config in get_branches().values():
+        if config['database'] not in aliases:
+            aliases.append(config['database'])
+    return aliases
+
+
+def branch_databases():
+    return databases()[1:]
+
+
+def branches_in(database):
+    """
+    Keys of the branches stored in `database`.
+    """
+    keys = [key for key, config in get_branches().items() if config['database'] == database]
+    if database == DEFAULT_DB_ALIAS:
+        keys.append(MAIN_BRANCH)
+    return keys
+
+
+def doctors():
+    """
+    Doctors a patient of the current branch can book.
+    """
+    from .models import DoctorProfile
+
+    doctors = DoctorProfile.objects.filter(user__is_active=True).select_related('user', 'specialization')
+    if get_branches():
+        doctors = doctors.filter(user__branch__in=branches_in(current_database()))
+    return doctors
+
+
+def branch_for_location(location):
+    location = (location or '').strip().lower()
+    for key, config in get_branches().items():
+        if location in (name.lower() for name in config.get('locations', ())):
+            return key
+    return None
+
+
+def branch_for_department(department):
+    """
+    The branch whose facilities host `department`, or None.
+    """
+    from .models import Facility
+
+    locations = Facility.objects.filter(department__iexact=department).values_list('location', flat=True)
+    for location in locations:
+        branch = branch_for_location(location)
+        if branch is not None:
+            return branch
+    return None
+
+
+def current_database():
+    return _database.get()
+
+
+@contextmanager
+def use_database(alias):
+    token = _database.set(alias)
+    try:
+        yield
+    finally:
+        _database.reset(token)
+
+
+def use_branch(branch):
+    return use_database(database_for(branch))
+
+
+class BranchMiddleware:
+    """
+    Routes the request's clinical queries to the database of the user's branch.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        branch = request.user.branch if request.user.is_authenticated else MAIN_BRANCH
+        with use_branch(branch):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        with use_branch(user.branch if user.is_authenticated else MAIN_BRANCH):
+            return await self.get_response(request)
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'H_app' and model._meta.model_name in SHARDED_MODELS
+
+
+def is_directory(model):
+    return model._meta.app_label == 'H_app' and model._meta.model_name in DIRECTORY_MODELS
+
+
+class BranchRouter:
+    def db_for_read(self, model, **hints):
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        # Follow relations between clinical rows into the database they came from.
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(instance) and instance._state.db:
+            return instance._state.db
+        return current_database()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Directory rows are copied to every branch database.
+        if is_directory(obj1) or is_directory(obj2):
+            return True
+        return None
+
+
+def _copy(model, pk, values, alias):
+    rows = model._base_manager.using(alias).filter(pk=pk)
+    if not rows.update(**values):
+        model._base_manager.using(alias).bulk_create([model(pk=pk, **values)])
+
+
+def replicate(instance):
+    """
+    Copies a saved directory row to every branch database once the write commits.
+    """
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields if not field.primary_key
+    }
+    pk = instance.pk
+
+    def copy():
+        for alias in branch_databases():
+            _copy(model, pk, values, alias)
+
+    transaction.on_commit(copy, using=DEFAULT_DB_ALIAS)
+
+
+def replicate_delete(instance):
+    """
+    Deletes a directory row from every branch database. Deleting it there also
+    cascades to that branch's clinical rows, as the delete in 'default' did.
+    """
+    model = type(instance)
+    pk = instance.pk
+
+    def delete():
+        for alias in branch_databases():
+            model._base_manager.using(alias).filter(pk=pk).delete()
+
+    transaction.on_commit(delete, using=DEFAULT_DB_ALIAS)
+
+
+def sync_directories(alias, batch_size=1000):
+    """
+    Copies every directory table from 'default' into `alias`; returns rows copied.
+    """
+    from django.apps import apps
+
+    copied = 0
+    # Parents before children, so foreign keys are satisfied.
+    for model_name in ('customuser', 'specialization', 'patientprofile', 'doctorprofile', 'attachmentblob'):
+        model = apps.get_model('H_app', model_name)
+        fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+        rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk').values_list('pk', *fields)
+        with transaction.atomic(using=alias):
+            existing = set(model._base_manager.using(alias).values_list('pk', flat=True))
+            batch = []
+            for pk, *values in rows.iterator(chunk_size=batch_size):
+                values = dict(zip(fields, values))
+                if pk in existing:
+                    model._base_manager.using(alias).filter(pk=pk).update(**values)
+                else:
+                    batch.append(model(pk=pk, **values))
+                if len(batch) == batch_size:
+                    model._base_manager.using(alias).bulk_create(batch)
+                    batch = []
+                copied += 1
+            model._base_manager.using(alias).bulk_create(batch)
+    return copied
+
+
+def fan_out(function, aliases=None):
+    """
+    Calls function(alias) for every branch database in parallel, each inside
+    use_database(alias); returns {alias: result} in databases() order.
+    """
+    aliases = aliases or databases()
+
+    def run(alias):
+        try:
+            with use_database(alias):
+                return function(alias)
+        finally:
+            connections.close_all()
+
+    if len(aliases) == 1:
+        with use_database(aliases[0]):
+            return {aliases[0]: function(aliases[0])}
+    with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+        return dict(zip(aliases, executor.map(run, aliases)))
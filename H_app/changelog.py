@@ -0,0 +1,209 @@
+"""
+Append-only log of changes to the rows offline clients keep, read by the delta
+sync API (sync.py).
+
+Every create, update, delete and archive of a logged model appends a
+ChangeLogEntry holding the row's id and the patient and doctor it belongs to,
+which is all the sync API needs to tell whom a change concerns. Entries carry no data: a client
+is sent the row as it is when it syncs, so any number of changes to one row
+cost one row.
+
+`log()` connects the signals; ChangeLogQuerySet covers update(), bulk_update()
+(built on update()) and bulk_create(), which send no signals. QuerySet.delete()
+does send post_delete for every row. Archiving sends no delete signals; its
+batches are logged by `archived()`. A change that moves a row to another
+patient or doctor is logged under the previous owners as well, so that their
+clients learn the row is gone.
+
+Entries of clinical rows are written to the database of the row, inside its
+transaction. Entries of directory rows (patient profiles) are written to every
+database, as the rows themselves are (branches.replicate), so each branch
+database holds a complete log for its users. Entry ids are the sync cursor:
+SQLite serializes writers, so they become visible in increasing order.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from .branches import branch_databases, is_directory
+from .versioned_cache import VersionedQuerySet
+
+DEFAULT_RETENTION_DAYS = 30
+PRUNE_BATCH_SIZE = 5000
+
+_logged = {}
+
+
+class Logging:
+    def __init__(self, model, patient, doctor):
+        self.model = model
+        self.name = model._meta.model_name
+        self.owners = tuple(owner for owner in (patient, doctor) if owner)
+        self.attnames = tuple(model._meta.get_field(owner).attname for owner in self.owners)
+
+    def owners_of(self, instance):
+        return tuple(getattr(instance, attname) for attname in self.attnames)
+
+
+def _entries(logging, action, rows):
+    from .models import ChangeLogEntry
+
+    return [
+        ChangeLogEntry(
+            model=logging.name, object_id=pk, action=action,
+            patient_id=owners[0], doctor_id=owners[1] if len(owners) > 1 else None,
+        )
+        for pk, *owners in rows
+    ]
+
+
+def _write(entries, using):
+    from .models import ChangeLogEntry
+
+    ChangeLogEntry.objects.using(using).bulk_create(entries)
+
+
+def record(model, action, rows, using):
+    """
+    Logs `action` ('create', 'update', 'delete' or 'archive') for rows of (pk, *owner ids),
+    as read with values_list('pk', *Logging.attnames).
+    """
+    logging = _logged[model]
+    rows = list(rows)
+    if not rows:
+        return
+    if not is_directory(model):
+        _write(_entries(logging, action, rows), using)
+        return
+    # Deleting the copies in branch databases (branches.replicate_delete) comes through here too.
+    if using != DEFAULT_DB_ALIAS:
+        return
+    _write(_entries(logging, action, rows), DEFAULT_DB_ALIAS)
+    for alias in branch_databases():
+        transaction.on_commit(lambda alias=alias: _write(_entries(logging, action, rows), alias), using=using)
+
+
+def archived(model, rows, using):
+    """
+    Logs 'archive' for rows moved to the archive tables, given as dicts holding
+    'pk' and the owners' attnames (see archive.py).
+    """
+    logging = _logged.get(model)
+    if logging is not None:
+        record(model, 'archive', [(row['pk'], *(row[attname] for attname in logging.attnames)) for row in rows], using)
+
+
+def _remember_owners(sender, instance, using, update_fields=None, **kwargs):
+    logging = _logged[sender]
+    instance._logged_owners = None
+    if update_fields is not None and not set(update_fields) & {*logging.owners, *logging.attnames}:
+        return
+    if instance.pk is not None and not instance._state.adding:
+        instance._logged_owners = (
+            sender._base_manager.using(using).filter(pk=instance.pk).values_list(*logging.attnames).first()
+        )
+
+
+def _saved(sender, instance, using, created, raw=False, **kwargs):
+    if raw:
+        return
+    logging = _logged[sender]
+    owners = logging.owners_of(instance)
+    rows = [(instance.pk, *owners)]
+    previous = getattr(instance, '_logged_owners', None)
+    if previous and previous != owners:
+        rows.append((instance.pk, *previous))
+    record(sender, 'create' if created else 'update', rows, using)
+
+
+def _deleted(sender, instance, using, **kwargs):
+    record(sender, 'delete', [(instance.pk, *_logged[sender].owners_of(instance))], using)
+
+
+def log(model, patient='patient', doctor='doctor'):
+    """
+    Logs every change to `model`, whose foreign keys `patient` (to the user) and
+    `doctor` (to the DoctorProfile, or None) decide who is told about it.
+    """
+    _logged[model] = Logging(model, patient, doctor)
+    uid = f'changelog:{model._meta.label_lower}'
+    pre_save.connect(_remember_owners, sender=model, dispatch_uid=uid)
+    post_save.connect(_saved, sender=model, dispatch_uid=uid)
+    post_delete.connect(_deleted, sender=model, dispatch_uid=uid)
+
+
+def _assigned(logging, kwargs):
+    """
+    The owner ids an update() sets, by attname; owners it leaves alone are missing.
+    """
+    assigned = {}
+    for owner, attname in zip(logging.owners, logging.attnames):
+        if attname in kwargs:
+            assigned[attname] = kwargs[attname]
+        elif owner in kwargs:
+            value = kwargs[owner]
+            assigned[attname] = getattr(value, 'pk', value)
+    return assigned
+
+
+class ChangeLogQuerySet(VersionedQuerySet):
+    """
+    Logs bulk writes on logged models.
+    """
+
+    def update(self, **kwargs):
+        logging = _logged.get(self.model)
+        if logging is None:
+            return super().update(**kwargs)
+        assigned = _assigned(logging, kwargs)
+        with transaction.atomic(using=self.db):
+            before = list(self.order_by().values_list('pk', *logging.attnames))
+            rows = super().update(**kwargs)
+            after = [
+                (pk, *(assigned.get(attname, owner) for attname, owner in zip(logging.attnames, owners)))
+                for pk, *owners in before
+            ]
+            record(self.model, 'update', set(before) | set(after), self.db)
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        logging = _logged.get(self.model)
+        if logging is None:
+            return super().bulk_create(objs, *args, **kwargs)
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            created = [(obj.pk, *logging.owners_of(obj)) for obj in objs if obj.pk is not None]
+            record(self.model, 'create', created, self.db)
+        return objs
+
+
+def retention_cutoff(now=None):
+    days = getattr(settings, 'CHANGE_LOG_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def prune(cutoff, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Deletes the entries of the current database older than `cutoff`, in batches;
+    returns how many. The newest entry is kept, as it tells cursors from before
+    the pruning apart from current ones.
+    """
+    from .models import ChangeLogEntry
+
+    newest = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+    if newest is None:
+        return 0
+    removed = 0
+    while True:
+        ids = list(
+            ChangeLogEntry.objects.filter(changed_at__lt=cutoff, id__lt=newest)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += ChangeLogEntry.objects.filter(id__range=(ids[0], ids[-1]), changed_at__lt=cutoff).delete()[0]
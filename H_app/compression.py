@@ -0,0 +1,211 @@
+"""
+Response compression: brotli when the client accepts it and the optional
+`brotli` package is installed, gzip otherwise.
+
+Compared with django.middleware.gzip.GZipMiddleware, CompressionMiddleware
+- compresses only text-like content types (HTML, JSON, iCalendar, ...), not
+  images, PDFs or archives, which are compressed already;
+- compresses a streaming response, sync or async, with one compressor for the
+  whole stream, sending output as the compressor produces it instead of
+  buffering the body. Server-sent events are flushed after every event, so
+  that none waits in the compressor;
+- leaves alone bodies under MIN_LENGTH bytes, which fit in one packet anyway,
+  partial content and responses offering byte ranges, whose ranges refer to
+  the uncompressed bytes.
+
+A compressed response gets a weak ETag, since its bytes differ from the
+uncompressed ones. If-None-Match compares ETags weakly, so the views' 304s
+keep working. Responses that must keep their bytes and strong ETag, such as
+printed prescriptions, are sent with Cache-Control: no-transform and left alone.
+
+As in GZipMiddleware, gzip output carries a random-length file name in its
+header, which blurs the compressed length that BREACH-style attacks measure.
+Brotli has no such field, so pages carrying a CSRF token are compressed only
+with gzip, or not at all for clients that do not accept it. This makes length
+guessing harder; it does not make it impossible.
+"""
+import io
+import re
+import secrets
+from gzip import GzipFile
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_LENGTH = 1024
+GZIP_LEVEL = 6
+# Quality 11 is meant for static files. At 5, pages come out at less than half
+# of gzip's size, in less time than gzip takes.
+BROTLI_QUALITY = 5
+MAX_RANDOM_BYTES = 100
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+CODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+class GzipEncoder:
+    coding = 'gzip'
+    padded = True
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        filename = 'x' * (1 + secrets.randbelow(MAX_RANDOM_BYTES))
+        self.file = GzipFile(filename=filename, mode='wb', compresslevel=GZIP_LEVEL, fileobj=self.buffer, mtime=0)
+
+    def _take(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def compress(self, data):
+        self.file.write(data)
+        return self._take()
+
+    def flush(self):
+        self.file.flush()
+        return self._take()
+
+    def finish(self):
+        self.file.close()
+        return self._take()
+
+
+class BrotliEncoder:
+    coding = 'br'
+    padded = False
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+ENCODERS = [BrotliEncoder, GzipEncoder] if brotli is not None else [GzipEncoder]
+
+
+def accepted_codings(header):
+    """
+    {coding: q} from an Accept-Encoding header.
+    """
+    codings = {}
+    for part in header.split(','):
+        match = CODING_RE.match(part)
+        if match:
+            try:
+                codings[match[1].lower()] = float(match[2]) if match[2] else 1.0
+            except ValueError:
+                continue
+    return codings
+
+
+def negotiate(header, padded=False):
+    """
+    The encoder class to use for an Accept-Encoding header, or None. Among codings
+    of equal q, brotli wins. padded=True allows only encoders randomizing the length.
+    """
+    codings = accepted_codings(header)
+    best, best_q = None, 0.0
+    for encoder in ENCODERS:
+        if padded and not encoder.padded:
+            continue
+        q = codings.get(encoder.coding, codings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoder, q
+    return best
+
+
+def compress_sequence(chunks, encoder, flush_each=False):
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        if flush_each:
+            data += encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def acompress_sequence(chunks, encoder, flush_each=False):
+    async for chunk in chunks:
+        data = encoder.compress(chunk)
+        if flush_each:
+            data += encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def media_type(response):
+    return response.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+def carries_csrf_token(request, response):
+    """
+    Whether the page was rendered with a CSRF token. CsrfViewMiddleware, further
+    down the stack, then (re)sets the cookie and clears the request's flag.
+    """
+    return bool(request.META.get('CSRF_COOKIE_NEEDS_UPDATE')) or settings.CSRF_COOKIE_NAME in response.cookies
+
+
+def is_compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.has_header('Content-Encoding') or response.get('Accept-Ranges') == 'bytes':
+        return False
+    if 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = media_type(response)
+    if not (content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES):
+        return False
+    if response.streaming:
+        length = response.get('Content-Length')
+        return not (length and length.isdigit() and int(length) < MIN_LENGTH)
+    return len(response.content) >= MIN_LENGTH
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoder_class = negotiate(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), padded=carries_csrf_token(request, response)
+        )
+        if encoder_class is None:
+            return response
+        encoder = encoder_class()
+
+        if response.streaming:
+            flush_each = media_type(response) == 'text/event-stream'
+            compress = acompress_sequence if response.is_async else compress_sequence
+            response.streaming_content = compress(response.streaming_content, encoder, flush_each)
+            # The compressed length is not known until the stream ends.
+            del response.headers['Content-Length']
+        else:
+            compressed = encoder.compress(response.content) + encoder.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoder.coding
+        return response
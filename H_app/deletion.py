@@ -0,0 +1,255 @@
+"""
+Background removal of user accounts.
+
+Deleting a user cascades through every appointment, record and prescription that
+references them in one transaction, which keeps SQLite locked for as long as it
+runs. `start_deletion` instead deactivates the account at once (an inactive user
+can no longer log in, their session stops authenticating and a doctor disappears
+from booking) and queues a DeletionJob. `manage.py process_deletion_jobs` then
+works through STEPS: each step removes the rows referencing the user from one
+table, in batches of `batch_size` rows with a transaction per batch, in every
+database holding that table. Once nothing references the user any more, the
+account and its profiles are deleted.
+
+A doctor's clinical rows can be handed to another doctor instead (`reassign_to`).
+Access log entries are audit records and are kept with the user cleared, as the
+SET_NULL foreign keys would have done.
+
+A job records its step and row counts as it goes. Steps only look at the rows
+still left, so an interrupted job just starts over; one whose worker has been
+silent for STALE_AFTER is picked up again by the next worker.
+"""
+from datetime import date, timedelta
+
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import agenda
+from .branches import databases, is_sharded, use_database
+from .live import appointments_changed
+from .models import (
+    AccessLogEntry, Appointment, AppointmentSeries, ArchivedAppointment, ArchivedMedicalRecord,
+    ArchivedPrescription, Billing, DeletionJob, DoctorProfile, MedicalRecord, MedicalRecordAttachment,
+    Payment, Prescription, UserSearchTerm, WaitlistEntry,
+)
+
+DEFAULT_BATCH_SIZE = 200
+STALE_AFTER = timedelta(minutes=10)
+ACTIVE_STATUSES = ('Pending', 'Running')
+
+# Records and prescriptions are flagged on the agendas of their doctor.
+FLAGGED = (MedicalRecord, Prescription)
+
+
+class DeletionStep:
+    """
+    Rows of `model` whose `lookup` is the user (owner='user') or their doctor
+    profile (owner='doctor'). `action` is 'delete', 'detach' (set the foreign key
+    to NULL) or 'reassign' (move to the replacement doctor if there is one,
+    otherwise delete). Steps with keep_when_reassigning=True are skipped when a
+    replacement takes the doctor's rows, as their rows follow those.
+    """
+
+    def __init__(self, model, lookup, owner='user', action='delete', keep_when_reassigning=False):
+        self.model = model
+        self.lookup = lookup
+        self.owner = owner
+        self.action = action
+        self.keep_when_reassigning = keep_when_reassigning
+
+    @property
+    def label(self):
+        return f"{self.model._meta.verbose_name} rows ({self.lookup.replace('__', ' ')})"
+
+    def databases(self):
+        return databases() if is_sharded(self.model) else [DEFAULT_DB_ALIAS]
+
+    def target(self, job, doctor_id):
+        return job.user_id if self.owner == 'user' else doctor_id
+
+    def applies(self, job, doctor_id):
+        if self.target(job, doctor_id) is None:
+            return False
+        return not (self.keep_when_reassigning and job.reassign_to_id)
+
+    def rows(self, target):
+        return self.model.objects.filter(**{self.lookup: target})
+
+    def run_batch(self, job, target, batch_size):
+        """
+        Removes one batch in the current database; returns the rows handled (0 when done).
+        """
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            pks = list(self.rows(target).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return 0
+            batch = self.model.objects.filter(pk__in=pks)
+            if self.action == 'detach':
+                batch.update(**{self.lookup: None})
+            elif self.action == 'reassign' and job.reassign_to_id:
+                self.reassign(batch, target, job.reassign_to_id)
+            else:
+                batch.delete()
+        return len(pks)
+
+    def reassign(self, batch, doctor_id, replacement_id):
+        # update() sends no signals, so agendas are invalidated and the live board told here.
+        if self.model is Appointment:
+            days = list(batch.values_list('date', flat=True))
+            if date.today() in days:
+                appointments_changed(batch.filter(date=date.today()).values_list('pk', flat=True), batch.db)
+            batch.update(doctor_id=replacement_id)
+            agenda.invalidate(doctor_id, days)
+            agenda.invalidate(replacement_id, days)
+            return
+        patient_ids = set(batch.values_list('patient_id', flat=True)) if self.model in FLAGGED else ()
+        batch.update(doctor_id=replacement_id)
+        for patient_id in patient_ids:
+            agenda.invalidate_for_patient(replacement_id, patient_id)
+
+
+class ArchivedAttachmentStep(DeletionStep):
+    """
+    Attachments of archived records, which reference the record by its original id.
+    """
+
+    def rows(self, target):
+        return self.model.objects.filter(
+            record_id__in=ArchivedMedicalRecord.objects.filter(**{self.lookup: target}).values('original_id')
+        )
+
+
+STEPS = [
+    # The doctor's waitlist goes first, so that their deleted appointments offer no slots.
+    DeletionStep(WaitlistEntry, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(MedicalRecordAttachment, 'record__doctor', owner='doctor', keep_when_reassigning=True),
+    ArchivedAttachmentStep(MedicalRecordAttachment, 'doctor', owner='doctor', keep_when_reassigning=True),
+    DeletionStep(Appointment, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(AppointmentSeries, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(MedicalRecord, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(Prescription, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(ArchivedAppointment, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(ArchivedMedicalRecord, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(ArchivedPrescription, 'doctor', owner='doctor', action='reassign'),
+    DeletionStep(WaitlistEntry, 'patient'),
+    DeletionStep(MedicalRecordAttachment, 'record__patient'),
+    ArchivedAttachmentStep(MedicalRecordAttachment, 'patient'),
+    DeletionStep(MedicalRecordAttachment, 'uploaded_by', action='detach'),
+    DeletionStep(Appointment, 'patient'),
+    DeletionStep(AppointmentSeries, 'patient'),
+    DeletionStep(MedicalRecord, 'patient'),
+    DeletionStep(Prescription, 'patient'),
+    DeletionStep(Billing, 'patient'),
+    DeletionStep(ArchivedAppointment, 'patient'),
+    DeletionStep(ArchivedMedicalRecord, 'patient'),
+    DeletionStep(ArchivedPrescription, 'patient'),
+    DeletionStep(Payment, 'appointment'),
+    DeletionStep(UserSearchTerm, 'user'),
+    DeletionStep(AccessLogEntry, 'user', action='detach'),
+    DeletionStep(AccessLogEntry, 'patient', action='detach'),
+]
+
+
+def start_deletion(user, requested_by=None, reassign_to=None):
+    """
+    Deactivates `user` and queues their removal; returns the DeletionJob. A user
+    already queued keeps their existing job.
+    """
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        job = DeletionJob.objects.filter(user=user, status__in=ACTIVE_STATUSES).first()
+        if job is not None:
+            return job
+        if user.is_active:
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+        return DeletionJob.objects.create(
+            user=user, username=user.get_username(), requested_by=requested_by, reassign_to=reassign_to
+        )
+
+
+def claimable(now):
+    return Q(status='Pending') | Q(status='Running', updated_at__lt=now - STALE_AFTER)
+
+
+def claim(job):
+    """
+    Takes a pending job, or a running one whose worker has gone silent; returns
+    True if this call got it.
+    """
+    now = timezone.now()
+    claimed = DeletionJob.objects.filter(pk=job.pk).filter(claimable(now)).update(
+        status='Running', updated_at=now, started_at=job.started_at or now
+    )
+    return bool(claimed)
+
+
+def _doctor_id(job):
+    return DoctorProfile.objects.filter(user_id=job.user_id).values_list('pk', flat=True).first()
+
+
+def _steps(job, doctor_id):
+    for step in STEPS:
+        if step.applies(job, doctor_id):
+            for alias in step.databases():
+                yield step, alias
+
+
+def count_rows(job, doctor_id):
+    total = 0
+    for step, alias in _steps(job, doctor_id):
+        with use_database(alias):
+            total += step.rows(step.target(job, doctor_id)).count()
+    return total
+
+
+def _record(job, **fields):
+    fields['updated_at'] = timezone.now()
+    DeletionJob.objects.filter(pk=job.pk).update(**fields)
+    job.refresh_from_db()
+
+
+def run(job, batch_size=DEFAULT_BATCH_SIZE, report=None):
+    """
+    Carries out a claimed job; a failure is recorded on the job, which then stays
+    Failed until an admin requeues it. `report(job)` is called after every step that found rows, and at the end.
+    """
+    doctor_id = _doctor_id(job)
+    try:
+        if not job.total_rows:
+            _record(job, total_rows=count_rows(job, doctor_id))
+        for step, alias in _steps(job, doctor_id):
+            _record(job, step=step.label)
+            target = step.target(job, doctor_id)
+            step_rows = 0
+            with use_database(alias):
+                while handled := step.run_batch(job, target, batch_size):
+                    _record(job, processed_rows=F('processed_rows') + handled)
+                    step_rows += handled
+            if step_rows and report is not None:
+                report(job)
+        _record(job, step="user account")
+        if job.user_id is not None:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                # Only the profiles are left to cascade to.
+                job.user.delete()
+    except Exception as error:
+        _record(job, status='Failed', error=f"{type(error).__name__}: {error}", finished_at=timezone.now())
+    else:
+        _record(job, status='Done', step='', finished_at=timezone.now())
+    if report is not None:
+        report(job)
+    return job
+
+
+def run_pending(batch_size=DEFAULT_BATCH_SIZE, report=None):
+    """
+    Runs every job that is waiting or was abandoned; returns how many were run.
+    """
+    count = 0
+    for job in DeletionJob.objects.filter(claimable(timezone.now())).order_by('created_at'):
+        if claim(job):
+            job.refresh_from_db()
+            run(job, batch_size, report)
+            count += 1
+    return count
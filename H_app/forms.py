@@ -1,11 +1,19 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from .branches import branch_choices, doctors, get_branches
 from .models import CustomUser
 
 class CustomUserSignupForm(UserCreationForm):
     class Meta:
         model = CustomUser
-        fields = ['username', 'password1', 'password2', 'user_type']
+        fields = ['username', 'password1', 'password2', 'user_type', 'branch']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if get_branches():
+            self.fields['branch'] = forms.ChoiceField(choices=branch_choices(), required=False, label='Hospital branch')
+        else:
+            del self.fields['branch']
 
 class CustomUserLoginForm(AuthenticationForm):
     pass
@@ -14,9 +22,11 @@ class CustomUserLoginForm(AuthenticationForm):
 #--------------------------------------------------------------------------------------------
 
 from django import forms
+from django.conf import settings
+from .attachments import ALLOWED_TYPES
 from .models import (
-    Appointment, MedicalRecord, Billing,
-    Facility, HealthEducationResource, Prescription, DoctorProfile, PatientProfile, Payment
+    Appointment, AppointmentSeries, MedicalRecord, Billing,
+    Facility, HealthEducationResource, Prescription, DoctorProfile, PatientProfile, Payment, WaitlistEntry
 )
 
 from django.contrib.auth import get_user_model
@@ -41,6 +51,7 @@ class AppointmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.logged_in_user = kwargs.pop('logged_in_user', None)  
         super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = doctors()
         if self.logged_in_user:
             self.fields['logged_in_user_name'] = forms.CharField(
                 initial=self.logged_in_user.get_full_name(),  
@@ -48,6 +59,70 @@ class AppointmentForm(forms.ModelForm):
                 label='Logged-in User'
             )
 
+class AppointmentSeriesForm(forms.ModelForm):
+    doctor = forms.ModelChoiceField(queryset=DoctorProfile.objects.all(), label="Select Doctor")
+    weekdays = forms.TypedMultipleChoiceField(
+        choices=AppointmentSeries.WEEKDAY_CHOICES,
+        coerce=int,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        label='Repeat on'
+    )
+
+    class Meta:
+        model = AppointmentSeries
+        fields = ['doctor', 'start_date', 'time', 'frequency', 'interval', 'weekdays',
+                  'occurrences', 'duration_minutes', 'is_virtual', 'location', 'appointment_notes']
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date'}),
+            'time': forms.TimeInput(attrs={'type': 'time'}),
+            'appointment_notes': forms.Textarea(attrs={'rows': 3}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = doctors()
+        if self.instance.pk and self.instance.weekdays:
+            self.initial['weekdays'] = self.instance.weekday_list()
+
+    def clean_occurrences(self):
+        occurrences = self.cleaned_data['occurrences']
+        if not 1 <= occurrences <= AppointmentSeries.MAX_OCCURRENCES:
+            raise forms.ValidationError(
+                f"Choose between 1 and {AppointmentSeries.MAX_OCCURRENCES} occurrences."
+            )
+        return occurrences
+
+    def clean_weekdays(self):
+        return ','.join(str(day) for day in sorted(self.cleaned_data['weekdays']))
+
+
+class WaitlistEntryForm(forms.ModelForm):
+    doctor = forms.ModelChoiceField(queryset=DoctorProfile.objects.all(), label="Select Doctor")
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['doctor', 'urgency', 'latest_date', 'notes']
+        widgets = {
+            'latest_date': forms.DateInput(attrs={'type': 'date'}),
+            'notes': forms.Textarea(attrs={'rows': 3}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = doctors()
+
+
+class AppointmentSeriesUpdateForm(forms.ModelForm):
+    class Meta:
+        model = AppointmentSeries
+        fields = ['time', 'duration_minutes', 'is_virtual', 'location', 'appointment_notes']
+        widgets = {
+            'time': forms.TimeInput(attrs={'type': 'time'}),
+            'appointment_notes': forms.Textarea(attrs={'rows': 3}),
+        }
+
+
 class MedicalRecordForm(forms.ModelForm):
     class Meta:
         model = MedicalRecord
@@ -59,6 +134,19 @@ class MedicalRecordForm(forms.ModelForm):
             'allergies': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+class AttachmentForm(forms.Form):
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'form-control'}))
+
+    def clean_file(self):
+        uploaded = self.cleaned_data['file']
+        if uploaded.content_type not in ALLOWED_TYPES:
+            raise forms.ValidationError("Only PDF and image files can be attached.")
+        max_size = getattr(settings, 'ATTACHMENT_MAX_SIZE', 50 * 1024 * 1024)
+        if uploaded.size > max_size:
+            raise forms.ValidationError(f"Attachments can be at most {max_size // (1024 * 1024)} MB.")
+        return uploaded
+
+
 class BillingForm(forms.ModelForm):
     class Meta:
         model = Billing
@@ -151,7 +239,7 @@ class DoctorProfileForm(forms.ModelForm):
         model = DoctorProfile
         fields = ['specialization', 'availability', 'phone']
         widgets = {
-            'specialization': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter specialization'}),
+            'specialization': forms.Select(attrs={'class': 'form-control'}),
             'availability': forms.Textarea(attrs={
                 'class': 'form-control',
                 'placeholder': 'Enter availability in JSON format',
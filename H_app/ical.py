@@ -0,0 +1,235 @@
+"""
+iCalendar feeds of a doctor's or a patient's appointments.
+
+Each user gets a feed at a URL holding a secret token (CalendarFeed), which
+calendar apps poll without logging in. A feed covers a sliding window of
+WINDOW_PAST_DAYS back and WINDOW_FUTURE_DAYS ahead; canceled appointments stay
+in it as CANCELLED so that calendars drop them. Feeds carry no clinical notes.
+
+Calendar apps poll every few minutes, and most polls find nothing new. The
+ETag is therefore built from the owner's Appointment generation counter in the
+cache (see versioned_cache.py), which every write to one of their appointments
+bumps. Events also show the names of the other side, so renaming a user, doctor
+or patient bumps the counters of the feeds whose window holds an appointment
+with them (`renamed`), and only when a name shown actually changes. Together
+with the window's first day, and with the token resolved through the cache as
+well, an unchanged feed answers 304 without touching the database.
+Last-Modified is when this server first served that ETag.
+
+A changed feed is streamed, reading its rows from the database in chunks.
+"""
+import hashlib
+import secrets
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .branches import database_for, databases
+from .models import Appointment, CalendarFeed, CustomUser, DoctorProfile, PatientProfile
+from .projections import FEED_ROW
+from .versioned_cache import CachedValue, bump, generation, owner_key
+
+WINDOW_PAST_DAYS = 30
+WINDOW_FUTURE_DAYS = 180
+CHUNK_SIZE = 500
+# Bump when the feed body changes, so that clients fetch it again.
+FEED_VERSION = '1'
+SEEN_TIMEOUT = 60 * 60 * 24 * 7
+# Event UIDs must not change with the host name the feed is fetched from.
+UID_DOMAIN = 'e-hospitality'
+
+FEED_OWNERS = CachedValue('calendar-feed-owner', [CalendarFeed, CustomUser, DoctorProfile])
+
+# The field of each model that events show as a name.
+NAME_FIELDS = {CustomUser: 'username', DoctorProfile: 'name', PatientProfile: 'name'}
+
+STATUSES = {'Scheduled': 'CONFIRMED', 'Completed': 'CONFIRMED', 'Canceled': 'CANCELLED'}
+
+
+class Feed:
+    """
+    Whose appointments a token shows: kind is 'doctor' (owner is the DoctorProfile
+    id) or 'patient' (owner is the user id).
+    """
+
+    def __init__(self, kind, owner, branch):
+        self.kind = kind
+        self.owner = owner
+        self.database = database_for(branch)
+
+    def appointments(self, start, end):
+        return (
+            Appointment.objects.using(self.database)
+            .filter(**{self.kind: self.owner}, date__range=(start, end))
+            .order_by('date', 'time', 'id')
+        )
+
+    def generation(self):
+        return generation(owner_key(Appointment, self.kind, self.owner))
+
+
+def remember_name(sender, instance, using, update_fields=None):
+    """
+    Notes on `instance`, before it is saved, whether the save changes the name
+    that events show.
+    """
+    field = NAME_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        instance._feed_name_changed = False
+    elif instance._state.adding:
+        # A new user has no appointments yet; a new profile replaces the username shown.
+        instance._feed_name_changed = sender is not CustomUser
+    else:
+        previous = sender._base_manager.using(using).filter(pk=instance.pk).values_list(field, flat=True).first()
+        instance._feed_name_changed = previous != getattr(instance, field)
+
+
+def renamed(sender, instance, using, today=None):
+    """
+    Bumps the feeds showing the name of `instance`, a user or profile whose name
+    changed, once the write commits.
+    """
+    start, _ = window(today)
+    if sender is DoctorProfile:
+        shown_as = {'doctor_id': instance.pk}
+    elif sender is PatientProfile:
+        shown_as = {'patient_id': instance.user_id}
+    else:
+        shown_as = {'patient_id': instance.pk, 'doctor__user_id': instance.pk}
+    keys = set()
+    for alias in databases():
+        appointments = Appointment.objects.using(alias).filter(date__gte=start)
+        for lookup, value in shown_as.items():
+            # The feeds of the other side of their appointments.
+            kind = 'patient' if lookup.startswith('doctor') else 'doctor'
+            owners = appointments.filter(**{lookup: value}).values_list(kind, flat=True).distinct()
+            keys.update(owner_key(Appointment, kind, owner) for owner in owners)
+    if keys:
+        bump(keys, using)
+
+
+def feed_token(user):
+    """
+    The user's feed token, issued on first use.
+    """
+    feed, _ = CalendarFeed.objects.get_or_create(user=user, defaults={'token': secrets.token_urlsafe(32)})
+    return feed.token
+
+
+def reset_token(user):
+    """
+    Issues a new token; the old feed URL stops working.
+    """
+    feed, _ = CalendarFeed.objects.update_or_create(user=user, defaults={'token': secrets.token_urlsafe(32)})
+    return feed.token
+
+
+def _owner(token):
+    row = (
+        CalendarFeed.objects
+        .filter(token=token, user__is_active=True, user__user_type__in=('doctor', 'patient'))
+        .values_list('user_id', 'user__user_type', 'user__branch')
+        .first()
+    )
+    if row is None:
+        return None
+    user_id, user_type, branch = row
+    if user_type == 'doctor':
+        doctor_id = DoctorProfile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+        return None if doctor_id is None else ('doctor', doctor_id, branch)
+    return ('patient', user_id, branch)
+
+
+def resolve(token):
+    """
+    The Feed of `token`, or None; cached until a feed, user or doctor changes.
+    """
+    owner = FEED_OWNERS.get_or_set(lambda: _owner(token), token)
+    return None if owner is None else Feed(*owner)
+
+
+def window(today=None):
+    today = today or date.today()
+    return today - timedelta(days=WINDOW_PAST_DAYS), today + timedelta(days=WINDOW_FUTURE_DAYS)
+
+
+def validators(feed, today=None):
+    """
+    (ETag, Last-Modified timestamp) of the feed's current body, from the cache only.
+    """
+    start, _ = window(today)
+    fingerprint = '|'.join([FEED_VERSION, feed.kind, str(feed.owner), str(feed.generation()), start.isoformat()])
+    etag = f'"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+    seen_key = f'calendar-feed-seen:{etag}'
+    cache.add(seen_key, int(timezone.now().timestamp()), SEEN_TIMEOUT)
+    return etag, cache.get(seen_key)
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+    """
+    Splits a content line into lines of at most 75 octets, as RFC 5545 requires.
+    """
+    if len(line.encode()) <= 75:
+        return line + '\r\n'
+    parts, part, size = [], '', 0
+    for char in line:
+        width = len(char.encode())
+        # Continuation lines start with a space, which counts towards their 75 octets.
+        if size + width > (75 if not parts else 74):
+            parts.append(part)
+            part, size = '', 0
+        part += char
+        size += width
+    parts.append(part)
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event(row, feed):
+    start = timezone.make_aware(datetime.combine(row.date, row.time))
+    if feed.kind == 'doctor':
+        summary = f"Appointment: {row.patient_name or row.patient_username}"
+    else:
+        summary = f"Appointment with Dr. {row.doctor_name or row.doctor_username}"
+    location = 'Virtual' if row.is_virtual else (row.location or '')
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{feed.database}-{row.id}@{UID_DOMAIN}',
+        f'DTSTAMP:{_utc(row.updated_at)}',
+        f'LAST-MODIFIED:{_utc(row.updated_at)}',
+        f'DTSTART:{_utc(start)}',
+        f'DTEND:{_utc(start + timedelta(minutes=row.duration_minutes))}',
+        f'SUMMARY:{escape(summary)}',
+        f'LOCATION:{escape(location)}',
+        f'STATUS:{STATUSES.get(row.status, "CONFIRMED")}',
+        'END:VEVENT',
+    ]
+    return ''.join(map(fold, lines))
+
+
+def stream(feed, today=None):
+    """
+    The feed body, one event at a time.
+    """
+    start, end = window(today)
+    yield ''.join(map(fold, [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//E-Hospitality//Appointments//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:E-Hospitality appointments',
+        # Polling hint for clients that honour it.
+        'REFRESH-INTERVAL;VALUE=DURATION:PT15M',
+    ]))
+    for row in FEED_ROW.iterate(feed.appointments(start, end), CHUNK_SIZE):
+        yield event(row, feed)
+    yield 'END:VCALENDAR\r\n'
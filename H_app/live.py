@@ -0,0 +1,222 @@
+"""
+Live board of today's appointments, pushed to the browser with server-sent events.
+
+Writes to today's appointments publish the ids they touched once their transaction
+commits: signals.py does so for saves and deletes, and the bulk paths, which send
+no signals, call `appointments_changed` themselves. Published ids go into a short
+change log in the cache.
+
+Each server process runs one Broker on its event loop, for as long as boards are
+open. It reads the change log, then the changed rows with one query per
+database, and hands the same rows to every open board. A board therefore costs
+one query when it connects (the snapshot) and none afterwards, however many are
+open. Changes made in the same process wake the broker at once; changes from
+other processes sharing the cache (e.g. Redis) are picked up within
+POLL_INTERVAL.
+
+The event stream needs the ASGI application (E_Hospitality/asgi.py) served by an
+ASGI server; under WSGI every open board would hold a worker.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .branches import use_database
+from .models import Appointment
+from .projections import BOARD_ROW
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 15.0
+# Changes stay in the log this long (seconds) and at most MAX_BACKLOG are read at once.
+LOG_TIMEOUT = 300
+MAX_BACKLOG = 1000
+# A change still missing from the log after this many polls was lost.
+MAX_STALLED_POLLS = 3
+# Events a board may fall behind by before it is dropped; the browser then reconnects.
+MAX_QUEUED = 100
+
+SEQUENCE_KEY = 'live-board:sequence'
+
+
+def _log_key(sequence):
+    return f'live-board:change:{sequence}'
+
+
+def appointments_changed(ids, using):
+    """
+    Publishes changes to today's appointments `ids`, in database `using`, once
+    the current transaction commits.
+    """
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: _publish(using, ids), using=using)
+
+
+def _publish(database, ids):
+    try:
+        sequence = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, None)
+        sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(_log_key(sequence), (database, ids), LOG_TIMEOUT)
+    broker.wake()
+
+
+def board_rows(database, ids=None):
+    with use_database(database):
+        appointments = Appointment.objects.filter(date=date.today())
+        if ids is not None:
+            appointments = appointments.filter(pk__in=ids)
+        return [row._asdict() for row in BOARD_ROW(appointments.order_by('time', 'id'))]
+
+
+def changes(database, ids):
+    """
+    The current rows of the changed appointments; those no longer on today's
+    board (deleted or moved to another day) are listed as removed.
+    """
+    rows = board_rows(database, ids)
+    present = {row['id'] for row in rows}
+    return {'appointments': rows, 'removed': sorted(set(ids) - present)}
+
+
+class Board:
+    def __init__(self, database):
+        self.database = database
+        self.queue = asyncio.Queue()
+
+
+class Broker:
+    def __init__(self):
+        self.boards = set()
+        self.loop = None
+        self.task = None
+        self.woken = None
+        self.sequence = 0
+        self.stalled = 0
+
+    def subscribe(self, database):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task is None or self.task.done():
+            self.loop = loop
+            self.woken = asyncio.Event()
+            self.sequence = cache.get(SEQUENCE_KEY, 0)
+            self.task = loop.create_task(self.run())
+        board = Board(database)
+        self.boards.add(board)
+        return board
+
+    def unsubscribe(self, board):
+        self.boards.discard(board)
+
+    def wake(self):
+        """
+        Called from any thread once this process has published a change.
+        """
+        loop, woken = self.loop, self.woken
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(woken.set)
+
+    async def run(self):
+        while self.boards:
+            try:
+                await asyncio.wait_for(self.woken.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.woken.clear()
+            try:
+                await self.dispatch()
+            except Exception:
+                logger.exception("Live board update failed")
+
+    async def dispatch(self):
+        changed = await sync_to_async(self.collect)()
+        if changed is None:
+            self.send_all(None, ('reload', None))
+            return
+        for database, ids in changed.items():
+            if any(board.database == database for board in self.boards):
+                self.send_all(database, ('change', await sync_to_async(changes)(database, ids)))
+
+    def send_all(self, database, message):
+        for board in list(self.boards):
+            if database is not None and board.database != database:
+                continue
+            if board.queue.qsize() >= MAX_QUEUED:
+                self.boards.discard(board)
+                board.queue.put_nowait(None)
+            else:
+                board.queue.put_nowait(message)
+
+    def collect(self):
+        """
+        Reads the change log past self.sequence; returns {database: ids}, or None
+        if changes were lost and every board has to reload.
+        """
+        latest = cache.get(SEQUENCE_KEY, 0)
+        if latest < self.sequence or latest - self.sequence > MAX_BACKLOG:
+            # The counter was evicted, or the boards are too far behind.
+            self.sequence = latest
+            return None
+        sequences = range(self.sequence + 1, latest + 1)
+        entries = cache.get_many([_log_key(sequence) for sequence in sequences])
+        changed = defaultdict(set)
+        for sequence in sequences:
+            entry = entries.get(_log_key(sequence))
+            if entry is None:
+                # Published but not written yet, or lost.
+                self.stalled += 1
+                if self.stalled < MAX_STALLED_POLLS:
+                    break
+                self.sequence, self.stalled = latest, 0
+                return None
+            self.stalled = 0
+            database, ids = entry
+            changed[database].update(ids)
+            self.sequence = sequence
+        return changed
+
+
+broker = Broker()
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def events(database):
+    """
+    The event stream of one open board: a snapshot of today's appointments, then
+    the changes.
+    """
+    board = broker.subscribe(database)
+    try:
+        day = date.today()
+        yield _event('snapshot', await sync_to_async(board_rows)(database))
+        while True:
+            try:
+                message = await asyncio.wait_for(board.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                message = ('heartbeat', None)
+            if message is None:
+                # Dropped for falling behind; the browser reconnects and starts over.
+                return
+            kind, data = message
+            if kind == 'reload' or date.today() != day:
+                day = date.today()
+                yield _event('snapshot', await sync_to_async(board_rows)(database))
+            elif kind == 'change':
+                yield _event('change', data)
+            else:
+                yield ": heartbeat\n\n"
+    finally:
+        broker.unsubscribe(board)
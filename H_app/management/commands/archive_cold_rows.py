@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from H_app.archive import DEFAULT_BATCH_SIZE, POLICIES
+from H_app.branches import databases, use_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves completed/canceled appointments and old medical records and prescriptions "
+        "into the archive tables in batches. Intended to run from cron, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop each table after this many batches.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many rows would be archived.")
+
+    def handle(self, *args, **options):
+        for alias in databases():
+            with use_database(alias):
+                self.archive(alias, options)
+
+    def archive(self, alias, options):
+        prefix = f"[{alias}] " if len(databases()) > 1 else ""
+        for policy in POLICIES:
+            cutoff = policy.cutoff()
+            if options['dry_run']:
+                count = policy.cold_rows(cutoff).count()
+                self.stdout.write(f"{prefix}{policy.name}: {count} rows older than {cutoff:%Y-%m-%d} would be archived")
+                continue
+            moved = policy.archive(cutoff, options['batch_size'], options['max_batches'])
+            self.stdout.write(self.style.SUCCESS(f"{prefix}{policy.name}: archived {moved} rows"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from H_app.recommendations import DEFAULT_CHUNK_SIZE, DEFAULT_TOP_N, recommend_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the per-patient health resource recommendations shown on the patient "
+        "dashboard. Run periodically, e.g. nightly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=DEFAULT_TOP_N,
+                            help="Number of resources to keep per patient.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        processed = recommend_all(top_n=options['top'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Stored recommendations for {processed} patients"))
@@ -0,0 +1,23 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from H_app import versioned_cache
+
+
+class Command(BaseCommand):
+    help = "Shows hit and miss counts of the versioned caches (H_app/versioned_cache.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after showing them.")
+
+    def handle(self, *args, **options):
+        # The cached values are declared in the view modules.
+        import_module(settings.ROOT_URLCONF)
+        for name, counts in versioned_cache.stats().items():
+            rate = '-' if counts['hit_rate'] is None else f"{counts['hit_rate']:.1%}"
+            self.stdout.write(f"{name:<24} hits={counts['hits']:<8} misses={counts['misses']:<8} hit rate={rate}")
+        if options['reset']:
+            versioned_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
@@ -0,0 +1,91 @@
+import statistics
+import time
+from datetime import date, time as clock, timedelta
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from H_app import ical
+from H_app.benchmarks import scratch_database
+from H_app.compression import ENCODERS
+from H_app.models import Appointment, CustomUser, DoctorProfile, PatientProfile
+
+
+def seed(patients, appointments):
+    admin = CustomUser.objects.create(username='bench_admin', user_type='admin', is_staff=True)
+    doctor_user = CustomUser.objects.create(username='bench_doctor', user_type='doctor')
+    doctor = DoctorProfile.objects.create(user=doctor_user, name='Bench Doctor')
+    users = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench_patient{i}', email=f'patient{i}@example.com', user_type='patient')
+        for i in range(patients)
+    ])
+    PatientProfile.objects.bulk_create([
+        PatientProfile(user=user, name=f'Patient {i}', phone='5551234567') for i, user in enumerate(users)
+    ])
+    Appointment.objects.bulk_create([
+        Appointment(patient=users[i % patients], doctor=doctor, date=date.today() + timedelta(days=i % 60 - 30),
+                    time=clock(8 + i % 9), location='Main Building, Outpatients')
+        for i in range(appointments)
+    ])
+    return admin, doctor_user
+
+
+def pages(admin, doctor_user):
+    """
+    (label, user, url) of the list pages and JSON endpoints measured.
+    """
+    return [
+        ('user_list', admin, reverse('user_list')),
+        ('admin_appointment_list', admin, reverse('admin_appointment_list')),
+        ('patient_list', admin, reverse('patient_list')),
+        ('api appointments', admin, reverse('api_list', args=['appointments']) + '?limit=200'),
+        ('sync snapshot', doctor_user, reverse('sync')),
+        ('calendar feed', None, reverse('calendar_feed', args=[ical.feed_token(doctor_user)])),
+    ]
+
+
+def fetch(client, url, coding):
+    started = time.perf_counter()
+    response = client.get(url, headers={'accept-encoding': coding})
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return time.perf_counter() - started, len(body), response.get('Content-Encoding', 'identity')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the bytes sent and the time to serve the main list pages and JSON "
+        "endpoints with each content coding CompressionMiddleware offers, on a seeded "
+        "scratch database, and estimates the time to load them over a slow link."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--appointments', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--bandwidth', type=float, default=2.0, help="Link speed in Mbit/s.")
+        parser.add_argument('--rtt', type=float, default=50.0, help="Round-trip time in milliseconds.")
+
+    def handle(self, *args, **options):
+        codings = ['identity'] + [encoder.coding for encoder in reversed(ENCODERS)]
+        with scratch_database():
+            admin, doctor_user = seed(options['patients'], options['appointments'])
+            self.stdout.write(
+                f"{options['patients']} patients, {options['appointments']} appointments; "
+                f"median of {options['repeat']} runs; load time at {options['bandwidth']} Mbit/s, "
+                f"{options['rtt']:.0f} ms RTT\n"
+            )
+            for label, user, url in pages(admin, doctor_user):
+                client = Client()
+                if user is not None:
+                    client.force_login(user)
+                for coding in codings:
+                    fetch(client, url, coding)
+                    runs = [fetch(client, url, coding) for _ in range(options['repeat'])]
+                    served = statistics.median(run[0] for run in runs)
+                    size, used = runs[0][1], runs[0][2]
+                    transfer = size * 8 / (options['bandwidth'] * 1e6)
+                    self.stdout.write(
+                        f"{label:<24} {used:<9} {size / 1024:9.1f} KiB  server={served * 1000:7.1f}ms  "
+                        f"load={(served + transfer) * 1000 + options['rtt']:8.1f}ms"
+                    )
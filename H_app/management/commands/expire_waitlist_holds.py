@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from H_app.branches import databases, use_database
+from H_app.waitlist import expire_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Expires waitlist holds that were not accepted in time and offers their slots "
+        "to the next patient in line. Intended to run from cron every minute."
+    )
+
+    def handle(self, *args, **options):
+        expired = 0
+        for alias in databases():
+            with use_database(alias):
+                expired += expire_holds()
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} holds"))
@@ -0,0 +1,243 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import reverse
+
+from H_app.benchmarks import HttpSession, format_summary, live_server, scratch_database, summarize
+from H_app.models import CustomUser, DoctorProfile, PatientProfile, Specialization
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DOCTOR_OPTION_RE = re.compile(r'<option value="(\d+)"')
+PRESCRIBE_LINK_RE = re.compile(r'/prescribe/(\d+)/')
+CONFIRM_LINK_RE = re.compile(r'/appointments/confirm/(\d+)/')
+
+
+class JourneyFailed(Exception):
+    pass
+
+
+class Recorder:
+    """
+    Collects per-step latencies and unexpected statuses from all virtual users.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.journeys = defaultdict(int)
+
+    def step(self, name, result, expected):
+        with self.lock:
+            self.latencies[name].append(result.elapsed)
+            if result.status != expected:
+                self.errors[name] += 1
+        if result.status != expected:
+            raise JourneyFailed(f"{name}: expected {expected}, got {result.status}")
+        return result
+
+    def finished(self, journey):
+        with self.lock:
+            self.journeys[journey] += 1
+
+
+def login(recorder, session, role, username, password):
+    recorder.step(f'{role}: login page', session.get(reverse('user_login')), 200)
+    recorder.step(f'{role}: login', session.post(reverse('user_login'), {
+        'username': username, 'password': password,
+    }), 302)
+
+
+def patient_journey(recorder, session, username, password, rng):
+    """
+    login -> get_available_doctors -> AppointmentCreateView -> confirm_appointment
+    """
+    login(recorder, session, 'patient', username, password)
+    day = date.today() + timedelta(days=rng.randint(1, 60))
+    result = recorder.step('patient: available doctors', session.get(
+        f"{reverse('available_doctors')}?date={day:%Y-%m-%d}"
+    ), 200)
+    doctor_ids = [str(doctor['id']) for doctor in json.loads(result.body)['available_doctors']]
+
+    result = recorder.step('patient: booking form', session.get(reverse('appointment_create')), 200)
+    doctor_ids = doctor_ids or DOCTOR_OPTION_RE.findall(result.body.decode())
+    if not doctor_ids:
+        raise JourneyFailed("no doctors to book")
+
+    result = recorder.step('patient: book appointment', session.post(reverse('appointment_create'), {
+        'patient_name': username,
+        'doctor': rng.choice(doctor_ids),
+        'date': f'{day:%Y-%m-%d}',
+        'time': f'{rng.randint(8, 16):02d}:{rng.choice([0, 15, 30, 45]):02d}',
+        'status': 'Scheduled',
+    }), 302)
+    match = CONFIRM_LINK_RE.search(result.headers.get('Location', ''))
+    if not match:
+        raise JourneyFailed("booking did not redirect to the confirmation page")
+    recorder.step('patient: confirm appointment', session.post(
+        reverse('confirm_booking', args=[match.group(1)])
+    ), 200)
+
+
+def doctor_journey(recorder, session, username, password, rng):
+    """
+    login -> DoctorAppointmentListView -> prescribe_medicine
+    """
+    login(recorder, session, 'doctor', username, password)
+    result = recorder.step('doctor: appointment list', session.get(reverse('doctor_appointment_list')), 200)
+    appointment_ids = PRESCRIBE_LINK_RE.findall(result.body.decode())
+    if not appointment_ids:
+        return
+    url = reverse('prescribe_medicine', args=[rng.choice(appointment_ids)])
+    recorder.step('doctor: prescription form', session.get(url), 200)
+    recorder.step('doctor: prescribe', session.post(url, {
+        'medication_name': 'Paracetamol',
+        'dosage_instructions': '500mg twice daily after meals',
+        'medicines': 'None',
+    }), 302)
+
+
+JOURNEYS = {
+    'patient': patient_journey,
+    'doctor': doctor_journey,
+}
+
+
+def seed_users(prefix, patients, doctors, password):
+    """
+    Creates (or reuses) `prefix`patient<N> / `prefix`doctor<N> accounts with profiles.
+    """
+    hashed = make_password(password)
+    wanted = [(f'{prefix}patient{i}', 'patient') for i in range(patients)]
+    wanted += [(f'{prefix}doctor{i}', 'doctor') for i in range(doctors)]
+    existing = set(CustomUser.objects.filter(username__in=[name for name, _ in wanted])
+                   .values_list('username', flat=True))
+    CustomUser.objects.bulk_create([
+        CustomUser(username=name, user_type=user_type, password=hashed)
+        for name, user_type in wanted if name not in existing
+    ])
+    users = CustomUser.objects.filter(username__in=[name for name, _ in wanted])
+    availability = '{%s}' % ', '.join(f'"{day}": "08:00-17:00"' for day in WEEKDAYS)
+    PatientProfile.objects.bulk_create([
+        PatientProfile(user=user, name=user.username)
+        for user in users.filter(user_type='patient', patient_profile__isnull=True)
+    ])
+    specialization, _ = Specialization.objects.get_or_create(name='General Medicine')
+    DoctorProfile.objects.bulk_create([
+        DoctorProfile(user=user, name=user.username, specialization=specialization,
+                      availability=availability)
+        for user in users.filter(user_type='doctor', doctor_profile__isnull=True)
+    ])
+    return (
+        [name for name, user_type in wanted if user_type == 'patient'],
+        [name for name, user_type in wanted if user_type == 'doctor'],
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays scripted patient and doctor journeys against a running server with "
+        "configurable concurrency and reports throughput and p50/p95/p99 latency per step. "
+        "Use --scratch to start a throwaway server on a scratch database instead. "
+        "Rate limits on the target server will show up as errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--scratch', action='store_true',
+                            help="Serve the app locally on a scratch database, seeded automatically.")
+        parser.add_argument('--seed', action='store_true',
+                            help="Create the load-test accounts in the configured database first.")
+        parser.add_argument('--prefix', default='lt_', help="Username prefix of load-test accounts.")
+        parser.add_argument('--password', default='load-test-password')
+        parser.add_argument('--patients', type=int, default=50)
+        parser.add_argument('--doctors', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds to run.")
+        parser.add_argument('--doctor-share', type=float, default=0.2,
+                            help="Fraction of virtual users running the doctor journey.")
+
+    def handle(self, *args, **options):
+        # Virtual users not running the doctor journey, and all of them when there
+        # are no doctors, run the patient journey.
+        if options['patients'] < 1:
+            raise CommandError("--patients must be at least 1.")
+        if options['doctors'] < 0:
+            raise CommandError("--doctors cannot be negative.")
+        if options['scratch']:
+            disabled_limits = {'login': None, 'signup': None, 'booking': None}
+            overrides = override_settings(ALLOWED_HOSTS=['*'], RATELIMITS=disabled_limits)
+            with scratch_database(on_disk=True), overrides, live_server() as base_url:
+                users = self.seed(options)
+                self.report(self.run(base_url, users, options), options)
+            return
+
+        users = self.seed(options) if options['seed'] else (
+            [f"{options['prefix']}patient{i}" for i in range(options['patients'])],
+            [f"{options['prefix']}doctor{i}" for i in range(options['doctors'])],
+        )
+        self.report(self.run(options['base_url'], users, options), options)
+
+    def seed(self, options):
+        patients, doctors = seed_users(options['prefix'], options['patients'], options['doctors'],
+                                       options['password'])
+        self.stdout.write(f"Seeded {len(patients)} patients and {len(doctors)} doctors")
+        return patients, doctors
+
+    def run(self, base_url, users, options):
+        patients, doctors = users
+        if not patients:
+            raise CommandError("No load-test patients; pass --patients.")
+        recorder = Recorder()
+        failures = defaultdict(int)
+        deadline = time.perf_counter() + options['duration']
+
+        def virtual_user(number):
+            rng = random.Random(number)
+            doctor_count = round(options['concurrency'] * options['doctor_share'])
+            role = 'doctor' if number < doctor_count and doctors else 'patient'
+            pool = doctors if role == 'doctor' else patients
+            username = pool[number % len(pool)]
+            while time.perf_counter() < deadline:
+                session = HttpSession(base_url)
+                try:
+                    JOURNEYS[role](recorder, session, username, options['password'], rng)
+                    recorder.finished(role)
+                except (JourneyFailed, OSError) as error:
+                    with recorder.lock:
+                        failures[str(error)] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=virtual_user, args=(i,)) for i in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        recorder.elapsed = time.perf_counter() - started
+        recorder.failures = failures
+        return recorder
+
+    def report(self, recorder, options):
+        elapsed = recorder.elapsed
+        self.stdout.write(
+            f"\n{options['concurrency']} virtual users for {elapsed:.1f}s against the real URL map"
+        )
+        for journey, count in sorted(recorder.journeys.items()):
+            self.stdout.write(f"{journey} journeys completed: {count} ({count / elapsed:.2f}/s)")
+        self.stdout.write('')
+        for name in sorted(recorder.latencies):
+            summary = summarize(recorder.latencies[name])
+            self.stdout.write(
+                f"{format_summary(name, summary)} {summary['count'] / elapsed:7.1f} req/s "
+                f"errors={recorder.errors[name]}"
+            )
+        for message, count in sorted(recorder.failures.items(), key=lambda item: -item[1])[:10]:
+            self.stdout.write(self.style.WARNING(f"{count} x {message}"))
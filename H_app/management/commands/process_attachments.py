@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from H_app.attachments import process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates thumbnails for newly uploaded medical record attachments. Run from "
+        "cron, or keep it running with --watch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                            help="Keep polling for new uploads every SECONDS.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = total = process_pending(options['batch_size'])
+            while processed == options['batch_size']:
+                processed = process_pending(options['batch_size'])
+                total += processed
+            if total:
+                self.stdout.write(self.style.SUCCESS(f"Processed {total} attachments"))
+            if options['watch'] is None:
+                break
+            time.sleep(options['watch'])
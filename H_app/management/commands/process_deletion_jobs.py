@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from H_app.deletion import DEFAULT_BATCH_SIZE, run_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes the accounts queued for deletion, with the rows referencing them, in "
+        "batches. Run from cron, or keep it running with --watch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                            help="Keep polling for new jobs every SECONDS.")
+
+    def handle(self, *args, **options):
+        while True:
+            run_pending(options['batch_size'], report=self.report)
+            if options['watch'] is None:
+                break
+            time.sleep(options['watch'])
+
+    def report(self, job):
+        prefix = f"[{job.username}] "
+        if job.status == 'Done':
+            self.stdout.write(self.style.SUCCESS(f"{prefix}removed ({job.processed_rows} rows)"))
+        elif job.status == 'Failed':
+            self.stderr.write(self.style.ERROR(f"{prefix}failed: {job.error}"))
+        else:
+            self.stdout.write(f"{prefix}{job.step}: {job.processed_rows}/{job.total_rows} rows ({job.percent}%)")
@@ -0,0 +1,117 @@
+import statistics
+import time
+import tracemalloc
+from datetime import date, time as clock, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from H_app.benchmarks import scratch_database
+from H_app.models import Appointment, Billing, CustomUser, DoctorProfile, PatientProfile, Prescription
+from H_app.projections import APPOINTMENT_ROW, BILLING_ROW, PATIENT_ROW, PRESCRIPTION_ROW
+
+NOTES = "Patient reports intermittent symptoms; see attached history. " * 40
+
+
+def seed(rows):
+    doctor_user = CustomUser.objects.create(username='bench_doctor', user_type='doctor')
+    doctor = DoctorProfile.objects.create(user=doctor_user, name='Bench Doctor')
+    patients = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench_patient{i}', email=f'patient{i}@example.com', user_type='patient')
+        for i in range(rows)
+    ])
+    PatientProfile.objects.bulk_create([
+        PatientProfile(user=user, name=f'Patient {i}', phone='5551234567', medical_history=NOTES)
+        for i, user in enumerate(patients)
+    ])
+    patient = patients[0]
+    Billing.objects.bulk_create([Billing(patient=patient, total_amount=100 + i) for i in range(rows)])
+    Appointment.objects.bulk_create([
+        Appointment(patient=patient, doctor=doctor, date=date.today() + timedelta(days=i % 365),
+                    time=clock(9 + i % 8), appointment_notes=NOTES)
+        for i in range(rows)
+    ])
+    Prescription.objects.bulk_create([
+        Prescription(patient=patient, doctor=doctor, medication_name='Paracetamol',
+                     dosage_instructions=NOTES, medicines=NOTES)
+        for i in range(rows)
+    ])
+    return patient
+
+
+def list_pages(patient):
+    """
+    (page, model-instance version, projection version); each version returns what the
+    template reads for every row, including lazily loaded relations.
+    """
+    return [
+        (
+            'BillingListView',
+            lambda: [(b.id, b.total_amount, b.payment_status, b.date_issued)
+                     for b in Billing.objects.filter(patient=patient)],
+            lambda: BILLING_ROW(Billing.objects.filter(patient=patient)),
+        ),
+        (
+            'AppointmentListView',
+            lambda: [(a.id, a.date, a.status, a.doctor.user.username)
+                     for a in Appointment.objects.filter(patient=patient)],
+            lambda: APPOINTMENT_ROW(Appointment.objects.filter(patient=patient)),
+        ),
+        (
+            'PrescriptionListView',
+            lambda: [(p.medication_name, p.doctor.user.username, p.created_at)
+                     for p in Prescription.objects.filter(patient=patient).order_by('-created_at')],
+            lambda: PRESCRIPTION_ROW(Prescription.objects.filter(patient=patient).order_by('-created_at')),
+        ),
+        (
+            'admin_patient_list',
+            lambda: [(u.id, u.username, u.email, u.patient_profile.name, u.patient_profile.phone)
+                     for u in CustomUser.objects.filter(user_type='patient').order_by('id')],
+            lambda: PATIENT_ROW(CustomUser.objects.filter(user_type='patient').order_by('id')),
+        ),
+    ]
+
+
+def measure(build, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build()
+        timings.append(time.perf_counter() - started)
+    queries = 0
+
+    def count_queries(execute, *args):
+        nonlocal queries
+        queries += 1
+        return execute(*args)
+
+    with connection.execute_wrapper(count_queries):
+        tracemalloc.start()
+        rows = build()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return statistics.median(timings), peak, queries, len(rows)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares list pages built from model instances with the values_list projections "
+        "in H_app/projections.py on a seeded scratch database: latency, peak memory and "
+        "query count per page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Rows per list page.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            patient = seed(options['rows'])
+            self.stdout.write(f"{options['rows']} rows per page, median of {options['repeat']} runs\n")
+            for page, models_version, projected_version in list_pages(patient):
+                for label, build in [('models', models_version), ('projection', projected_version)]:
+                    median, peak, queries, rows = measure(build, options['repeat'])
+                    self.stdout.write(
+                        f"{page:<22} {label:<11} {median * 1000:9.1f}ms  peak={peak / 1e6:7.1f}MB  "
+                        f"queries={queries:<6} rows={rows}"
+                    )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from H_app.branches import databases, use_database
+from H_app.changelog import PRUNE_BATCH_SIZE, prune, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes change log entries older than CHANGE_LOG_RETENTION_DAYS from every database. "
+        "Intended to run from cron, e.g. nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff()
+        for alias in databases():
+            with use_database(alias):
+                removed = prune(cutoff, options['batch_size'])
+            prefix = f"[{alias}] " if len(databases()) > 1 else ""
+            self.stdout.write(self.style.SUCCESS(
+                f"{prefix}Removed {removed} change log entries from before {cutoff:%Y-%m-%d}"
+            ))
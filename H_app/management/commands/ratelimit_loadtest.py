@@ -0,0 +1,94 @@
+import logging
+import multiprocessing
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from H_app.benchmarks import HttpSession, format_summary, live_server, scratch_database, summarize
+from H_app.models import CustomUser
+
+PASSWORD = 'load-test-password'
+
+
+def attack(base_url, number, rate, stop, counts):
+    """
+    Runs in a separate process: bad-password logins for the same account at `rate`
+    requests per second (paced so the load generator itself does not eat the CPU).
+    """
+    session = HttpSession(base_url, headers={'X-Forwarded-For': f'10.0.0.{number + 1}'})
+    session.get('/login/')
+    while not stop.is_set():
+        started = time.perf_counter()
+        result = session.post('/login/', {'username': 'victim', 'password': 'wrong'})
+        with counts.get_lock():
+            counts[0] += 1
+            if result.status == 429:
+                counts[1] += 1
+        time.sleep(max(0.0, 1 / rate - (time.perf_counter() - started)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Starts a local server on a scratch database, floods /login/ with bad passwords "
+        "from several processes while a legitimate user keeps logging in, once without "
+        "and once with rate limiting, and reports the legitimate user's latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attackers', type=int, default=4)
+        parser.add_argument('--attack-rate', type=float, default=20.0,
+                            help="Requests per second sent by each attacker.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per run.")
+        parser.add_argument('--interval', type=float, default=0.25,
+                            help="Pause between the legitimate user's logins.")
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with scratch_database(on_disk=True), override_settings(
+            ALLOWED_HOSTS=['*'], RATELIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR'
+        ), live_server() as base_url:
+            CustomUser.objects.create_user('legit', password=PASSWORD)
+            CustomUser.objects.create_user('victim', password=PASSWORD)
+            self.stdout.write(format_summary('idle: legit login', summarize(self.legit_logins(base_url, 2, options))))
+            for label, ratelimits in [
+                ('unprotected', {'login': None}),
+                ('rate limited', {'login': '10/m'}),
+            ]:
+                with override_settings(RATELIMITS=ratelimits):
+                    cache.clear()
+                    latencies, total, throttled = self.run(base_url, options)
+                self.stdout.write(format_summary(f"{label}: legit login", summarize(latencies)))
+                self.stdout.write(f"{label}: {total} attack requests, {throttled} throttled")
+
+    def legit_logins(self, base_url, duration, options):
+        latencies = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            session = HttpSession(base_url, headers={'X-Forwarded-For': '192.168.1.10'})
+            session.get('/login/')
+            result = session.post('/login/', {'username': 'legit', 'password': PASSWORD})
+            if result.status != 302:
+                self.stderr.write(f"legitimate login answered {result.status}")
+            latencies.append(result.elapsed)
+            time.sleep(options['interval'])
+        return latencies
+
+    def run(self, base_url, options):
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        counts = context.Array('i', 2)
+        workers = [
+            context.Process(target=attack, args=(base_url, i, options['attack_rate'], stop, counts), daemon=True)
+            for i in range(options['attackers'])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            latencies = self.legit_logins(base_url, options['duration'], options)
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        return latencies, counts[0], counts[1]
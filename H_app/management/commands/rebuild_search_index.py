@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from H_app.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the type-ahead prefix index for all users (needed once after deploying it)."
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} users"))
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from H_app.branches import databases, use_database
+from H_app.reminders import BACKENDS, DEFAULT_CHUNK_SIZE, ReminderDispatcher, due_appointments, get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends one reminder per patient for their appointments in the next --days days "
+        "(starting tomorrow) and records each dispatch so nobody is reminded twice. "
+        "Intended to run from cron, e.g. every morning."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help="How many days ahead to remind.")
+        parser.add_argument('--backend', default=None,
+                            help=f"One of {', '.join(BACKENDS)} or an email backend path; "
+                                 "defaults to settings.REMINDER_EMAIL_BACKEND.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Patients rendered and sent per batch.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many appointments are due a reminder.")
+
+    def handle(self, *args, **options):
+        start = date.today() + timedelta(days=1)
+        end = date.today() + timedelta(days=options['days'])
+        if options['dry_run']:
+            count = 0
+            for alias in databases():
+                with use_database(alias):
+                    count += due_appointments(start, end).count()
+            self.stdout.write(f"{count} appointments from {start} to {end} are due a reminder")
+            return
+        dispatcher = ReminderDispatcher(get_backend(options['backend']), options['chunk_size'])
+        for alias in databases():
+            with use_database(alias):
+                counts = dispatcher.run(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Reminders for {start} to {end}: {counts['Sent']} appointments reminded, "
+            f"{counts['Skipped']} skipped (no email), {counts['Failed']} failed"
+        ))
@@ -0,0 +1,64 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+IMPORT_APPLICATION = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'E_Hospitality.settings')
+from E_Hospitality.wsgi import application
+imported = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({
+    'wsgi': imported - started,
+    'urls': time.perf_counter() - imported,
+    'stripe_loaded': 'stripe' in sys.modules,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures cold start: importing wsgi.application (plus loading the URLconf, as the "
+        "first request does) and running `manage.py check`, each in a fresh interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        wsgi, urls, check = [], [], []
+        stripe_loaded = False
+        for _ in range(options['repeat']):
+            output = subprocess.run(
+                [sys.executable, '-c', IMPORT_APPLICATION],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            wsgi.append(result['wsgi'])
+            urls.append(result['urls'])
+            stripe_loaded = stripe_loaded or result['stripe_loaded']
+
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, 'manage.py', 'check'],
+                cwd=settings.BASE_DIR, capture_output=True, check=True,
+            )
+            check.append(time.perf_counter() - started)
+
+        for label, values in [
+            ('import wsgi.application', wsgi),
+            ('load URLconf and views', urls),
+            ('manage.py check (wall)', check),
+        ]:
+            self.stdout.write(
+                f"{label:<26} median={statistics.median(values) * 1000:7.1f}ms "
+                f"min={min(values) * 1000:7.1f}ms max={max(values) * 1000:7.1f}ms"
+            )
+        self.stdout.write(f"payment SDK imported at startup: {'yes' if stripe_loaded else 'no'}")
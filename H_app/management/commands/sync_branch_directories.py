@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from H_app.branches import branch_databases, sync_directories
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the shared directories (users, profiles, specializations, attachment "
+        "blobs) from the default database into every branch database. Run after "
+        "migrating a new branch database or bulk-importing users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='append', dest='databases',
+                            help="Only this branch database; may be repeated.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        aliases = options['databases'] or branch_databases()
+        unknown = set(aliases) - set(branch_databases())
+        if unknown:
+            raise CommandError(f"Not a branch database: {', '.join(sorted(unknown))}")
+        if not aliases:
+            self.stdout.write("No branch databases configured in HOSPITAL_BRANCHES.")
+        for alias in aliases:
+            copied = sync_directories(alias, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"{alias}: {copied} directory rows in sync"))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('H_app', '0006_archive_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientResourceRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_ids', models.JSONField(default=list)),
+                ('computed_at', models.DateTimeField()),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resource_recommendation', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('H_app', '0011_medical_record_attachments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('urgency', models.PositiveSmallIntegerField(choices=[(3, 'Urgent'), (2, 'Soon'), (1, 'Routine')], default=1)),
+                ('latest_date', models.DateField(blank=True, help_text='Only offer slots up to this date.', null=True)),
+                ('notes', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('Waiting', 'Waiting'), ('Offered', 'Offered'), ('Booked', 'Booked'), ('Declined', 'Declined'), ('Expired', 'Expired'), ('Withdrawn', 'Withdrawn')], default='Waiting', max_length=10)),
+                ('requested_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('offered_date', models.DateField(blank=True, null=True)),
+                ('offered_time', models.TimeField(blank=True, null=True)),
+                ('offered_duration_minutes', models.PositiveIntegerField(blank=True, null=True)),
+                ('offered_location', models.CharField(blank=True, max_length=255, null=True)),
+                ('offered_is_virtual', models.BooleanField(default=False)),
+                ('offer_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='H_app.appointment')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='H_app.doctorprofile')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doctor', 'status', '-urgency', 'requested_at'], name='waitlist_queue_idx'), models.Index(fields=['status', 'offer_expires_at'], name='waitlist_hold_expiry_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['Waiting', 'Offered'])), fields=('patient', 'doctor'), name='unique_open_waitlist_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('H_app', '0012_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='branch',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
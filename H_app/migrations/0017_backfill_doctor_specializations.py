@@ -0,0 +1,68 @@
+"""
+Maps the free-text DoctorProfile.specialization onto Specialization rows, creating
+the missing ones; names are matched ignoring case and surrounding spaces.
+
+Not atomic: every batch of BATCH_SIZE doctors commits on its own, so the doctor
+table is never locked for the whole backfill, and an interrupted run resumes
+with the doctors not mapped yet.
+
+Only 'default' is backfilled. Branch databases hold copies of the directory
+tables; run `manage.py sync_branch_directories` after migrating to copy the
+mapped doctors and any new specializations to them.
+"""
+from django.db import DEFAULT_DB_ALIAS, migrations, transaction
+
+BATCH_SIZE = 500
+
+
+def backfill(apps, schema_editor):
+    database = schema_editor.connection.alias
+    if database != DEFAULT_DB_ALIAS:
+        return
+    DoctorProfile = apps.get_model('H_app', 'DoctorProfile')
+    Specialization = apps.get_model('H_app', 'Specialization')
+    doctors = DoctorProfile.objects.using(database)
+    specializations = Specialization.objects.using(database)
+
+    ids = {name.strip().casefold(): pk for pk, name in specializations.values_list('pk', 'name')}
+    last = 0
+    while True:
+        with transaction.atomic(using=database):
+            rows = list(
+                doctors.filter(pk__gt=last, specialization_fk__isnull=True, specialization__gt='')
+                .order_by('pk').values_list('pk', 'specialization')[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            last = rows[-1][0]
+            by_specialization = {}
+            for pk, name in rows:
+                name = name.strip()
+                if not name:
+                    continue
+                if name.casefold() not in ids:
+                    ids[name.casefold()] = specializations.create(name=name).pk
+                by_specialization.setdefault(ids[name.casefold()], []).append(pk)
+            for specialization_id, pks in by_specialization.items():
+                doctors.filter(pk__in=pks).update(specialization_fk_id=specialization_id)
+
+
+def unfill(apps, schema_editor):
+    database = schema_editor.connection.alias
+    DoctorProfile = apps.get_model('H_app', 'DoctorProfile')
+    Specialization = apps.get_model('H_app', 'Specialization')
+    doctors = DoctorProfile.objects.using(database)
+    for pk, name in Specialization.objects.using(database).values_list('pk', 'name'):
+        doctors.filter(specialization_fk_id=pk).update(specialization=name)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('H_app', '0016_doctorprofile_specialization_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, unfill),
+    ]
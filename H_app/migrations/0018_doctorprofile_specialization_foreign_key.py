@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('H_app', '0017_backfill_doctor_specializations'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='doctorprofile',
+            name='specialization',
+        ),
+        migrations.RenameField(
+            model_name='doctorprofile',
+            old_name='specialization_fk',
+            new_name='specialization',
+        ),
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='specialization',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='doctors', to='H_app.specialization'),
+        ),
+    ]
@@ -1,8 +1,14 @@
+from datetime import date, timedelta
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
 from E_Hospitality import settings
 
+from .changelog import ChangeLogQuerySet
+from .versioned_cache import VersionedQuerySet
+
 
 class CustomUser(AbstractUser):
     USER_TYPES = (
@@ -11,6 +17,9 @@ class CustomUser(AbstractUser):
         ('admin', 'Admin'),
     )
     user_type = models.CharField(max_length=10, choices=USER_TYPES, default='patient')
+    # Key in settings.HOSPITAL_BRANCHES whose database holds the user's clinical
+    # rows; blank for the main hospital (see branches.py).
+    branch = models.CharField(max_length=50, blank=True, default='')
 
 
 
@@ -29,19 +38,41 @@ class PatientProfile(models.Model):
     medical_history = models.TextField(blank=True)
     treatment_plans = models.TextField(blank=True)
 
+    objects = ChangeLogQuerySet.as_manager()
+
     def __str__(self):
         return self.user.username
 
+class UserSearchTerm(models.Model):
+    """
+    Normalized prefixes of a user's username, patient name and phone number,
+    maintained by H_app.search so type-ahead lookups are a single index probe.
+    """
+    prefix = models.CharField(max_length=20)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='search_terms')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'user'], name='unique_user_search_prefix'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix} -> {self.user_id}"
+
 User = get_user_model()
 class DoctorProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='doctor_profile')
     name = models.CharField(max_length=100, null=True)
     email = models.EmailField(null=True)
     phone_no = models.IntegerField(null=True)
-    specialization = models.CharField(max_length=100, null=True)
+    specialization = models.ForeignKey(
+        'Specialization', on_delete=models.SET_NULL, null=True, blank=True, related_name='doctors'
+    )
     availability = models.CharField(max_length=100, null=True) 
     phone = models.CharField(max_length=15, null=True)
 
+    objects = VersionedQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username} - {self.specialization}"
 
@@ -53,6 +84,195 @@ class Specialization(models.Model):
         return self.name
 
 
+class AppointmentSeries(models.Model):
+    """
+    A recurring booking, e.g. weekly physio or dialysis three times a week.
+    Occurrences are ordinary Appointment rows linked back through `series`.
+    """
+    FREQUENCY_CHOICES = [
+        ('Daily', 'Daily'),
+        ('Weekly', 'Weekly'),
+    ]
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    MAX_OCCURRENCES = 200
+
+    patient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='appointment_series'
+    )
+    doctor = models.ForeignKey(
+        'DoctorProfile',
+        on_delete=models.CASCADE,
+        related_name='appointment_series'
+    )
+    start_date = models.DateField()
+    time = models.TimeField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='Weekly')
+    interval = models.PositiveIntegerField(default=1)
+    # Comma separated weekday numbers (0 = Monday), only used for weekly series.
+    weekdays = models.CharField(max_length=20, blank=True)
+    occurrences = models.PositiveIntegerField(default=1)
+    duration_minutes = models.PositiveIntegerField(default=30)
+    is_virtual = models.BooleanField(default=False)
+    location = models.CharField(max_length=255, blank=True, null=True)
+    appointment_notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.frequency} series with Dr. {self.doctor.user.username} from {self.start_date}"
+
+    def weekday_list(self):
+        if not self.weekdays:
+            return [self.start_date.weekday()]
+        return sorted({int(day) for day in self.weekdays.split(',') if day.strip()})
+
+    def occurrence_dates(self):
+        """
+        Returns the dates of every occurrence, in order, without touching the database.
+        """
+        count = min(self.occurrences, self.MAX_OCCURRENCES)
+        interval = max(self.interval, 1)
+        dates = []
+        if self.frequency == 'Daily':
+            for i in range(count):
+                dates.append(self.start_date + timedelta(days=i * interval))
+            return dates
+
+        weekdays = self.weekday_list()
+        week_start = self.start_date - timedelta(days=self.start_date.weekday())
+        while len(dates) < count:
+            for weekday in weekdays:
+                day = week_start + timedelta(days=weekday)
+                if day >= self.start_date and len(dates) < count:
+                    dates.append(day)
+            week_start += timedelta(weeks=interval)
+        return dates
+
+    def build_appointments(self, dates=None):
+        return [
+            Appointment(
+                patient_id=self.patient_id,
+                doctor_id=self.doctor_id,
+                series=self,
+                date=day,
+                time=self.time,
+                duration_minutes=self.duration_minutes,
+                is_virtual=self.is_virtual,
+                location=self.location,
+                appointment_notes=self.appointment_notes,
+            )
+            for day in (dates if dates is not None else self.occurrence_dates())
+        ]
+
+    def find_conflicts(self, dates=None):
+        """
+        Returns the existing appointments of this doctor that overlap any occurrence.
+        All occurrences are checked with a single query.
+        """
+        dates = dates if dates is not None else self.occurrence_dates()
+        existing = Appointment.objects.all()
+        if self.pk:
+            existing = existing.exclude(series_id=self.pk)
+        return overlapping_appointments(existing, self.doctor_id, dates, self.time, self.duration_minutes)
+
+    def book(self):
+        """
+        Saves the series and creates every occurrence with one bulk insert.
+        Nothing is written if any occurrence conflicts; the conflicts are returned instead.
+        """
+        dates = self.occurrence_dates()
+        using = router.db_for_write(Appointment)
+        with transaction.atomic(using=using):
+            lock_doctor(self.doctor_id, using)
+            conflicts = self.find_conflicts(dates)
+            if conflicts:
+                return conflicts
+            self.save()
+            appointments = Appointment.objects.bulk_create(self.build_appointments(dates))
+            if date.today() in dates:
+                self._publish_today([appointment.pk for appointment in appointments
+                                     if appointment.date == date.today()], using)
+        self._invalidate_agendas(dates)
+        return []
+
+    def upcoming_appointments(self):
+        return self.appointments.filter(date__gte=date.today(), status='Scheduled')
+
+    def update_upcoming(self, **fields):
+        """
+        Applies field changes to every upcoming occurrence with one UPDATE.
+        """
+        upcoming = self.upcoming_appointments()
+        dates = list(upcoming.values_list('date', flat=True))
+        if date.today() in dates:
+            self._publish_today(upcoming.filter(date=date.today()).values_list('pk', flat=True), upcoming.db)
+        updated = upcoming.update(**fields)
+        self._invalidate_agendas(dates)
+        return updated
+
+    def _invalidate_agendas(self, dates):
+        # bulk_create() and update() send no signals, so the doctor's cached
+        # agendas for these days are dropped here instead.
+        from .agenda import invalidate
+        invalidate(self.doctor_id, dates)
+
+    def _publish_today(self, ids, using):
+        from .live import appointments_changed
+        appointments_changed(ids, using)
+
+    def cancel(self):
+        from .waitlist import release_slot
+        freed = list(self.upcoming_appointments())
+        canceled = self.update_upcoming(status='Canceled')
+        for appointment in freed:
+            release_slot(appointment)
+        return canceled
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def overlapping_appointments(appointments, doctor_id, dates, start_time, duration_minutes):
+    """
+    The doctor's appointments among `appointments` that are not canceled and
+    overlap `start_time` to `start_time + duration_minutes` on any of `dates`,
+    read with a single query.
+    """
+    start = _minutes(start_time)
+    end = start + duration_minutes
+    existing = (
+        appointments
+        .filter(doctor_id=doctor_id, date__in=dates)
+        .exclude(status='Canceled')
+        .only('id', 'date', 'time', 'duration_minutes', 'series_id')
+    )
+    return [
+        appointment for appointment in existing
+        if _minutes(appointment.time) < end
+        and start < _minutes(appointment.time) + appointment.duration_minutes
+    ]
+
+
+def lock_doctor(doctor_id, using):
+    """
+    Locks the doctor's row in `using` until the transaction ends, so that bookings
+    for one doctor check for conflicts and insert one at a time. SQLite has no row
+    locks, but it lets only one transaction write: a concurrent booking fails with
+    "database is locked" rather than double-booking.
+    """
+    list(DoctorProfile.objects.using(using).select_for_update().filter(pk=doctor_id).values_list('pk'))
+
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('Scheduled', 'Scheduled'),
@@ -77,11 +297,112 @@ class Appointment(models.Model):
     duration_minutes = models.PositiveIntegerField(default=30)
     is_virtual = models.BooleanField(default=False)
     location = models.CharField(max_length=255, blank=True, null=True)
+    series = models.ForeignKey(
+        AppointmentSeries,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='appointments'
+    )
+    # When the appointment was booked; unknown for appointments from before it was recorded.
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ChangeLogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'date'], name='appointment_doctor_date_idx'),
+            models.Index(fields=['date', 'status'], name='appointment_date_status_idx'),
+        ]
 
     def __str__(self):
         return f"Appointment with Dr. {self.doctor.user.username} on {self.date} at {self.time}"
 
 
+class AppointmentReminder(models.Model):
+    """
+    Dispatch state of the reminder for one appointment, written by
+    `manage.py send_appointment_reminders`. A run claims a row as Pending, with
+    its own `claim` token, before sending and sends only what it claimed, so a
+    concurrent run never reminds a patient twice. A claim left Pending by a run
+    that died is taken over once it is older than reminders.STALE_AFTER.
+    """
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Sent', 'Sent'),
+        ('Failed', 'Failed'),
+        ('Skipped', 'Skipped'),
+    ]
+
+    appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='reminder')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Token of the dispatch run that holds the row; see H_app/reminders.py.
+    claim = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reminder for appointment {self.appointment_id}: {self.status}"
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for an earlier slot with a doctor. Each doctor's waiting
+    entries form a priority queue (most urgent first, then first come) served
+    straight from the waitlist_queue_idx index; see H_app/waitlist.py.
+    """
+    URGENCY_CHOICES = [
+        (3, 'Urgent'),
+        (2, 'Soon'),
+        (1, 'Routine'),
+    ]
+    STATUS_CHOICES = [
+        ('Waiting', 'Waiting'),
+        ('Offered', 'Offered'),
+        ('Booked', 'Booked'),
+        ('Declined', 'Declined'),
+        ('Expired', 'Expired'),
+        ('Withdrawn', 'Withdrawn'),
+    ]
+
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='waitlist_entries')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='waitlist_entries')
+    urgency = models.PositiveSmallIntegerField(choices=URGENCY_CHOICES, default=1)
+    latest_date = models.DateField(null=True, blank=True, help_text="Only offer slots up to this date.")
+    notes = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Waiting')
+    requested_at = models.DateTimeField(default=timezone.now)
+
+    # The held slot while status is Offered.
+    offered_date = models.DateField(null=True, blank=True)
+    offered_time = models.TimeField(null=True, blank=True)
+    offered_duration_minutes = models.PositiveIntegerField(null=True, blank=True)
+    offered_location = models.CharField(max_length=255, blank=True, null=True)
+    offered_is_virtual = models.BooleanField(default=False)
+    offer_expires_at = models.DateTimeField(null=True, blank=True)
+    appointment = models.ForeignKey(
+        Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'status', '-urgency', 'requested_at'], name='waitlist_queue_idx'),
+            models.Index(fields=['status', 'offer_expires_at'], name='waitlist_hold_expiry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['patient', 'doctor'],
+                condition=models.Q(status__in=['Waiting', 'Offered']),
+                name='unique_open_waitlist_entry',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.patient.username} waiting for Dr. {self.doctor.user.username} ({self.status})"
+
+
 class MedicalRecord(models.Model):
     patient = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -99,10 +420,60 @@ class MedicalRecord(models.Model):
     allergies = models.CharField(max_length=255, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ChangeLogQuerySet.as_manager()
 
     def __str__(self):
         return f"Medical Record for {self.patient.username} by Dr. {self.doctor.user.username}"
 
+
+class AttachmentBlob(models.Model):
+    """
+    One stored file, addressed by the SHA-256 of its content. Identical uploads
+    share a blob; see H_app/attachments.py for the on-disk layout.
+    """
+    THUMBNAIL_STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Done', 'Done'),
+        ('Unsupported', 'Unsupported'),
+        ('Failed', 'Failed'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100)
+    thumbnail_status = models.CharField(max_length=12, choices=THUMBNAIL_STATUS_CHOICES, default='Pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['thumbnail_status'], name='blob_thumbnail_status_idx'),
+        ]
+
+    def __str__(self):
+        return self.sha256
+
+
+class MedicalRecordAttachment(models.Model):
+    # No database constraint and no cascade: archived records keep their
+    # attachments (ArchivedMedicalRecord.original_id is the record id).
+    record = models.ForeignKey(
+        MedicalRecord,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='attachments'
+    )
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, related_name='attachments')
+    filename = models.CharField(max_length=255)
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+'
+    )
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
 class Prescription(models.Model):
     patient = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -118,6 +489,9 @@ class Prescription(models.Model):
     dosage_instructions = models.TextField()
     medicines = models.TextField(null = True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ChangeLogQuerySet.as_manager()
 
     def __str__(self):
         return f"Prescription for {self.patient.username} by Dr. {self.doctor.user.username}"
@@ -137,6 +511,9 @@ class Billing(models.Model):
     )
     date_issued = models.DateTimeField(auto_now_add=True)
     payment_date = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = VersionedQuerySet.as_manager()
 
     def __str__(self):
         return f"Billing for {self.patient.username}: {self.total_amount} - {self.payment_status}"
@@ -146,10 +523,29 @@ class HealthEducationResource(models.Model):
     description = models.TextField()
     link = models.URLField(blank=True, null=True)
 
+    objects = VersionedQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
 
+class PatientResourceRecommendation(models.Model):
+    """
+    Top-N HealthEducationResource ids for a patient, best first. Written by
+    `manage.py build_resource_recommendations`; read with a single lookup on the dashboard.
+    """
+    patient = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='resource_recommendation'
+    )
+    resource_ids = models.JSONField(default=list)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Recommendations for {self.patient.username}"
+
+
 class Facility(models.Model):
     name = models.CharField(max_length=100)
     location = models.CharField(max_length=200)
@@ -157,6 +553,9 @@ class Facility(models.Model):
     resources = models.TextField(blank=True, null=True)
     resource_quantity = models.PositiveIntegerField(default=1)
     resource_available = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = VersionedQuerySet.as_manager()
 
 
     def __str__(self):
@@ -198,3 +597,216 @@ class Payment(models.Model):
 
 
 
+
+
+# Archive tables. Cold rows are moved here in batches by `manage.py archive_cold_rows`
+# so the hot tables above stay small; see H_app/archive.py.
+
+class ArchivedAppointment(models.Model):
+    original_id = models.BigIntegerField(unique=True)
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='+')
+    series_id = models.BigIntegerField(null=True, blank=True)
+    date = models.DateField()
+    time = models.TimeField()
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    appointment_notes = models.TextField(blank=True)
+    duration_minutes = models.PositiveIntegerField(default=30)
+    is_virtual = models.BooleanField(default=False)
+    location = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = VersionedQuerySet.as_manager()
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'date'], name='archived_appt_patient_idx'),
+            models.Index(fields=['doctor', 'date'], name='archived_appt_doctor_idx'),
+            models.Index(fields=['date'], name='archived_appt_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived appointment with Dr. {self.doctor.user.username} on {self.date} at {self.time}"
+
+
+class ArchivedMedicalRecord(models.Model):
+    original_id = models.BigIntegerField(unique=True)
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='+')
+    diagnosis = models.TextField()
+    treatment_plan = models.TextField()
+    medications = models.CharField(max_length=255, blank=True)
+    allergies = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_at'], name='archived_record_patient_idx'),
+        ]
+
+    @property
+    def attachments(self):
+        return MedicalRecordAttachment.objects.filter(record_id=self.original_id)
+
+    def __str__(self):
+        return f"Archived medical record for {self.patient.username} by Dr. {self.doctor.user.username}"
+
+
+class ArchivedPrescription(models.Model):
+    original_id = models.BigIntegerField(unique=True)
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='+')
+    medication_name = models.CharField(max_length=200)
+    dosage_instructions = models.TextField()
+    medicines = models.TextField(null=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_at'], name='archived_rx_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived prescription for {self.patient.username} by Dr. {self.doctor.user.username}"
+
+
+class AccessLogQuerySet(models.QuerySet):
+    def for_patient(self, patient):
+        return self.filter(patient=patient).order_by('-accessed_at')
+
+    def by_user(self, user):
+        return self.filter(user=user).order_by('-accessed_at')
+
+
+class AccessLogEntry(models.Model):
+    """
+    Append-only audit trail of reads of clinical records. Entries are buffered per
+    worker and written in batches by H_app/audit.py, so `accessed_at` is the time of
+    the request, not of the insert.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    view_name = models.CharField(max_length=100)
+    path = models.CharField(max_length=255)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    accessed_at = models.DateTimeField(default=timezone.now)
+
+    objects = AccessLogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'accessed_at'], name='access_log_patient_idx'),
+            models.Index(fields=['user', 'accessed_at'], name='access_log_user_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Access log entries cannot be changed.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Access log entries cannot be deleted.")
+
+    def __str__(self):
+        return f"{self.user_id} read {self.view_name} of patient {self.patient_id} at {self.accessed_at}"
+
+
+class DeletionJob(models.Model):
+    """
+    Removal of a deactivated user account, carried out in batches by
+    `manage.py process_deletion_jobs`; see H_app/deletion.py.
+    """
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Running', 'Running'),
+        ('Done', 'Done'),
+        ('Failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    username = models.CharField(max_length=150)
+    reassign_to = models.ForeignKey(
+        DoctorProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text="Doctor who takes over the removed doctor's appointments and records.",
+    )
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    step = models.CharField(max_length=100, blank=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='deletion_job_status_idx'),
+        ]
+
+    @property
+    def percent(self):
+        if self.status == 'Done':
+            return 100
+        return min(99, 100 * self.processed_rows // self.total_rows) if self.total_rows else 0
+
+    def __str__(self):
+        return f"Deletion of {self.username} ({self.status})"
+
+
+class CalendarFeed(models.Model):
+    """
+    The secret token of a user's iCalendar feed of their appointments; see H_app/ical.py.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True)
+    # When the current token was issued; resetting it revokes the old URL.
+    issued_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Calendar feed of {self.user}"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    One change to a row that offline clients keep; see H_app/changelog.py. Owners
+    are plain ids, not foreign keys, so that entries outlive the rows.
+    """
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('archive', 'Archive'),
+    ]
+
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTION_CHOICES)
+    patient_id = models.BigIntegerField(null=True)
+    doctor_id = models.BigIntegerField(null=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient_id', 'id'], name='changelog_patient_idx'),
+            models.Index(fields=['doctor_id', 'id'], name='changelog_doctor_idx'),
+            models.Index(fields=['changed_at'], name='changelog_changed_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model} {self.object_id}"
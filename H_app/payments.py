@@ -0,0 +1,18 @@
+"""
+Payment gateway clients, imported on first use.
+
+Importing the Stripe SDK is comparatively slow and payments are rare, so workers
+and management commands should not pay for it at startup.
+"""
+from django.conf import settings
+
+_stripe = None
+
+
+def get_stripe():
+    global _stripe
+    if _stripe is None:
+        import stripe
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        _stripe = stripe
+    return _stripe
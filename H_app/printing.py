@@ -0,0 +1,66 @@
+"""
+Printable prescriptions.
+
+A prescription is rendered once and stored under PRESCRIPTION_PRINT_ROOT, named
+by a SHA-256 of everything printed on it. The document is served from a URL that
+contains the hash, so it never changes and can be cached as immutable; editing
+the prescription changes the hash, and only then is it rendered again.
+"""
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .models import Prescription
+
+# Bump when prescription_print.html changes so stored documents are re-rendered.
+TEMPLATE_VERSION = 2
+
+PRINT_FIELDS = (
+    'id', 'patient_id', 'medication_name', 'dosage_instructions', 'medicines', 'created_at', 'updated_at',
+    'patient__username', 'patient__patient_profile__name', 'patient__patient_profile__age',
+    'doctor__name', 'doctor__user__username', 'doctor__specialization__name',
+)
+
+
+def print_root():
+    return getattr(settings, 'PRESCRIPTION_PRINT_ROOT', os.path.join(settings.BASE_DIR, 'printed_prescriptions'))
+
+
+def printable_row(pk):
+    return Prescription.objects.filter(pk=pk).values(*PRINT_FIELDS).first()
+
+
+def content_hash(row):
+    payload = json.dumps([TEMPLATE_VERSION, row], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def document_path(row, digest):
+    return os.path.join(print_root(), str(row['id']), f'{digest}.html')
+
+
+def get_document(row, digest):
+    """
+    Returns the path of the rendered document, rendering it on first use. Older
+    renderings of the same prescription are removed.
+    """
+    path = document_path(row, digest)
+    if os.path.exists(path):
+        return path
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    html = render_to_string('medical_records/prescription_print.html', {'prescription': row})
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(html)
+    os.replace(temporary, path)
+    for name in os.listdir(directory):
+        if name.endswith('.html') and name != os.path.basename(path):
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass  # Removed by a concurrent render.
+    return path
@@ -0,0 +1,35 @@
+"""
+Access to the profile attached to a user. With ProfileModelBackend the profiles
+of `request.user` are already loaded, so these helpers do not query the database
+unless a profile has to be created.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404
+
+from .models import DoctorProfile, PatientProfile
+
+
+def get_profile(user, kind):
+    """
+    Returns the user's 'patient', 'doctor' or 'admin' profile, or None.
+    """
+    try:
+        return getattr(user, f'{kind}_profile')
+    except ObjectDoesNotExist:
+        return None
+
+
+def get_profile_or_404(user, kind):
+    profile = get_profile(user, kind)
+    if profile is None:
+        raise Http404(f"No {kind} profile found.")
+    return profile
+
+
+def get_or_create_profile(user, kind):
+    profile = get_profile(user, kind)
+    if profile is None:
+        model = {'patient': PatientProfile, 'doctor': DoctorProfile}[kind]
+        profile = model.objects.create(user=user)
+        setattr(user, f'{kind}_profile', profile)
+    return profile
@@ -0,0 +1,97 @@
+"""
+Read-model projections for list pages.
+
+A Projection declares the columns a page renders, as {attribute: ORM lookup}. It
+reads them with one values_list() query and wraps each row in a namedtuple, so list
+pages neither instantiate models nor fetch text columns they do not display, and
+related columns come from the same query instead of lazy per-row lookups.
+Templates use the attribute names just like model attributes.
+"""
+from collections import namedtuple
+
+
+class Projection:
+    def __init__(self, typename, /, **columns):
+        self.row = namedtuple(typename, columns)
+        self.lookups = tuple(columns.values())
+
+    def __call__(self, queryset):
+        return self.wrap(self.values(queryset))
+
+    def values(self, queryset):
+        """
+        The rows as plain tuples, which unlike the namedtuples can be pickled into the cache.
+        """
+        return list(queryset.values_list(*self.lookups))
+
+    def wrap(self, values):
+        return list(map(self.row._make, values))
+
+    def iterate(self, queryset, chunk_size=500):
+        """
+        The rows one at a time, fetched from the database in chunks, for streamed responses.
+        """
+        return map(self.row._make, queryset.values_list(*self.lookups).iterator(chunk_size=chunk_size))
+
+
+BILLING_ROW = Projection(
+    'BillingRow',
+    id='id',
+    total_amount='total_amount',
+    payment_status='payment_status',
+    date_issued='date_issued',
+)
+
+APPOINTMENT_ROW = Projection(
+    'AppointmentRow',
+    id='id',
+    date='date',
+    time='time',
+    status='status',
+    doctor_username='doctor__user__username',
+)
+
+PRESCRIPTION_ROW = Projection(
+    'PrescriptionRow',
+    id='id',
+    medication_name='medication_name',
+    doctor_username='doctor__user__username',
+    created_at='created_at',
+)
+
+PATIENT_ROW = Projection(
+    'PatientRow',
+    id='id',
+    username='username',
+    email='email',
+    name='patient_profile__name',
+    phone='patient_profile__phone',
+)
+
+BOARD_ROW = Projection(
+    'BoardRow',
+    id='id',
+    time='time',
+    duration_minutes='duration_minutes',
+    status='status',
+    doctor='doctor__user__username',
+    patient='patient__username',
+    location='location',
+    is_virtual='is_virtual',
+)
+
+FEED_ROW = Projection(
+    'FeedRow',
+    id='id',
+    date='date',
+    time='time',
+    duration_minutes='duration_minutes',
+    status='status',
+    location='location',
+    is_virtual='is_virtual',
+    updated_at='updated_at',
+    doctor_name='doctor__name',
+    doctor_username='doctor__user__username',
+    patient_name='patient__patient_profile__name',
+    patient_username='patient__username',
+)
@@ -0,0 +1,190 @@
+"""
+Token-bucket rate limiting shared across worker processes through the cache.
+
+Each bucket is a single integer in the cache: the "virtual time" up to which tokens
+have been spent, in milli-tokens. Taking a token is one atomic `cache.incr`; the
+request is allowed while that value stays within `capacity` tokens of the refill
+clock (`rate * now`). Denied requests are refunded, so a bucket refills at `rate`
+no matter how hard it is hammered. With Redis or Memcached configured in CACHES
+every worker sees the same buckets; the local-memory fallback is per process.
+
+Limits are configured per scope in settings.RATELIMITS, e.g. {'login': '5/m'};
+a scope set to None is not limited. A request is counted against one bucket per
+key (client IP, signed-in user, attempted username) and only admitted if every
+bucket has a token; tokens taken before a refusal are given back. Buckets of
+attempted usernames hold KEY_RATE_FACTORS['username'] times the scope's rate (or
+RATELIMITS['<scope>-username']), so that nobody can lock a user out of their
+account from a single address: one IP runs out long before the username does.
+"""
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+SCALE = 1000
+KEY_RATE_FACTORS = {'username': 10}
+
+
+def parse_rate(rate):
+    """
+    '10/m' -> (10, 60): a bucket of 10 tokens refilled over 60 seconds.
+    """
+    count, _, period = rate.partition('/')
+    multiplier = ''.join(char for char in period if char.isdigit()) or '1'
+    unit = period.lstrip('0123456789')[:1] or 's'
+    return int(count), int(multiplier) * UNITS[unit]
+
+
+def scale_rate(rate, factor):
+    """
+    scale_rate('10/m', 10) -> '100/m'.
+    """
+    count, _, period = rate.partition('/')
+    return f'{int(count) * factor}/{period}'
+
+
+class TokenBucket:
+    def __init__(self, scope, rate):
+        self.scope = scope
+        self.capacity, period = parse_rate(rate)
+        self.rate = self.capacity / period
+        # An idle bucket is full again after this long, so its key may expire.
+        self.timeout = math.ceil(period) + 60
+
+    def _clock(self, now):
+        return int(now * self.rate * SCALE)
+
+    def _key(self, ident):
+        return f'ratelimit:{self.scope}:{hashlib.md5(ident.encode()).hexdigest()}'
+
+    def consume(self, ident, now=None):
+        """
+        Takes one token. Returns (allowed, retry_after_seconds).
+        """
+        now = time.time() if now is None else now
+        key = self._key(ident)
+        clock = self._clock(now)
+        # A missing key is a full bucket.
+        cache.add(key, clock - self.capacity * SCALE, self.timeout)
+        try:
+            spent = cache.incr(key, SCALE)
+        except ValueError:
+            # Evicted between add() and incr(); treat as a fresh bucket.
+            cache.add(key, clock - self.capacity * SCALE + SCALE, self.timeout)
+            return True, 0
+
+        if spent - SCALE < clock - self.capacity * SCALE:
+            self._clamp(key, spent, clock)
+        if spent <= clock:
+            cache.touch(key, self.timeout)
+            return True, 0
+        cache.decr(key, SCALE)
+        return False, max(1, math.ceil((spent - clock) / (self.rate * SCALE)))
+
+    def refund(self, ident):
+        """
+        Gives back a token taken by consume().
+        """
+        try:
+            cache.decr(self._key(ident), SCALE)
+        except ValueError:
+            pass
+
+    def _clamp(self, key, spent, clock):
+        # A bucket cannot hold more than `capacity` tokens: rebase an idle bucket
+        # to "full minus this request". Only one request per second may rebase it
+        # (cache.add is atomic), so concurrent callers never double-correct.
+        if cache.add(f'{key}:clamp', 1, 1):
+            cache.incr(key, clock - self.capacity * SCALE + SCALE - spent)
+
+
+def client_ip(request):
+    # Behind a reverse proxy set RATELIMIT_IP_HEADER, e.g. 'HTTP_X_FORWARDED_FOR'.
+    header = getattr(settings, 'RATELIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_user(request):
+    return f'user:{request.user.pk}' if request.user.is_authenticated else None
+
+
+def attempted_username(request):
+    # Anonymous logins are limited per attempted account as well.
+    username = request.POST.get('username')
+    return f'username:{username.lower()}' if username and not request.user.is_authenticated else None
+
+
+KEY_FUNCTIONS = {
+    'ip': client_ip,
+    'user': client_user,
+    'username': attempted_username,
+}
+
+
+def get_bucket(scope, default_rate, key=None):
+    rates = getattr(settings, 'RATELIMITS', {})
+    rate = rates.get(scope, default_rate)
+    if not rate:
+        return None
+    if key in KEY_RATE_FACTORS:
+        rate = rates.get(f'{scope}-{key}') or scale_rate(rate, KEY_RATE_FACTORS[key])
+        scope = f'{scope}-{key}'
+    return TokenBucket(scope, rate)
+
+
+def check(request, scope, rate, keys=('ip', 'user')):
+    """
+    Takes a token from every bucket that applies, or from none of them. Returns
+    the retry-after seconds of the first exhausted bucket, or 0 if the request
+    may proceed.
+    """
+    taken = []
+    for key in keys:
+        ident = KEY_FUNCTIONS[key](request)
+        if not ident:
+            continue
+        bucket = get_bucket(scope, rate, key)
+        if bucket is None:
+            return 0
+        ident = f'{key}:{ident}'
+        allowed, retry_after = bucket.consume(ident)
+        if not allowed:
+            for bucket, ident in taken:
+                bucket.refund(ident)
+            return retry_after
+        taken.append((bucket, ident))
+    return 0
+
+
+def too_many_requests(request, retry_after):
+    message = "Too many requests. Please try again later."
+    if request.headers.get('Accept', '').startswith('application/json'):
+        response = JsonResponse({"status": "error", "message": message}, status=429)
+    else:
+        response = HttpResponse(message, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(scope, rate, keys=('ip', 'user'), methods=('POST',)):
+    """
+    View decorator. `rate` is the default for `scope` and can be overridden in
+    settings.RATELIMITS. Only requests whose method is in `methods` are counted.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                retry_after = check(request, scope, rate, keys)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,147 @@
+"""
+Offline health resource recommendations.
+
+`build_index` turns every HealthEducationResource into a keyword inverted index
+(token -> {resource id: tf-idf weight}); `recommend_all` scores each patient's
+diagnoses and medical history against it and stores the top N resource ids in
+PatientResourceRecommendation. All text processing happens here, in the batch
+job, never at request time.
+
+Medical records live in the database of the branch that wrote them (see
+branches.py), so a patient's diagnoses are collected from every database.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.utils import timezone
+
+from .branches import databases, use_database
+from .models import (
+    CustomUser, HealthEducationResource, MedicalRecord, PatientProfile, PatientResourceRecommendation
+)
+
+DEFAULT_TOP_N = 5
+DEFAULT_CHUNK_SIZE = 1000
+TITLE_WEIGHT = 2
+
+TOKEN_RE = re.compile(r'[a-z]{3,}')
+STOPWORDS = frozenset("""
+    about after also and any are been before being but can could did does for from had has have
+    her him his how into its may more most not now off once only other our out over own same she
+    should some such than that the their them then there these they this those through too under
+    until very was were what when where which while who why will with would you your patient
+    patients history treatment plan none
+""".split())
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall((text or '').lower()):
+        if token in STOPWORDS:
+            continue
+        # Cheap plural folding so "migraines" matches "migraine".
+        if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def build_index():
+    """
+    Returns the inverted index {token: {resource_id: weight}} over titles and descriptions.
+    """
+    term_counts = {}
+    document_frequency = Counter()
+    resources = HealthEducationResource.objects.values_list('id', 'title', 'description')
+    for resource_id, title, description in resources.iterator():
+        counts = Counter(tokenize(description))
+        for token in tokenize(title):
+            counts[token] += TITLE_WEIGHT
+        term_counts[resource_id] = counts
+        document_frequency.update(counts.keys())
+
+    total = len(term_counts)
+    index = defaultdict(dict)
+    for resource_id, counts in term_counts.items():
+        length = math.sqrt(sum(count * count for count in counts.values())) or 1
+        for token, count in counts.items():
+            idf = math.log(1 + total / document_frequency[token])
+            index[token][resource_id] = count / length * idf
+    return index
+
+
+def score(index, tokens, top_n=DEFAULT_TOP_N):
+    scores = defaultdict(float)
+    for token, count in Counter(tokens).items():
+        for resource_id, weight in index.get(token, {}).items():
+            scores[resource_id] += weight * count
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [resource_id for resource_id, _ in ranked[:top_n]]
+
+
+def _patient_tokens(patient_ids):
+    tokens = defaultdict(list)
+    profiles = PatientProfile.objects.filter(user_id__in=patient_ids).values_list('user_id', 'medical_history')
+    for patient_id, medical_history in profiles:
+        tokens[patient_id].extend(tokenize(medical_history))
+    for alias in databases():
+        with use_database(alias):
+            records = MedicalRecord.objects.filter(patient_id__in=patient_ids).values_list('patient_id', 'diagnosis')
+            for patient_id, diagnosis in records:
+                tokens[patient_id].extend(tokenize(diagnosis))
+    return tokens
+
+
+def recommend_all(top_n=DEFAULT_TOP_N, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recomputes recommendations for every patient, `chunk_size` patients at a time.
+    Returns the number of patients processed.
+    """
+    index = build_index()
+    patient_ids = CustomUser.objects.filter(user_type='patient').order_by('id').values_list('id', flat=True)
+    processed = 0
+    chunk = []
+    for patient_id in patient_ids.iterator(chunk_size=chunk_size):
+        chunk.append(patient_id)
+        if len(chunk) == chunk_size:
+            processed += _store_chunk(index, chunk, top_n)
+            chunk = []
+    if chunk:
+        processed += _store_chunk(index, chunk, top_n)
+    return processed
+
+
+def _store_chunk(index, patient_ids, top_n):
+    tokens = _patient_tokens(patient_ids)
+    now = timezone.now()
+    PatientResourceRecommendation.objects.bulk_create(
+        [
+            PatientResourceRecommendation(
+                patient_id=patient_id,
+                resource_ids=score(index, tokens.get(patient_id, ()), top_n),
+                computed_at=now,
+            )
+            for patient_id in patient_ids
+        ],
+        update_conflicts=True,
+        unique_fields=['patient'],
+        update_fields=['resource_ids', 'computed_at'],
+    )
+    return len(patient_ids)
+
+
+def recommended_resources(user):
+    """
+    Request-time read: one indexed lookup for the ids, one primary-key fetch for the rows.
+    """
+    resource_ids = (
+        PatientResourceRecommendation.objects
+        .filter(patient=user)
+        .values_list('resource_ids', flat=True)
+        .first()
+    )
+    if not resource_ids:
+        return []
+    resources = HealthEducationResource.objects.in_bulk(resource_ids)
+    return [resources[resource_id] for resource_id in resource_ids if resource_id in resources]
@@ -0,0 +1,181 @@
+"""
+Appointment reminders.
+
+Upcoming appointments are read through the (date, status) index ordered by
+patient, so each patient gets one message listing all of their appointments in the
+window. Messages are rendered and sent `chunk_size` patients at a time through a
+Django email backend (console, file or SMTP); only one chunk is held in memory,
+and each chunk is read completely before its claims are written.
+Every appointment is claimed in AppointmentReminder before its message is sent:
+a run inserts its claim where no reminder row exists, or takes over a Failed row
+with a conditional UPDATE, marking the rows with its own claim token. It then
+sends only the appointments whose rows carry its token, so runs that overlap
+never remind anybody twice. A Pending claim older than STALE_AFTER belongs to a
+run that died between claiming and recording the outcome, and is taken over the
+same way.
+"""
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Appointment, AppointmentReminder
+
+DEFAULT_CHUNK_SIZE = 500
+ID_BATCH_SIZE = 900
+STALE_AFTER = timedelta(minutes=30)
+
+BACKENDS = {
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+}
+
+REMINDER_FIELDS = (
+    'id', 'patient_id', 'patient__email', 'patient__username', 'patient__patient_profile__name',
+    'doctor__name', 'doctor__user__username', 'date', 'time', 'is_virtual', 'location',
+)
+
+
+def get_backend(name=None):
+    """
+    `name` is 'console', 'file', 'smtp' or a backend path; defaults to settings.REMINDER_EMAIL_BACKEND.
+    """
+    name = name or getattr(settings, 'REMINDER_EMAIL_BACKEND', 'console')
+    path = BACKENDS.get(name, name)
+    if path == BACKENDS['file']:
+        return get_connection(path, file_path=getattr(settings, 'REMINDER_FILE_PATH', 'sent_reminders'))
+    return get_connection(path)
+
+
+def retryable(now, prefix=''):
+    """
+    Reminder rows a run may take over: failed ones and stale claims. `prefix`
+    is the path to the reminder when filtering appointments.
+    """
+    stale = Q(**{f'{prefix}claimed_at__lt': now - STALE_AFTER}) | Q(**{f'{prefix}claimed_at__isnull': True})
+    return Q(**{f'{prefix}status': 'Failed'}) | (Q(**{f'{prefix}status': 'Pending'}) & stale)
+
+
+def due_appointments(start, end, now=None):
+    """
+    Scheduled or confirmed appointments from `start` to `end` that have not been
+    reminded yet; failed reminders and stale claims are retried.
+    """
+    return (
+        Appointment.objects
+        .filter(date__range=(start, end), status__in=['Scheduled', 'Confirmed'])
+        .filter(Q(reminder__isnull=True) | retryable(now or timezone.now(), 'reminder__'))
+    )
+
+
+def render_reminder(rows):
+    patient = rows[0]
+    # Formatted here rather than with the |date filter, which dominated render time.
+    appointments = [
+        {
+            'when': f"{row['date']:%A}, {row['date'].day} {row['date']:%B %Y} at {row['time']:%H:%M}",
+            'doctor': row['doctor__name'] or row['doctor__user__username'],
+            'where': 'virtual' if row['is_virtual'] else row['location'],
+        }
+        for row in rows
+    ]
+    return EmailMessage(
+        subject="Your upcoming appointments",
+        body=render_to_string('emails/appointment_reminder.txt', {
+            'name': patient['patient__patient_profile__name'] or patient['patient__username'],
+            'appointments': appointments,
+        }),
+        from_email=getattr(settings, 'REMINDER_FROM_EMAIL', settings.DEFAULT_FROM_EMAIL),
+        to=[patient['patient__email']],
+    )
+
+
+class ReminderDispatcher:
+    def __init__(self, connection=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.connection = connection or get_backend()
+        self.chunk_size = chunk_size
+        self.counts = {'Sent': 0, 'Failed': 0, 'Skipped': 0}
+
+    def run(self, start, end):
+        due = due_appointments(start, end)
+        last_patient_id = 0
+        while True:
+            # Keyset pagination by patient: every chunk is a finished query, so no
+            # cursor is open while dispatch() writes the claims.
+            patient_ids = list(
+                due.filter(patient_id__gt=last_patient_id)
+                .order_by('patient_id').values_list('patient_id', flat=True).distinct()[:self.chunk_size]
+            )
+            if not patient_ids:
+                return self.counts
+            last_patient_id = patient_ids[-1]
+            rows = (
+                due.filter(patient_id__in=patient_ids)
+                .order_by('patient_id', 'date', 'time')
+                .values(*REMINDER_FIELDS)
+            )
+            self.dispatch([list(patient_rows) for _, patient_rows in groupby(rows, key=lambda row: row['patient_id'])])
+
+    def dispatch(self, chunk):
+        """
+        Claims, sends and records one chunk; `chunk` is a list of per-patient row lists.
+        Appointments claimed by another run meanwhile are left to it.
+        """
+        token = uuid.uuid4().hex
+        claimed = self._claim([row['id'] for rows in chunk for row in rows], token)
+        outcome = {'Sent': [], 'Failed': [], 'Skipped': []}
+        with self.connection:
+            for rows in chunk:
+                rows = [row for row in rows if row['id'] in claimed]
+                if not rows:
+                    continue
+                ids = [row['id'] for row in rows]
+                if not rows[0]['patient__email']:
+                    outcome['Skipped'] += ids
+                    continue
+                try:
+                    self.connection.send_messages([render_reminder(rows)])
+                except Exception:
+                    outcome['Failed'] += ids
+                else:
+                    outcome['Sent'] += ids
+        for status, ids in outcome.items():
+            self._record(ids, status, token)
+            self.counts[status] += len(ids)
+
+    def _claim(self, appointment_ids, token):
+        """
+        Marks the appointments' reminders Pending with `token` where no live run
+        holds them; returns the ids this run now owns.
+        """
+        now = timezone.now()
+        AppointmentReminder.objects.bulk_create(
+            [AppointmentReminder(appointment_id=appointment_id, claim=token, claimed_at=now)
+             for appointment_id in appointment_ids],
+            ignore_conflicts=True,
+        )
+        claimed = set()
+        for start in range(0, len(appointment_ids), ID_BATCH_SIZE):
+            batch = appointment_ids[start:start + ID_BATCH_SIZE]
+            AppointmentReminder.objects.filter(retryable(now), appointment_id__in=batch).update(
+                status='Pending', claim=token, claimed_at=now, sent_at=None,
+            )
+            claimed.update(
+                AppointmentReminder.objects
+                .filter(appointment_id__in=batch, status='Pending', claim=token)
+                .values_list('appointment_id', flat=True)
+            )
+        return claimed
+
+    def _record(self, appointment_ids, status, token):
+        sent_at = timezone.now() if status == 'Sent' else None
+        for start in range(0, len(appointment_ids), ID_BATCH_SIZE):
+            AppointmentReminder.objects.filter(
+                appointment_id__in=appointment_ids[start:start + ID_BATCH_SIZE], claim=token,
+            ).update(status=status, sent_at=sent_at)
@@ -0,0 +1,126 @@
+"""
+Type-ahead lookup of users by username, patient name and phone number.
+
+Every searchable word is normalized (lower case, accents stripped, phone numbers
+reduced to digits) and all of its prefixes are stored in UserSearchTerm. A query is
+then an equality probe on the (prefix, user) unique index per query word, and hot
+prefixes are additionally kept in the cache for a short time.
+"""
+import re
+import unicodedata
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CustomUser, UserSearchTerm
+
+MAX_PREFIX_LENGTH = 20
+MAX_RESULTS = 20
+CACHE_TIMEOUT = 30
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return WORD_RE.findall(text.lower())
+
+
+def prefixes(word):
+    return {word[:length] for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1)}
+
+
+def terms_for(username, name=None, phone=None):
+    words = normalize(username) + normalize(name)
+    digits = re.sub(r'\D', '', phone or '')
+    if digits:
+        words.append(digits)
+        if len(digits) > 10:
+            # Also match the national number without the country code.
+            words.append(digits[-10:])
+    terms = set()
+    for word in words:
+        terms |= prefixes(word)
+    return terms
+
+
+def index_user(user_id):
+    """
+    Rebuilds the search terms of one user. Called from post_save signals.
+    """
+    row = (
+        CustomUser.objects
+        .filter(id=user_id)
+        .values_list('username', 'patient_profile__name', 'patient_profile__phone')
+        .first()
+    )
+    with transaction.atomic():
+        UserSearchTerm.objects.filter(user_id=user_id).delete()
+        if row:
+            UserSearchTerm.objects.bulk_create(
+                [UserSearchTerm(prefix=term, user_id=user_id) for term in terms_for(*row)]
+            )
+
+
+def rebuild_index(chunk_size=2000):
+    """
+    Rebuilds the whole index; used for backfills. Returns the number of users indexed.
+    """
+    UserSearchTerm.objects.all().delete()
+    rows = (
+        CustomUser.objects
+        .order_by('id')
+        .values_list('id', 'username', 'patient_profile__name', 'patient_profile__phone')
+    )
+    batch = []
+    count = 0
+    for user_id, username, name, phone in rows.iterator(chunk_size=chunk_size):
+        batch.extend(UserSearchTerm(prefix=term, user_id=user_id) for term in terms_for(username, name, phone))
+        count += 1
+        if len(batch) >= chunk_size * 10:
+            UserSearchTerm.objects.bulk_create(batch)
+            batch = []
+    UserSearchTerm.objects.bulk_create(batch)
+    return count
+
+
+def search_users(query, user_type=None, limit=MAX_RESULTS):
+    words = [word[:MAX_PREFIX_LENGTH] for word in normalize(query)]
+    digits = re.sub(r'\D', '', query or '')
+    if digits and len(words) > 1 and ''.join(words) == digits:
+        # "555 123 4567" is one phone number, not three words.
+        words = [digits[:MAX_PREFIX_LENGTH]]
+    if not words:
+        return []
+
+    cache_key = f"typeahead:{user_type or 'all'}:{limit}:{'+'.join(words)}"
+    results = cache.get(cache_key)
+    if results is not None:
+        return results
+
+    users = CustomUser.objects.all()
+    for word in words:
+        users = users.filter(
+            id__in=UserSearchTerm.objects.filter(prefix=word).values('user_id')
+        )
+    if user_type:
+        users = users.filter(user_type=user_type)
+    results = list(
+        users.order_by('username').values(
+            'id', 'username', 'user_type', 'patient_profile__name', 'patient_profile__phone'
+        )[:limit]
+    )
+    results = [
+        {
+            'id': row['id'],
+            'username': row['username'],
+            'user_type': row['user_type'],
+            'name': row['patient_profile__name'],
+            'phone': row['patient_profile__phone'],
+        }
+        for row in results
+    ]
+    cache.set(cache_key, results, CACHE_TIMEOUT)
+    return results
+
@@ -0,0 +1,186 @@
+from datetime import date
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import agenda, archive, branches, changelog, ical, live, search, versioned_cache, waitlist
+from .models import (
+    AdminProfile, Appointment, ArchivedAppointment, AttachmentBlob, Billing, CalendarFeed, CustomUser, DoctorProfile,
+    Facility, HealthEducationResource, MedicalRecord, PatientProfile, Prescription, Specialization,
+)
+
+# Generation counters for the cached values declared with versioned_cache.CachedValue.
+versioned_cache.track(Appointment, owners=['doctor', 'patient'])
+versioned_cache.track(ArchivedAppointment)
+versioned_cache.track(Billing, owners=['patient'])
+versioned_cache.track(DoctorProfile)
+versioned_cache.track(Facility)
+versioned_cache.track(Specialization)
+versioned_cache.track(HealthEducationResource)
+versioned_cache.track(CalendarFeed)
+# Cached pages show usernames and emails. A new user is not on any of them yet,
+# and logins only touch last_login.
+versioned_cache.track(CustomUser, ignore_fields=['last_login'], on_create=False)
+
+# Rows that offline clients keep; see changelog.py and sync.py.
+changelog.log(Appointment)
+changelog.log(MedicalRecord)
+changelog.log(Prescription)
+changelog.log(PatientProfile, patient='user', doctor=None)
+
+
+@receiver(post_save, sender=CustomUser)
+def index_user_on_save(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login only; nothing searchable changed.
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    search.index_user(instance.pk)
+
+
+@receiver(post_save, sender=PatientProfile)
+def index_patient_profile_on_save(sender, instance, **kwargs):
+    search.index_user(instance.user_id)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_state(sender, instance, **kwargs):
+    # A moved appointment has to leave the agenda it was on as well, and only a
+    # change to Canceled frees its slot.
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = (
+            Appointment.objects.filter(pk=instance.pk).values_list('doctor_id', 'date', 'status').first()
+        )
+
+
+@receiver(post_save, sender=Appointment)
+def invalidate_agenda_on_save(sender, instance, using, **kwargs):
+    agenda.invalidate(instance.doctor_id, [instance.date], using)
+    previous = getattr(instance, '_previous_state', None)
+    if previous and previous[:2] != (instance.doctor_id, instance.date):
+        agenda.invalidate(previous[0], [previous[1]], using)
+
+
+@receiver(post_save, sender=Appointment)
+def offer_canceled_slot(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    if previous and previous[2] != 'Canceled' and instance.status == 'Canceled':
+        waitlist.release_slot(instance)
+
+
+@receiver(post_delete, sender=Appointment)
+def invalidate_agenda_on_delete(sender, instance, using, **kwargs):
+    agenda.invalidate(instance.doctor_id, [instance.date], using)
+
+
+@receiver(post_delete, sender=Appointment)
+def offer_deleted_slot(sender, instance, **kwargs):
+    if instance.status != 'Canceled':
+        waitlist.release_slot(instance)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def publish_to_live_board(sender, instance, using, **kwargs):
+    today = date.today()
+    previous = getattr(instance, '_previous_state', None)
+    if instance.date == today or (previous and previous[1] == today):
+        live.appointments_changed([instance.pk], using)
+
+
+@receiver(post_save, sender=Prescription)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def invalidate_agenda_flags(sender, instance, using, **kwargs):
+    agenda.invalidate_for_patient(instance.doctor_id, instance.patient_id, using)
+
+
+@receiver(archive.rows_archived, sender=Appointment)
+def invalidate_agenda_on_archive(sender, rows, using, **kwargs):
+    agenda.invalidate_slots(((row['doctor_id'], row['date']) for row in rows), using)
+
+
+@receiver(archive.rows_archived, sender=Prescription)
+@receiver(archive.rows_archived, sender=MedicalRecord)
+def invalidate_agenda_flags_on_archive(sender, rows, using, **kwargs):
+    agenda.invalidate_for_patients(((row['doctor_id'], row['patient_id']) for row in rows), using)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=PatientProfile)
+def invalidate_agenda_on_patient_change(sender, instance, created, using, update_fields=None, raw=False, **kwargs):
+    # New users and profiles are on no agenda yet; logins only touch last_login.
+    if created or raw:
+        return
+    if update_fields is not None and not set(update_fields) & agenda.PATIENT_FIELDS[sender._meta.model_name]:
+        return
+    agenda.invalidate_patient(instance.pk if sender is CustomUser else instance.user_id, using)
+
+
+@receiver(archive.rows_archived)
+def bump_generations_on_archive(sender, rows, using, **kwargs):
+    versioned_cache.bump_rows(sender, rows, using)
+
+
+@receiver(archive.rows_archived)
+def log_archived_rows(sender, rows, using, **kwargs):
+    changelog.archived(sender, rows, using)
+
+
+@receiver(pre_save, sender=CustomUser)
+@receiver(pre_save, sender=DoctorProfile)
+@receiver(pre_save, sender=PatientProfile)
+def remember_feed_name(sender, instance, using, update_fields=None, **kwargs):
+    ical.remember_name(sender, instance, using, update_fields)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_save, sender=PatientProfile)
+def refresh_feeds_on_rename(sender, instance, using, raw=False, **kwargs):
+    if not raw and getattr(instance, '_feed_name_changed', False):
+        ical.renamed(sender, instance, using)
+
+
+@receiver(post_delete, sender=DoctorProfile)
+@receiver(post_delete, sender=PatientProfile)
+def refresh_feeds_on_profile_delete(sender, instance, using, **kwargs):
+    # Events fall back to the username.
+    if using == DEFAULT_DB_ALIAS:
+        ical.renamed(sender, instance, using)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_save, sender=Specialization)
+@receiver(post_save, sender=AttachmentBlob)
+def replicate_directory_row(sender, instance, update_fields=None, **kwargs):
+    if not branches.branch_databases():
+        return
+    # Logins save last_login only, which no branch database reads.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    branches.replicate(instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=PatientProfile)
+@receiver(post_delete, sender=DoctorProfile)
+@receiver(post_delete, sender=Specialization)
+@receiver(post_delete, sender=AttachmentBlob)
+def delete_directory_row(sender, instance, using, **kwargs):
+    # Deletes cascading inside a branch database come back through here as well.
+    if using == DEFAULT_DB_ALIAS and branches.branch_databases():
+        branches.replicate_delete(instance)
+
+
+@receiver(post_save, sender=AdminProfile)
+def assign_admin_branch(sender, instance, **kwargs):
+    branch = branches.branch_for_department(instance.department)
+    user = instance.user
+    if branch is not None and user.branch != branch:
+        user.branch = branch
+        user.save(update_fields=['branch'])
@@ -0,0 +1,191 @@
+"""
+Delta sync for offline clients such as ward tablets.
+
+GET /api/v1/sync/ returns everything the user keeps offline, with a cursor.
+From then on GET /api/v1/sync/?since=<cursor> returns only what changed, read
+from the change log (changelog.py) and compacted: every changed row once, as it
+is now ("upserts"), or just its id if it was deleted or no longer belongs to
+the user ("deletes") or was archived ("archived": still on record, but no
+longer kept offline). A client back after an hour offline downloads the rows
+changed in that hour, not its whole dataset.
+
+Doctors keep their appointments, medical records and prescriptions and the
+profiles of their patients; patients keep their own. A reply covers at most
+MAX_ENTRIES log entries; while has_more is true the client asks again with the
+new cursor. A cursor older than the retained log (see prune_change_log) or from
+another database gets a new snapshot with reset=true, which replaces the
+client's data.
+"""
+from django.db.models import Max, Min, Q
+from django.http import JsonResponse
+
+from .api import RESOURCES, decode_cursor, encode_cursor
+from .branches import current_database
+from .models import Appointment, ChangeLogEntry, DoctorProfile, MedicalRecord, PatientProfile, Prescription
+
+MAX_ENTRIES = 2000
+ID_BATCH_SIZE = 900
+
+PROFILE_FIELDS = (
+    'id', 'user_id', 'name', 'age', 'phone', 'address', 'medications', 'medical_history', 'treatment_plans',
+)
+
+
+def _patients_of(doctor_id):
+    return (
+        Q(user_id__in=Appointment.objects.filter(doctor_id=doctor_id).values('patient_id'))
+        | Q(user_id__in=MedicalRecord.objects.filter(doctor_id=doctor_id).values('patient_id'))
+        | Q(user_id__in=Prescription.objects.filter(doctor_id=doctor_id).values('patient_id'))
+    )
+
+
+class SyncSet:
+    """
+    One kind of row kept offline: `name` in the reply, the logged model and the
+    columns sent.
+    """
+
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model = model
+        self.model_name = model._meta.model_name
+        self.fields = tuple(fields)
+
+    def queryset_for(self, user, doctor_id):
+        return RESOURCES[self.name].queryset_for(user)
+
+    def related_ids(self, doctor_id, changes):
+        """
+        Ids of rows to send along with the changes collected so far, changed or not.
+        """
+        return set()
+
+    def rows(self, user, doctor_id, ids=None):
+        queryset = self.queryset_for(user, doctor_id)
+        if ids is None:
+            return list(queryset.order_by('pk').values(*self.fields))
+        ids = sorted(ids)
+        rows = []
+        for start in range(0, len(ids), ID_BATCH_SIZE):
+            rows += queryset.filter(pk__in=ids[start:start + ID_BATCH_SIZE]).values(*self.fields)
+        return rows
+
+
+class ProfileSyncSet(SyncSet):
+    def queryset_for(self, user, doctor_id):
+        # Profiles are copied to every branch database, next to the rows that
+        # decide which of them a doctor keeps.
+        profiles = PatientProfile.objects.using(current_database())
+        if doctor_id is not None:
+            return profiles.filter(_patients_of(doctor_id))
+        return profiles.filter(user=user)
+
+    def related_ids(self, doctor_id, changes):
+        # A doctor's new patients come with their profiles.
+        if doctor_id is None:
+            return set()
+        patient_ids = {row['patient_id'] for name in ('appointments', 'medical-records', 'prescriptions')
+                       for row in changes[name]['upserts']}
+        if not patient_ids:
+            return set()
+        return set(
+            PatientProfile.objects.using(current_database())
+            .filter(user_id__in=patient_ids).values_list('pk', flat=True)
+        )
+
+
+SYNC_SETS = [
+    SyncSet('appointments', Appointment, RESOURCES['appointments'].fields),
+    SyncSet('medical-records', MedicalRecord, RESOURCES['medical-records'].fields),
+    SyncSet('prescriptions', Prescription, RESOURCES['prescriptions'].fields),
+    ProfileSyncSet('patient-profiles', PatientProfile, PROFILE_FIELDS),
+]
+
+
+def visible_entries(user, doctor_id):
+    if doctor_id is None:
+        return ChangeLogEntry.objects.filter(patient_id=user.pk)
+    profiles_of_patients = Q(model='patientprofile', patient_id__in=PatientProfile.objects.using(
+        current_database()).filter(_patients_of(doctor_id)).values('user_id'))
+    return ChangeLogEntry.objects.filter(Q(doctor_id=doctor_id) | profiles_of_patients)
+
+
+def snapshot(user, doctor_id):
+    return {
+        sync_set.name: {'upserts': sync_set.rows(user, doctor_id), 'deletes': [], 'archived': []}
+        for sync_set in SYNC_SETS
+    }
+
+
+def delta(user, doctor_id, since, latest):
+    """
+    (changes, cursor, has_more) for the log entries after `since`, up to `latest`.
+    """
+    entries = list(
+        visible_entries(user, doctor_id)
+        .filter(id__gt=since, id__lte=latest)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'action')[:MAX_ENTRIES + 1]
+    )
+    has_more = len(entries) > MAX_ENTRIES
+    entries = entries[:MAX_ENTRIES]
+    # Invisible entries up to `latest` are skipped along with the rest.
+    cursor = entries[-1][0] if has_more else latest
+
+    changed = {sync_set.model_name: set() for sync_set in SYNC_SETS}
+    archived = {sync_set.model_name: set() for sync_set in SYNC_SETS}
+    for _, model_name, object_id, action in entries:
+        changed[model_name].add(object_id)
+        # The last change to a row decides.
+        if action == 'archive':
+            archived[model_name].add(object_id)
+        else:
+            archived[model_name].discard(object_id)
+    changes = {}
+    for sync_set in SYNC_SETS:
+        ids = changed[sync_set.model_name]
+        related = sync_set.related_ids(doctor_id, changes)
+        rows = sync_set.rows(user, doctor_id, ids | related) if ids or related else []
+        gone = ids - {row['id'] for row in rows}
+        changes[sync_set.name] = {
+            'upserts': rows,
+            'deletes': sorted(gone - archived[sync_set.model_name]),
+            'archived': sorted(gone & archived[sync_set.model_name]),
+        }
+    return changes, cursor, has_more
+
+
+def sync(request):
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({'error': 'Method not allowed.'}, status=405)
+    user = request.user
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required.'}, status=401)
+    if user.user_type not in ('doctor', 'patient'):
+        return JsonResponse({'error': 'Sync is available to doctors and patients.'}, status=403)
+    doctor_id = None
+    if user.user_type == 'doctor':
+        doctor_id = DoctorProfile.objects.filter(user=user).values_list('pk', flat=True).first()
+        if doctor_id is None:
+            return JsonResponse({'error': 'Complete your doctor profile first.'}, status=403)
+    try:
+        since = decode_cursor(request.GET['since']) if request.GET.get('since') else None
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+
+    # Read before the rows, so that changes made meanwhile are sent again next time.
+    bounds = ChangeLogEntry.objects.aggregate(first=Min('id'), last=Max('id'))
+    latest = bounds['last'] or 0
+    reset = since is None or since > latest or (bounds['first'] is not None and since < bounds['first'] - 1)
+    if reset:
+        changes, cursor, has_more = snapshot(user, doctor_id), latest, False
+    else:
+        changes, cursor, has_more = delta(user, doctor_id, since, latest)
+    response = JsonResponse({
+        'reset': reset,
+        'cursor': encode_cursor(cursor),
+        'has_more': has_more,
+        'changes': changes,
+    })
+    response['Cache-Control'] = 'private, no-store'
+    return response
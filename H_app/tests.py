@@ -1,3 +1,1481 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import importlib
+import io
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import zlib
+from datetime import date, time, timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import get_connection
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.signals import post_delete
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    agenda, api, archive, attachments, audit, branches, changelog, compression, deletion, ical, live, payments,
+    printing, profiles, ratelimit, recommendations, reminders, search, sync, waitlist,
+)
+from .audit import AuditBuffer
+from .backends import ProfileModelBackend
+from .benchmarks import HttpSession, summarize
+from .branches import use_database
+from .management.commands import loadtest
+from .models import (
+    AccessLogEntry, Appointment, AppointmentReminder, AppointmentSeries, ArchivedAppointment, ArchivedMedicalRecord,
+    AttachmentBlob, ChangeLogEntry, CustomUser, DeletionJob, DoctorProfile, HealthEducationResource, MedicalRecord,
+    MedicalRecordAttachment, PatientProfile, Prescription, Specialization, UserSearchTerm, WaitlistEntry,
+)
+from .projections import APPOINTMENT_ROW, PATIENT_ROW, PRESCRIPTION_ROW
+from .reminders import REMINDER_FIELDS, ReminderDispatcher, due_appointments
+from .versioned_cache import CachedValue, check_shared_cache, generation, owner_key
+
+
+def make_doctor(username='doctor', **fields):
+    user = CustomUser.objects.create_user(username, user_type='doctor')
+    return DoctorProfile.objects.create(user=user, name=fields.pop('name', username.title()), **fields)
+
+
+def make_patient(username='patient', email='', **fields):
+    user = CustomUser.objects.create_user(username, email, user_type='patient')
+    PatientProfile.objects.create(user=user, name=fields.pop('name', username.title()), **fields)
+    return user
+
+
+def make_admin(username='admin'):
+    return CustomUser.objects.create_user(username, user_type='admin', is_staff=True)
+
+
+class LiveBoardTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+
+    def test_board_has_a_list_for_every_status(self):
+        self.client.force_login(make_admin())
+        response = self.client.get(reverse('live_board'))
+        for status in ('Scheduled', 'Confirmed', 'Completed', 'Canceled'):
+            self.assertContains(response, f'data-status="{status}"')
+
+    def test_confirming_publishes_the_confirmed_row(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=date.today(), time=time(9)
+        )
+        self.client.force_login(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('confirm_booking', args=[appointment.pk]))
+        change = live.changes('default', [appointment.pk])
+        self.assertEqual([row['status'] for row in change['appointments']], ['Confirmed'])
+        self.assertEqual(change['removed'], [])
+
+    def test_changes_list_rows_moved_off_today_as_removed(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=date.today() + timedelta(days=1), time=time(9)
+        )
+        self.assertEqual(live.changes('default', [appointment.pk]), {'appointments': [], 'removed': [appointment.pk]})
+
+
+class ReminderDispatcherTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient(email='patient@example.com')
+        self.tomorrow = date.today() + timedelta(days=1)
+        self.appointments = [
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=self.tomorrow, time=time(hour))
+            for hour in (9, 11)
+        ]
+
+    def dispatcher(self):
+        return ReminderDispatcher(get_connection('django.core.mail.backends.locmem.EmailBackend'))
+
+    def due_chunk(self):
+        rows = list(due_appointments(self.tomorrow, self.tomorrow).order_by('time').values(*REMINDER_FIELDS))
+        return [rows] if rows else []
+
+    def test_one_message_per_patient(self):
+        counts = self.dispatcher().run(self.tomorrow, self.tomorrow)
+        self.assertEqual(counts['Sent'], 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(set(AppointmentReminder.objects.values_list('status', flat=True)), {'Sent'})
+        self.assertEqual(self.dispatcher().run(self.tomorrow, self.tomorrow)['Sent'], 0)
+
+    def test_overlapping_runs_send_once(self):
+        # Both runs read the due appointments before either claims them.
+        first_chunk, second_chunk = self.due_chunk(), self.due_chunk()
+        first, second = self.dispatcher(), self.dispatcher()
+        first.dispatch(first_chunk)
+        second.dispatch(second_chunk)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual((first.counts['Sent'], second.counts['Sent']), (2, 0))
+
+    def test_failed_reminder_is_retried_by_one_run(self):
+        AppointmentReminder.objects.create(appointment=self.appointments[0], status='Failed', claim='old')
+        AppointmentReminder.objects.create(appointment=self.appointments[1], status='Sent')
+        first_chunk, second_chunk = self.due_chunk(), self.due_chunk()
+        self.assertEqual([row['id'] for row in first_chunk[0]], [self.appointments[0].pk])
+        self.dispatcher().dispatch(first_chunk)
+        self.dispatcher().dispatch(second_chunk)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(AppointmentReminder.objects.get(appointment=self.appointments[0]).status, 'Sent')
+
+    def test_claims_of_a_dead_run_are_taken_over_once_stale(self):
+        claimed_at = timezone.now() - reminders.STALE_AFTER + timedelta(minutes=1)
+        for appointment in self.appointments:
+            AppointmentReminder.objects.create(appointment=appointment, claim='dead', claimed_at=claimed_at)
+        self.assertEqual(self.dispatcher().run(self.tomorrow, self.tomorrow)['Sent'], 0)
+        AppointmentReminder.objects.update(claimed_at=claimed_at - timedelta(minutes=2))
+        self.assertEqual(self.dispatcher().run(self.tomorrow, self.tomorrow)['Sent'], 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(AppointmentReminder.objects.filter(claim='dead').exists())
+
+    def test_every_chunk_of_patients_is_dispatched(self):
+        other = make_patient('other', email='other@example.com')
+        Appointment.objects.create(patient=other, doctor=self.doctor, date=self.tomorrow, time=time(10))
+        dispatcher = ReminderDispatcher(get_connection('django.core.mail.backends.locmem.EmailBackend'), chunk_size=1)
+        with mock.patch.object(dispatcher, 'dispatch', wraps=dispatcher.dispatch) as dispatch:
+            self.assertEqual(dispatcher.run(self.tomorrow, self.tomorrow)['Sent'], 3)
+        self.assertEqual(dispatch.call_count, 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_patient_without_email_is_skipped(self):
+        CustomUser.objects.filter(pk=self.patient.pk).update(email='')
+        counts = self.dispatcher().run(self.tomorrow, self.tomorrow)
+        self.assertEqual((counts['Sent'], counts['Skipped']), (0, 2))
+        self.assertEqual(mail.outbox, [])
+
+
+class VersionedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient('other')
+        self.value = CachedValue('test-appointments', [(Appointment, 'patient')])
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return self.builds
+
+    def test_hit_until_an_owned_row_changes(self):
+        self.assertEqual(self.value.get_or_set(self.build, owner=self.patient.pk), 1)
+        self.assertEqual(self.value.get_or_set(self.build, owner=self.patient.pk), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(patient=self.other, doctor=self.doctor, date=date.today(), time=time(9))
+        self.assertEqual(self.value.get_or_set(self.build, owner=self.patient.pk), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date.today(), time=time(10))
+        self.assertEqual(self.value.get_or_set(self.build, owner=self.patient.pk), 2)
+
+    def test_bump_waits_for_commit(self):
+        key = owner_key(Appointment, 'patient', self.patient.pk)
+        before = generation(key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date.today(), time=time(9))
+                self.assertEqual(generation(key), before)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(generation(key), before)
+
+    def test_bulk_reassignment_bumps_old_and_new_owner(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=date.today(), time=time(9)
+        )
+        keys = [owner_key(Appointment, 'patient', user.pk) for user in (self.patient, self.other)]
+        before = [generation(key) for key in keys]
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.filter(pk=appointment.pk).update(patient=self.other)
+        self.assertTrue(all(generation(key) > old for key, old in zip(keys, before)))
+
+    def test_archiving_bumps_the_owners(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date(2020, 1, 6), time=time(9),
+                                   status='Completed')
+        self.assertEqual(self.value.get_or_set(self.build, owner=self.patient.pk), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive.POLICIES[0].archive(timezone.now()), 1)
+        self.assertEqual(self.value.get_or_set(self.build, owner=self.patient.pk), 2)
+
+    def test_process_local_cache_fails_the_deploy_check(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['H_app.E001'])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                               'LOCATION': 'redis://localhost:6379'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class AuditBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.reader = make_admin()
+        self.patient = make_patient()
+
+    def entry(self, patient_id):
+        return AccessLogEntry(user=self.reader, patient_id=patient_id, view_name='patient_detail', path='/')
+
+    def test_flush_writes_the_batch(self):
+        buffer = AuditBuffer(size=10)
+        buffer.entries = [self.entry(self.patient.pk) for _ in range(3)]
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(AccessLogEntry.objects.count(), 3)
+
+    def test_entry_of_a_deleted_user_is_dropped_not_retried(self):
+        buffer = AuditBuffer(size=10)
+        missing = self.patient.pk + 1000
+        buffer.entries = [self.entry(self.patient.pk), self.entry(missing), self.entry(self.patient.pk)]
+        with self.assertLogs('H_app.audit', 'ERROR'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.entries, [])
+        self.assertEqual(list(AccessLogEntry.objects.values_list('patient_id', flat=True)), [self.patient.pk] * 2)
+
+    def test_operational_error_keeps_the_batch(self):
+        buffer = AuditBuffer(size=10, max_pending=2)
+        buffer.entries = [self.entry(self.patient.pk) for _ in range(3)]
+        with mock.patch.object(AccessLogEntry.objects, 'bulk_create', side_effect=OperationalError('locked')):
+            with self.assertLogs('H_app.audit', 'ERROR'):
+                self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer.entries), 2)
+        self.assertEqual(buffer.flush(), 2)
+
+
+class AppointmentSeriesTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        # A Monday.
+        self.start = date(2030, 1, 7)
+
+    def series(self, **fields):
+        fields = {'patient': self.patient, 'doctor': self.doctor, 'start_date': self.start, 'time': time(9),
+                  'occurrences': 4, **fields}
+        return AppointmentSeries(**fields)
+
+    def test_daily_occurrences_with_interval(self):
+        dates = self.series(frequency='Daily', interval=2, occurrences=3).occurrence_dates()
+        self.assertEqual(dates, [self.start, self.start + timedelta(days=2), self.start + timedelta(days=4)])
+
+    def test_weekly_occurrences_on_several_weekdays(self):
+        # Starting on a Wednesday skips that week's Monday.
+        series = self.series(start_date=self.start + timedelta(days=2), weekdays='0,2,4', occurrences=5)
+        offsets = [(day - self.start).days for day in series.occurrence_dates()]
+        self.assertEqual(offsets, [2, 4, 7, 9, 11])
+
+    def test_biweekly_occurrences_default_to_the_start_weekday(self):
+        dates = self.series(interval=2, occurrences=3).occurrence_dates()
+        self.assertEqual(dates, [self.start + timedelta(weeks=weeks) for weeks in (0, 2, 4)])
+
+    def test_occurrences_are_capped(self):
+        series = self.series(frequency='Daily', occurrences=AppointmentSeries.MAX_OCCURRENCES + 10)
+        self.assertEqual(len(series.occurrence_dates()), AppointmentSeries.MAX_OCCURRENCES)
+
+    def test_book_creates_every_occurrence(self):
+        series = self.series()
+        self.assertEqual(series.book(), [])
+        self.assertEqual(series.appointments.count(), 4)
+
+    def test_overlapping_appointment_blocks_the_whole_series(self):
+        existing = Appointment.objects.create(
+            patient=make_patient('other'), doctor=self.doctor, date=self.start + timedelta(weeks=2),
+            time=time(8, 45), duration_minutes=30,
+        )
+        series = self.series()
+        self.assertEqual(series.book(), [existing])
+        self.assertIsNone(series.pk)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_adjacent_and_canceled_appointments_do_not_conflict(self):
+        other = make_patient('other')
+        Appointment.objects.create(patient=other, doctor=self.doctor, date=self.start, time=time(8, 30))
+        Appointment.objects.create(patient=other, doctor=self.doctor, date=self.start, time=time(9), status='Canceled')
+        self.assertEqual(self.series().book(), [])
+
+    def test_conflicts_are_checked_after_taking_the_doctor_lock(self):
+        # A booking committed while this one waited for the lock must be seen.
+        def concurrent_booking(doctor_id, using):
+            self.assertTrue(transaction.get_connection(using).in_atomic_block)
+            Appointment.objects.create(patient=make_patient('other'), doctor_id=doctor_id, date=self.start, time=time(9))
+
+        series = self.series()
+        with mock.patch('H_app.models.lock_doctor', side_effect=concurrent_booking):
+            conflicts = series.book()
+        self.assertEqual(len(conflicts), 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = date.today() + timedelta(days=7)
+        self.slot = waitlist.Slot(self.doctor.pk, self.day, time(10), 30, 'Main Building', False)
+
+    def wait(self, username, urgency=1, **fields):
+        return WaitlistEntry.objects.create(
+            patient=make_patient(username), doctor=self.doctor, urgency=urgency, **fields
+        )
+
+    def test_most_urgent_then_earliest_gets_the_offer(self):
+        self.wait('routine', urgency=1)
+        first_soon = self.wait('soon1', urgency=2)
+        self.wait('soon2', urgency=2)
+        self.assertEqual(waitlist.offer_slot(self.slot), first_soon)
+        first_soon.refresh_from_db()
+        self.assertEqual((first_soon.status, first_soon.offered_time), ('Offered', time(10)))
+
+    def test_latest_date_and_past_slots_are_respected(self):
+        self.wait('too-late', latest_date=self.day - timedelta(days=1))
+        self.assertIsNone(waitlist.offer_slot(self.slot))
+        self.wait('anyone')
+        past = self.slot._replace(date=date.today() - timedelta(days=1))
+        self.assertIsNone(waitlist.offer_slot(past))
+
+    def test_a_candidate_claimed_meanwhile_is_skipped(self):
+        taken = self.wait('first', urgency=3)
+        second = self.wait('second')
+        # Another worker offers `taken` a slot between reading and claiming it.
+        real_next = waitlist.next_candidate
+
+        def racing_next(slot, exclude_patient_ids=()):
+            candidate = real_next(slot, exclude_patient_ids)
+            if candidate == taken:
+                WaitlistEntry.objects.filter(pk=taken.pk).update(status='Offered')
+            return candidate
+
+        with mock.patch('H_app.waitlist.next_candidate', side_effect=racing_next):
+            self.assertEqual(waitlist.offer_slot(self.slot), second)
+
+    def test_canceling_offers_the_slot(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=self.day, time=time(10)
+        )
+        entry = self.wait('waiting')
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 'Canceled'
+            appointment.save()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.offered_date), ('Offered', self.day))
+
+    def test_accept_books_the_held_slot(self):
+        self.wait('waiting')
+        entry = waitlist.offer_slot(self.slot)
+        appointment = waitlist.accept(entry)
+        self.assertEqual((appointment.date, appointment.time, appointment.patient_id),
+                         (self.day, time(10), entry.patient_id))
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.appointment), ('Booked', appointment))
+
+    def test_accept_refuses_a_slot_overlapped_by_a_direct_booking(self):
+        self.wait('waiting')
+        entry = waitlist.offer_slot(self.slot)
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=self.day, time=time(9, 45))
+        self.assertIsNone(waitlist.accept(entry))
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'Expired')
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_expired_hold_moves_on_to_the_next_candidate(self):
+        self.wait('first', urgency=3)
+        second = self.wait('second')
+        waitlist.offer_slot(self.slot)
+        self.assertEqual(waitlist.expire_holds(timezone.now() + waitlist.hold_duration()), 1)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'Offered')
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        # Buckets do not refill while a test runs.
+        clock = mock.patch('H_app.ratelimit.time.time', return_value=1_000_000.0)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def login_attempt(self, ip, username='victim'):
+        request = self.factory.post('/login/', {'username': username, 'password': 'wrong'}, REMOTE_ADDR=ip)
+        request.user = AnonymousUser()
+        return ratelimit.check(request, 'login', '10/m', keys=('ip', 'username'))
+
+    def test_parse_and_scale_rate(self):
+        self.assertEqual(ratelimit.parse_rate('10/m'), (10, 60))
+        self.assertEqual(ratelimit.parse_rate('5/15m'), (5, 900))
+        self.assertEqual(ratelimit.scale_rate('10/m', 10), '100/m')
+
+    def test_bucket_refills_at_its_rate(self):
+        bucket = ratelimit.TokenBucket('test', '2/m')
+        self.assertEqual([bucket.consume('a', now=1000)[0] for _ in range(3)], [True, True, False])
+        self.assertEqual(bucket.consume('a', now=1000), (False, 30))
+        self.assertTrue(bucket.consume('a', now=1030)[0])
+        self.assertFalse(bucket.consume('a', now=1030)[0])
+
+    def test_one_address_cannot_lock_out_a_username(self):
+        attempts = [self.login_attempt('10.0.0.1') for _ in range(30)]
+        self.assertEqual(attempts[:10], [0] * 10)
+        self.assertTrue(all(attempts[10:]))
+        self.assertEqual(self.login_attempt('10.0.0.2'), 0)
+
+    def test_many_addresses_are_limited_per_username(self):
+        results = [self.login_attempt(f'10.0.{n // 250}.{n % 250}') for n in range(101)]
+        self.assertEqual(results[:100], [0] * 100)
+        self.assertTrue(results[100])
+
+    def test_refused_request_spends_no_tokens(self):
+        with self.settings(RATELIMITS={'login': '10/m', 'login-username': '1/m'}):
+            self.assertEqual(self.login_attempt('10.0.0.1'), 0)
+            for _ in range(20):
+                self.assertTrue(self.login_attempt('10.0.0.1'))
+            # The IP bucket was not charged for the refused attempts.
+            for _ in range(9):
+                self.assertEqual(self.login_attempt('10.0.0.1', username=f'other{_}'), 0)
+
+    def test_disabled_scope_is_not_limited(self):
+        with self.settings(RATELIMITS={'login': None}):
+            self.assertTrue(all(self.login_attempt('10.0.0.1') == 0 for _ in range(20)))
+
+    def test_login_view_answers_429(self):
+        for _ in range(10):
+            self.client.post(reverse('user_login'), {'username': 'victim', 'password': 'wrong'})
+        response = self.client.post(reverse('user_login'), {'username': 'victim', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_series_share_the_booking_limit(self):
+        self.client.force_login(make_patient())
+        with self.settings(RATELIMITS={'booking': '1/h'}):
+            self.assertNotEqual(self.client.post(reverse('appointment_create'), {}).status_code, 429)
+            self.assertEqual(self.client.post(reverse('appointment_series_create'), {}).status_code, 429)
+            self.assertEqual(self.client.get(reverse('appointment_series_create')).status_code, 200)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.asthma = HealthEducationResource.objects.create(
+            title="Living with asthma", description="Inhalers, triggers and asthma action plans."
+        )
+        self.diabetes = HealthEducationResource.objects.create(
+            title="Diabetes basics", description="Blood sugar, insulin and diet for diabetes."
+        )
+
+    def test_tokenize_drops_stopwords_and_folds_plurals(self):
+        self.assertEqual(recommendations.tokenize("The patient has migraines and stress"),
+                         ['migraine', 'stress'])
+
+    def test_patients_get_resources_matching_their_records(self):
+        patient = make_patient(medical_history="Childhood asthma")
+        other = make_patient('other')
+        MedicalRecord.objects.create(patient=other, doctor=self.doctor, diagnosis="Type 2 diabetes",
+                                     treatment_plan="Diet")
+        self.assertEqual(recommendations.recommend_all(top_n=1), 2)
+        self.assertEqual(recommendations.recommended_resources(patient), [self.asthma])
+        self.assertEqual(recommendations.recommended_resources(other), [self.diabetes])
+
+    def test_records_are_read_from_every_database(self):
+        patient = make_patient()
+        MedicalRecord.objects.create(patient=patient, doctor=self.doctor, diagnosis="Asthma", treatment_plan="")
+        visited = []
+
+        def spy(alias):
+            visited.append(alias)
+            return use_database('default')
+
+        with mock.patch('H_app.recommendations.databases', return_value=['default', 'north']), \
+                mock.patch('H_app.recommendations.use_database', side_effect=spy):
+            recommendations.recommend_all()
+        self.assertEqual(visited, ['default', 'north'])
+        self.assertEqual(recommendations.recommended_resources(patient)[0], self.asthma)
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor(name='Grey')
+        self.patient = make_patient(name='Ada Lovelace')
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=date.today() + timedelta(days=3), time=time(9),
+            location='Main Building; Room 4',
+        )
+        self.url = reverse('calendar_feed', args=[ical.feed_token(self.doctor.user)])
+
+    def fetch(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content).decode() if response.streaming else ''
+        return response, body
+
+    def test_feed_lists_the_appointments(self):
+        response, body = self.fetch()
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertIn('SUMMARY:Appointment: Ada Lovelace\r\n', body)
+        self.assertIn('LOCATION:Main Building\; Room 4\r\n', body)
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+
+    def test_unchanged_feed_answers_304_without_queries(self):
+        response, _ = self.fetch()
+        with self.assertNumQueries(0):
+            response, _ = self.fetch(if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_appointment_and_rename_change_the_etag(self):
+        etag = self.fetch()[0]['ETag']
+        profile = self.patient.patient_profile
+        profile.name = 'Ada King'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        response, body = self.fetch(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Ada King', body)
+        etag = response['ETag']
+        patient_url = reverse('calendar_feed', args=[ical.feed_token(self.patient)])
+        patient_etag = self.client.get(patient_url)['ETag']
+        self.doctor.name = 'Shepherd'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.save()
+        # The doctor's own feed does not show the doctor's name.
+        self.assertEqual(self.fetch(if_none_match=etag)[0].status_code, 304)
+        response = self.client.get(patient_url, headers={'if-none-match': patient_etag})
+        self.assertIn('Dr. Shepherd', b''.join(response.streaming_content).decode())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.status = 'Canceled'
+            self.appointment.save()
+        response, body = self.fetch(if_none_match=etag)
+        self.assertIn('STATUS:CANCELLED', body)
+
+    def test_changes_to_names_not_shown_keep_the_etag(self):
+        etag = self.fetch()[0]['ETag']
+        profile = self.patient.patient_profile
+        profile.medical_history = 'Asthma'
+        stranger = make_patient('stranger')
+        stranger.patient_profile.name = 'Someone Else'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+            stranger.patient_profile.save()
+            self.patient.last_login = timezone.now()
+            self.patient.save(update_fields=['last_login'])
+        self.assertEqual(self.fetch(if_none_match=etag)[0].status_code, 304)
+
+    def test_reset_token_revokes_the_old_url(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ical.reset_token(self.doctor.user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_long_lines_are_folded_at_75_octets(self):
+        folded = ical.fold('SUMMARY:' + 'é' * 60)
+        lines = folded.split('\r\n')[:-1]
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        self.assertEqual(''.join(line[1:] if i else line for i, line in enumerate(lines)), 'SUMMARY:' + 'é' * 60)
+
+
+@skipIf(np is None, "NumPy is not installed.")
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        from . import analytics
+        self.analytics = analytics
+        self.doctor = make_doctor(specialization=Specialization.objects.create(name='Cardiology'))
+        self.patient = make_patient()
+        # A Monday, with "today" a week later.
+        self.day = date(2030, 1, 7)
+        self.today = self.day + timedelta(days=7)
+
+    def book(self, status, hour=9, duration=30, day=None):
+        return Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=day or self.day,
+                                          time=time(hour), duration_minutes=duration, status=status)
+
+    def compute(self, **kwargs):
+        return self.analytics.compute(self.day, self.day + timedelta(days=6), today=self.today, **kwargs)
+
+    def test_column_helpers(self):
+        self.assertEqual(self.analytics.minutes(['00:00', '09:30', '23:59']).tolist(), [0, 570, 1439])
+        days = np.array(['2030-01-07', '2030-01-13'], dtype='datetime64[D]')
+        self.assertEqual(self.analytics.weekday(days).tolist(), [0, 6])
+
+    def test_past_scheduled_and_confirmed_appointments_are_no_shows(self):
+        for status in ('Scheduled', 'Confirmed', 'Completed', 'Completed', 'Canceled'):
+            self.book(status)
+        report = self.compute()
+        self.assertEqual(report['appointments'], 5)
+        self.assertEqual(report['no_show_rate'], 0.5)
+        self.assertEqual(report['cancellation_rate'], 0.2)
+
+    def test_future_appointments_are_not_no_shows(self):
+        self.book('Confirmed', day=self.today)
+        report = self.analytics.compute(self.day, self.today, today=self.today)
+        self.assertIsNone(report['no_show_rate'])
+
+    def test_occupancy_splits_minutes_across_hours(self):
+        self.book('Completed', hour=9, duration=90)
+        self.book('Canceled', hour=9)
+        group = self.compute(group_by='doctor')['groups'][0]
+        monday = group['occupancy'][0]
+        self.assertEqual((monday[9], monday[10], monday[11]), (1.0, 0.5, 0.0))
+        self.assertEqual(group['specialization'], 'Cardiology')
+
+    def test_view_checks_access_and_parameters(self):
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.get(reverse('utilization_report')).status_code, 403)
+        self.client.force_login(make_admin())
+        url = reverse('utilization_report')
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'group_by': 'patient'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2030-01-07', 'end': '2030-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient('other')
+        for day in range(5):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                       date=date(2030, 1, 1) + timedelta(days=day), time=time(9))
+        Appointment.objects.create(patient=self.other, doctor=self.doctor, date=date(2030, 1, 1), time=time(10))
+        self.url = reverse('api_list', args=['appointments'])
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(api.decode_cursor(api.encode_cursor(12345)), 12345)
+        with self.assertRaises(ValueError):
+            api.decode_cursor('not a cursor')
+
+    def test_pages_follow_the_cursor_and_are_scoped_to_the_user(self):
+        self.client.force_login(self.patient)
+        ids, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            body = self.client.get(self.url, params).json()
+            ids += [row['id'] for row in body['results']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(ids, list(Appointment.objects.filter(patient=self.patient).order_by('id')
+                                   .values_list('id', flat=True)))
+
+    def test_sparse_fields(self):
+        self.client.force_login(self.patient)
+        row = self.client.get(self.url, {'fields': 'date,status'}).json()['results'][0]
+        self.assertEqual(set(row), {'id', 'date', 'status'})
+        response = self.client.get(self.url, {'fields': 'date,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_unchanged_collection_answers_304_until_a_row_changes(self):
+        self.client.force_login(self.patient)
+        etag = self.client.get(self.url)['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 304)
+        Appointment.objects.filter(patient=self.patient).first().save()
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+        self.assertEqual(self.client.get(reverse('api_list', args=['users'])).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).status_code, 400)
+        other = Appointment.objects.get(patient=self.other)
+        self.assertEqual(self.client.get(reverse('api_detail', args=['appointments', other.pk])).status_code, 404)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.policy = archive.POLICIES[0]
+        self.cutoff = timezone.now()
+
+    def book(self, status, day=date(2020, 1, 6)):
+        return Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=day, time=time(9),
+                                          status=status, appointment_notes=f"{status} visit")
+
+    def test_cold_appointments_move_with_their_fields(self):
+        completed = self.book('Completed')
+        kept = [self.book('Scheduled'), self.book('Completed', day=self.cutoff.date() + timedelta(days=1))]
+        self.assertEqual(self.policy.archive(self.cutoff), 1)
+        self.assertEqual(set(Appointment.objects.values_list('pk', flat=True)), {a.pk for a in kept})
+        archived = ArchivedAppointment.objects.get()
+        self.assertEqual(archived.original_id, completed.pk)
+        for field in ('patient_id', 'doctor_id', 'date', 'time', 'status', 'appointment_notes',
+                      'duration_minutes', 'created_at', 'updated_at'):
+            self.assertEqual(getattr(archived, field), getattr(completed, field), field)
+
+    def test_batches_stop_at_max_batches(self):
+        for _ in range(5):
+            self.book('Canceled')
+        self.assertEqual(self.policy.archive_batch(self.cutoff, batch_size=2), 2)
+        self.assertEqual(self.policy.archive(self.cutoff, batch_size=2, max_batches=1), 2)
+        self.assertEqual(self.policy.archive(self.cutoff, batch_size=2), 1)
+        self.assertEqual(self.policy.archive_batch(self.cutoff), 0)
+        self.assertEqual(ArchivedAppointment.objects.count(), 5)
+
+    def test_archiving_sends_no_delete_signals(self):
+        self.book('Completed')
+        self.book('Canceled')
+        deleted, archived = mock.Mock(), mock.Mock()
+        post_delete.connect(deleted, sender=Appointment, weak=False)
+        self.addCleanup(post_delete.disconnect, deleted, sender=Appointment)
+        archive.rows_archived.connect(archived, sender=Appointment, weak=False)
+        self.addCleanup(archive.rows_archived.disconnect, archived, sender=Appointment)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.policy.archive(self.cutoff), 2)
+        deleted.assert_not_called()
+        archived.assert_called_once()
+        self.assertEqual([row['status'] for row in archived.call_args.kwargs['rows']], ['Completed', 'Canceled'])
+
+    def test_rows_referring_to_archived_appointments(self):
+        appointment = self.book('Completed')
+        AppointmentReminder.objects.create(appointment=appointment, status='Sent')
+        entry = WaitlistEntry.objects.create(patient=self.patient, doctor=self.doctor, status='Booked',
+                                             appointment=appointment)
+        with mock.patch.object(waitlist, 'release_slot') as release_slot:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.policy.archive(self.cutoff), 1)
+        release_slot.assert_not_called()
+        self.assertFalse(AppointmentReminder.objects.exists())
+        entry.refresh_from_db()
+        self.assertIsNone(entry.appointment_id)
+
+    def test_records_are_read_back_only_when_asked(self):
+        record = MedicalRecord.objects.create(patient=self.patient, doctor=self.doctor,
+                                              diagnosis='Asthma', treatment_plan='Inhaler')
+        MedicalRecord.objects.filter(pk=record.pk).update(updated_at=self.cutoff - timedelta(days=1))
+        self.assertEqual(archive.POLICIES[1].archive(self.cutoff), 1)
+        self.assertEqual(ArchivedMedicalRecord.objects.get().original_id, record.pk)
+        self.client.force_login(make_admin())
+        url = reverse('patient_medical_history', args=[self.patient.pk])
+        with mock.patch.object(audit.buffer, 'add'):
+            self.assertNotContains(self.client.get(url), 'Asthma')
+            self.assertContains(self.client.get(url, {'include_archived': 1}), 'Asthma')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_patient('jdoe', name='Zoë Müller', phone='+1 555-123-4567')
+        make_patient('jsmith', name='Zoe Smith')
+
+    def usernames(self, query, **kwargs):
+        return [row['username'] for row in search.search_users(query, **kwargs)]
+
+    def test_terms_are_normalized_prefixes(self):
+        terms = search.terms_for('JDoe', 'Zoë', '+1 555 123 4567')
+        self.assertTrue({'j', 'jdoe', 'zoe', '15551234567', '5551234567'} <= terms)
+        self.assertNotIn('Zoë', terms)
+
+    def test_every_query_word_must_match(self):
+        self.assertEqual(self.usernames('zoe'), ['jdoe', 'jsmith'])
+        self.assertEqual(self.usernames('Zoe mul'), ['jdoe'])
+        self.assertEqual(self.usernames('555 123 4567'), ['jdoe'])
+        self.assertEqual(self.usernames('zoe', user_type='doctor'), [])
+        self.assertEqual(self.usernames('  '), [])
+
+    def test_profile_changes_reindex_the_user(self):
+        profile = self.patient.patient_profile
+        profile.name = 'Ana Lima'
+        profile.save()
+        self.assertEqual(self.usernames('lima'), ['jdoe'])
+        self.assertEqual(self.usernames('muller'), [])
+
+    def test_rebuild_index(self):
+        UserSearchTerm.objects.all().delete()
+        self.assertEqual(search.rebuild_index(chunk_size=1), 2)
+        self.assertEqual(self.usernames('smi'), ['jsmith'])
+
+    def test_user_list_is_paginated(self):
+        with mock.patch('H_app.views.admin.USERS_PER_PAGE', 1):
+            first = self.client.get(reverse('user_list'))
+            second = self.client.get(reverse('user_list'), {'page': 2})
+        self.assertContains(first, '<td>jdoe</td>')
+        self.assertNotContains(first, '<td>jsmith</td>')
+        self.assertContains(second, '<td>jsmith</td>')
+        self.assertContains(second, 'Page 2 of 2')
+
+    def test_view_is_limited_to_staff_and_doctors(self):
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.get(reverse('user_search'), {'q': 'zoe'}).status_code, 403)
+        self.client.force_login(make_admin())
+        results = self.client.get(reverse('user_search'), {'q': 'zoe', 'type': 'patient'}).json()['results']
+        self.assertEqual([row['username'] for row in results], ['jdoe', 'jsmith'])
+
+
+class LoadTestTests(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.patients, self.doctors = loadtest.seed_users('lt_', 1, 1, 'secret')
+
+    def test_seeding_is_idempotent(self):
+        self.assertEqual(loadtest.seed_users('lt_', 1, 1, 'secret'), (['lt_patient0'], ['lt_doctor0']))
+        self.assertEqual(CustomUser.objects.count(), 2)
+        self.assertTrue(DoctorProfile.objects.get().availability)
+
+    def test_summary_percentiles(self):
+        summary = summarize([0.004, 0.001, 0.003, 0.002])
+        self.assertEqual((summary['count'], summary['p50'], summary['p99']), (4, 3.0, 4.0))
+        self.assertEqual(summarize([])['p95'], 0.0)
+
+    def test_journeys_run_against_the_real_url_map(self):
+        recorder = loadtest.Recorder()
+        rng = random.Random(0)
+        loadtest.patient_journey(recorder, HttpSession(self.live_server_url), 'lt_patient0', 'secret', rng)
+        loadtest.doctor_journey(recorder, HttpSession(self.live_server_url), 'lt_doctor0', 'secret', rng)
+        self.assertEqual(Appointment.objects.get().status, 'Confirmed')
+        self.assertEqual(Prescription.objects.count(), 1)
+        self.assertEqual(sum(recorder.errors.values()), 0)
+        self.assertIn('doctor: prescribe', recorder.latencies)
+
+    def test_unexpected_status_fails_the_journey(self):
+        recorder = loadtest.Recorder()
+        with self.assertRaises(loadtest.JourneyFailed):
+            loadtest.login(recorder, HttpSession(self.live_server_url), 'patient', 'lt_patient0', 'wrong')
+        self.assertEqual(recorder.errors['patient: login'], 1)
+
+    def test_empty_patient_pool_is_refused(self):
+        for options in ({'patients': 0}, {'doctors': -1}):
+            with self.assertRaises(CommandError):
+                call_command('loadtest', duration=0, **options)
+
+
+class PaymentsTests(TestCase):
+    def test_loading_the_urlconf_does_not_import_stripe(self):
+        script = (
+            "import sys, django; django.setup(); import H_app.urls, H_app.views; "
+            "sys.exit('stripe' in sys.modules)"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'E_Hospitality.settings'})
+        self.assertEqual(result.returncode, 0)
+
+    def test_stripe_is_configured_on_first_use(self):
+        with mock.patch.object(payments, '_stripe', None):
+            stripe = payments.get_stripe()
+            self.assertIs(payments.get_stripe(), stripe)
+            self.assertEqual(stripe.api_key, settings.STRIPE_SECRET_KEY)
+
+
+class ProfileBackendTests(TestCase):
+    def setUp(self):
+        self.patient = make_patient()
+        self.backend = ProfileModelBackend()
+
+    def test_user_and_profiles_load_in_one_query(self):
+        with self.assertNumQueries(1):
+            user = self.backend.get_user(self.patient.pk)
+            self.assertEqual(profiles.get_profile(user, 'patient').name, 'Patient')
+            self.assertIsNone(profiles.get_profile(user, 'doctor'))
+        with self.assertRaises(Http404):
+            profiles.get_profile_or_404(user, 'doctor')
+
+    def test_inactive_and_missing_users_are_not_loaded(self):
+        self.assertIsNone(self.backend.get_user(self.patient.pk + 1))
+        self.patient.is_active = False
+        self.patient.save()
+        self.assertIsNone(self.backend.get_user(self.patient.pk))
+
+    def test_missing_profile_is_created_once(self):
+        user = CustomUser.objects.create_user('new', user_type='doctor')
+        profile = profiles.get_or_create_profile(user, 'doctor')
+        with self.assertNumQueries(0):
+            self.assertEqual(profiles.get_or_create_profile(user, 'doctor'), profile)
+
+    def test_profile_page_queries_only_the_session_and_the_user(self):
+        self.client.force_login(self.patient)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse('patient_profile')).status_code, 200)
+
+    def test_sessions_from_model_backend_stay_logged_in(self):
+        self.client.force_login(self.patient, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('patient_profile')).status_code, 200)
+
+
+class AgendaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient(name='Ana Lima')
+        self.day = date.today() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                                          date=self.day, time=time(9))
+
+    def test_rendered_agenda_is_served_from_the_cache(self):
+        html = agenda.render_agenda(self.doctor.pk, self.day)
+        self.assertIn('Ana Lima', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(agenda.render_agenda(self.doctor.pk, self.day), html)
+
+    def test_moved_appointment_leaves_both_days(self):
+        agenda.render_agenda(self.doctor.pk, self.day)
+        new_day = self.day + timedelta(days=1)
+        agenda.render_agenda(self.doctor.pk, new_day)
+        self.appointment.date = new_day
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.save()
+        self.assertNotIn('Ana Lima', agenda.render_agenda(self.doctor.pk, self.day))
+        self.assertIn('Ana Lima', agenda.render_agenda(self.doctor.pk, new_day))
+
+    def test_prescription_flags_upcoming_agendas(self):
+        self.assertNotIn('Prescriptions', agenda.render_agenda(self.doctor.pk, self.day))
+        with self.captureOnCommitCallbacks(execute=True):
+            Prescription.objects.create(patient=self.patient, doctor=self.doctor, medication_name='Ibuprofen',
+                                        dosage_instructions='Twice daily')
+        self.assertIn('Prescriptions', agenda.render_agenda(self.doctor.pk, self.day))
+
+    def test_entries_are_dropped_once_the_write_commits(self):
+        agenda.render_agenda(self.doctor.pk, self.day)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Appointment.objects.filter(pk=self.appointment.pk).update(status='Confirmed')
+                self.appointment.refresh_from_db()
+                self.appointment.save()
+                self.assertNotIn('Confirmed', agenda.render_agenda(self.doctor.pk, self.day))
+        for callback in callbacks:
+            callback()
+        self.assertIn('Confirmed', agenda.render_agenda(self.doctor.pk, self.day))
+
+    def test_patient_name_age_and_username_changes(self):
+        profile = self.patient.patient_profile
+        changes = [
+            (profile, 'name', 'Ana Souza', 'Ana Souza'),
+            (profile, 'age', 77, '77'),
+            # The username is shown when the profile has no name.
+            (profile, 'name', '', 'patient'),
+            (self.patient, 'username', 'asouza', 'asouza'),
+        ]
+        for instance, field, value, shown in changes:
+            agenda.render_agenda(self.doctor.pk, self.day)
+            setattr(instance, field, value)
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.save()
+            self.assertIn(f'<td>{shown}</td>', agenda.render_agenda(self.doctor.pk, self.day))
+        with self.assertNumQueries(1):
+            self.patient.save(update_fields=['last_login'])
+
+    def test_archived_batch_drops_the_flags_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ('Ibuprofen', 'Aspirin'):
+                Prescription.objects.create(patient=self.patient, doctor=self.doctor, medication_name=name,
+                                            dosage_instructions='Twice daily')
+            Prescription.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        self.assertIn('Prescriptions', agenda.render_agenda(self.doctor.pk, self.day))
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive.POLICIES[2].archive(timezone.now()), 2)
+        self.assertEqual(sum('FROM "H_app_appointment"' in query['sql'] for query in queries.captured_queries), 1)
+        self.assertNotIn('Prescriptions', agenda.render_agenda(self.doctor.pk, self.day))
+
+    def test_view_shows_the_requested_day(self):
+        self.client.force_login(self.doctor.user)
+        url = reverse('doctor_agenda')
+        self.assertContains(self.client.get(url, {'date': self.day.isoformat()}), 'Ana Lima')
+        self.assertNotContains(self.client.get(url, {'date': 'tomorrow'}), 'Ana Lima')
+
+
+class AttachmentTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        for context in (self.settings(ATTACHMENT_ROOT=root.name), mock.patch.object(audit.buffer, 'add')):
+            context.__enter__()
+            self.addCleanup(context.__exit__, None, None, None)
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.record = MedicalRecord.objects.create(patient=self.patient, doctor=self.doctor,
+                                                   diagnosis='Fracture', treatment_plan='Cast')
+        self.client.force_login(self.patient)
+
+    def upload(self, content, name='scan.pdf', content_type='application/pdf'):
+        return self.client.post(reverse('upload_attachment', args=[self.record.pk]),
+                                {'file': SimpleUploadedFile(name, content, content_type)})
+
+    def test_parse_range(self):
+        self.assertEqual(attachments.parse_range('bytes=2-5', 10), (2, 5))
+        self.assertEqual(attachments.parse_range('bytes=4-', 10), (4, 9))
+        self.assertEqual(attachments.parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(attachments.parse_range('bytes=5-100', 10), (5, 9))
+        self.assertIsNone(attachments.parse_range('bytes=0-1,4-5', 10))
+        self.assertIs(attachments.parse_range('bytes=10-', 10), False)
+
+    def test_identical_uploads_share_one_blob(self):
+        self.assertEqual(self.upload(b'%PDF scan').status_code, 302)
+        self.assertEqual(self.upload(b'%PDF scan', name='copy.pdf').status_code, 302)
+        blob = AttachmentBlob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(b'%PDF scan').hexdigest())
+        with open(attachments.blob_path(blob.sha256), 'rb') as stored:
+            self.assertEqual(stored.read(), b'%PDF scan')
+        self.assertEqual(MedicalRecordAttachment.objects.count(), 2)
+
+    def test_other_file_types_are_refused(self):
+        self.assertEqual(self.upload(b'MZ', name='run.exe', content_type='application/octet-stream').status_code, 200)
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_download_supports_ranges(self):
+        self.upload(b'0123456789')
+        url = reverse('download_attachment', args=[MedicalRecordAttachment.objects.get().pk])
+        response = self.client.get(url, headers={'range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        response.close()
+        stale = self.client.get(url, headers={'range': 'bytes=2-5', 'if-range': '"outdated"'})
+        self.assertEqual(stale.status_code, 200)
+        stale.close()
+        self.assertEqual(self.client.get(url, headers={'range': 'bytes=20-'}).status_code, 416)
+
+    def test_only_readers_of_the_records_can_download(self):
+        self.upload(b'%PDF scan')
+        self.client.force_login(make_patient('other'))
+        url = reverse('download_attachment', args=[MedicalRecordAttachment.objects.get().pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_thumbnails_are_made_for_images_only(self):
+        image = io.BytesIO()
+        Image.new('RGB', (600, 300), 'red').save(image, 'PNG')
+        self.upload(image.getvalue(), name='rash.png', content_type='image/png')
+        self.upload(b'%PDF scan')
+        self.assertEqual(attachments.process_pending(), 2)
+        statuses = dict(AttachmentBlob.objects.values_list('content_type', 'thumbnail_status'))
+        self.assertEqual(statuses, {'image/png': 'Done', 'application/pdf': 'Unsupported'})
+        png = AttachmentBlob.objects.get(content_type='image/png')
+        with Image.open(attachments.thumbnail_path(png.sha256)) as thumbnail:
+            self.assertEqual(thumbnail.size, (256, 128))
+
+
+class PrintingTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        for context in (self.settings(PRESCRIPTION_PRINT_ROOT=root.name), mock.patch.object(audit.buffer, 'add')):
+            context.__enter__()
+            self.addCleanup(context.__exit__, None, None, None)
+        self.patient = make_patient()
+        self.prescription = Prescription.objects.create(
+            patient=self.patient, doctor=make_doctor(), medication_name='Amoxicillin', dosage_instructions='Every 8h',
+        )
+        self.client.force_login(self.patient)
+
+    def current_url(self):
+        response = self.client.get(reverse('print_prescription', args=[self.prescription.pk]))
+        self.assertEqual(response.status_code, 302)
+        return response['Location']
+
+    def test_document_is_immutable_and_rendered_once(self):
+        url = self.current_url()
+        response = self.client.get(url)
+        self.assertIn(b'Amoxicillin', b''.join(response.streaming_content))
+        self.assertIn('immutable', response['Cache-Control'])
+        compressed = self.client.get(url, headers={'accept-encoding': 'gzip'})
+        self.assertEqual((compressed.get('Content-Encoding'), compressed['ETag']), (None, response['ETag']))
+        compressed.close()
+        with mock.patch('H_app.printing.render_to_string') as render:
+            self.assertEqual(self.client.get(url, headers={'if-none-match': response['ETag']}).status_code, 304)
+            self.client.get(url).close()
+        render.assert_not_called()
+
+    def test_editing_changes_the_url_and_replaces_the_document(self):
+        old_url = self.current_url()
+        self.client.get(old_url).close()
+        self.prescription.dosage_instructions = 'Every 12h'
+        self.prescription.save()
+        new_url = self.current_url()
+        self.assertNotEqual(new_url, old_url)
+        self.assertRedirects(self.client.get(old_url), new_url, fetch_redirect_response=False)
+        self.client.get(new_url).close()
+        directory = os.path.join(printing.print_root(), str(self.prescription.pk))
+        self.assertEqual(os.listdir(directory), [new_url.rstrip('/').rsplit('/', 1)[1] + '.html'])
+
+    def test_other_patients_cannot_print(self):
+        self.client.force_login(make_patient('other'))
+        self.assertEqual(self.client.get(reverse('print_prescription', args=[self.prescription.pk])).status_code, 403)
+
+
+class ProjectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient(name='Ana Lima', phone='555')
+
+    def prescribe(self, count):
+        Prescription.objects.bulk_create([
+            Prescription(patient=self.patient, doctor=self.doctor, medication_name=f'Drug {n}', dosage_instructions='-')
+            for n in range(count)
+        ])
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_rows_read_related_columns_in_the_same_query(self):
+        self.prescribe(1)
+        with self.assertNumQueries(1):
+            row, = PRESCRIPTION_ROW(Prescription.objects.all())
+        self.assertEqual((row.medication_name, row.doctor_username), ('Drug 0', 'doctor'))
+        values = PATIENT_ROW.values(CustomUser.objects.filter(pk=self.patient.pk))
+        self.assertEqual(PATIENT_ROW.wrap(pickle.loads(pickle.dumps(values)))[0].name, 'Ana Lima')
+        self.assertEqual([row.id for row in APPOINTMENT_ROW.iterate(Appointment.objects.all())], [])
+
+    def test_list_pages_take_a_fixed_number_of_queries(self):
+        self.client.force_login(self.patient)
+        self.prescribe(1)
+        one = self.queries(reverse('prescription_list'))
+        self.prescribe(10)
+        self.assertEqual(self.queries(reverse('prescription_list')), one)
+
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date(2030, 1, 1), time=time(9))
+        one = self.queries(reverse('patient_appointment_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            for hour in range(10, 15):
+                Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date(2030, 1, 1),
+                                           time=time(hour))
+        self.assertEqual(self.queries(reverse('patient_appointment_list')), one)
+
+
+@override_settings(HOSPITAL_BRANCHES={
+    'north': {'name': 'North Campus', 'database': 'north', 'locations': ['North Campus']},
+    'east': {'name': 'East Wing', 'database': 'north', 'locations': ['East Wing']},
+})
+class BranchTests(TestCase):
+    def setUp(self):
+        self.router = branches.BranchRouter()
+
+    def test_branch_lookups(self):
+        self.assertEqual(branches.databases(), ['default', 'north'])
+        self.assertEqual(branches.branches_in('north'), ['north', 'east'])
+        self.assertEqual(branches.branches_in('default'), [''])
+        self.assertEqual(branches.branch_for_location(' east wing '), 'east')
+        self.assertIsNone(branches.branch_for_location('Elsewhere'))
+        self.assertEqual(branches.database_for('unknown'), 'default')
+
+    def test_router_sends_only_clinical_rows_to_the_branch(self):
+        with branches.use_database('north'):
+            self.assertEqual(self.router.db_for_write(Appointment), 'north')
+            self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+            record = MedicalRecord()
+            record._state.db = 'default'
+            self.assertEqual(self.router.db_for_read(Prescription, instance=record), 'default')
+        self.assertEqual(self.router.db_for_read(Appointment), 'default')
+        self.assertTrue(self.router.allow_relation(Appointment(), CustomUser()))
+
+    def test_middleware_selects_the_users_branch(self):
+        seen = []
+        middleware = branches.BranchMiddleware(lambda request: seen.append(branches.current_database()))
+        request = RequestFactory().get('/')
+        request.user = CustomUser(username='north', branch='north')
+        middleware(request)
+        request.user = AnonymousUser()
+        middleware(request)
+        self.assertEqual(seen, ['north', 'default'])
+
+    def test_patient_details_drop_agendas_in_every_database(self):
+        with mock.patch.object(Appointment.objects, 'using', return_value=Appointment.objects.none()) as using:
+            agenda.invalidate_patient(1)
+        self.assertEqual([call.args for call in using.call_args_list], [('default',), ('north',)])
+
+    def test_directory_writes_are_copied_after_commit(self):
+        copies = []
+        with mock.patch('H_app.branches._copy', side_effect=lambda *args: copies.append(args)):
+            with self.captureOnCommitCallbacks(execute=True):
+                user = CustomUser.objects.create_user('nurse')
+            with self.captureOnCommitCallbacks(execute=True):
+                user.last_login = timezone.now()
+                user.save(update_fields=['last_login'])
+        self.assertEqual([(model, pk, alias) for model, pk, _, alias in copies], [(CustomUser, user.pk, 'north')])
+
+    def test_thumbnail_status_reaches_the_branch_copies(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        copies = []
+        with self.settings(ATTACHMENT_ROOT=root.name), \
+                mock.patch('H_app.branches._copy', side_effect=lambda *args: copies.append(args)):
+            with self.captureOnCommitCallbacks(execute=True):
+                blob = AttachmentBlob.objects.create(sha256='0' * 64, size=3, content_type='application/pdf')
+            with self.captureOnCommitCallbacks(execute=True):
+                attachments.process_pending()
+        self.assertEqual([(values['thumbnail_status'], alias) for model, pk, values, alias in copies],
+                         [('Pending', 'north'), ('Unsupported', 'north')])
+        self.assertTrue(all(pk == blob.pk for _, pk, _, _ in copies))
+
+    def test_copy_updates_or_inserts(self):
+        specialization = Specialization.objects.create(name='Cardiology')
+        branches._copy(Specialization, specialization.pk, {'name': 'Cardiac'}, 'default')
+        branches._copy(Specialization, specialization.pk + 1, {'name': 'Oncology'}, 'default')
+        self.assertEqual(list(Specialization.objects.order_by('pk').values_list('name', flat=True)),
+                         ['Cardiac', 'Oncology'])
+
+    def test_fan_out_runs_in_every_database(self):
+        self.assertEqual(branches.fan_out(lambda alias: branches.current_database(), ['default', 'north']),
+                         {'default': 'default', 'north': 'north'})
+
+
+class DeletionJobTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        for day in range(5):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                       date=date(2030, 1, 1) + timedelta(days=day), time=time(9))
+        MedicalRecord.objects.create(patient=self.patient, doctor=self.doctor, diagnosis='Flu', treatment_plan='Rest')
+        AccessLogEntry.objects.create(user=self.doctor.user, patient=self.patient, view_name='x', path='/')
+
+    def test_start_deactivates_and_queues_once(self):
+        job = deletion.start_deletion(self.patient)
+        self.patient.refresh_from_db()
+        self.assertFalse(self.patient.is_active)
+        self.assertEqual(deletion.start_deletion(self.patient), job)
+
+    def test_patient_rows_are_removed_in_batches(self):
+        deletion.start_deletion(self.patient)
+        steps = []
+        self.assertEqual(deletion.run_pending(batch_size=2, report=lambda job: steps.append(job.step)), 1)
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.status, job.percent), ('Done', 100))
+        self.assertEqual(job.processed_rows, job.total_rows)
+        self.assertIn('appointment rows (patient)', steps)
+        self.assertFalse(CustomUser.objects.filter(pk=self.patient.pk).exists())
+        self.assertFalse(Appointment.objects.exists() or MedicalRecord.objects.exists())
+        self.assertEqual(list(AccessLogEntry.objects.values_list('user', 'patient')), [(self.doctor.user.pk, None)])
+
+    def test_doctor_rows_go_to_the_replacement(self):
+        replacement = make_doctor('replacement')
+        deletion.start_deletion(self.doctor.user, reassign_to=replacement)
+        deletion.run_pending()
+        self.assertEqual(set(Appointment.objects.values_list('doctor', flat=True)), {replacement.pk})
+        self.assertEqual(MedicalRecord.objects.get().doctor, replacement)
+        self.assertFalse(DoctorProfile.objects.filter(pk=self.doctor.pk).exists())
+
+    def test_only_pending_or_abandoned_jobs_are_claimed(self):
+        job = deletion.start_deletion(self.patient)
+        self.assertTrue(deletion.claim(job))
+        self.assertFalse(deletion.claim(job))
+        DeletionJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - deletion.STALE_AFTER * 2)
+        self.assertTrue(deletion.claim(job))
+
+    def test_failure_is_recorded_on_the_job(self):
+        deletion.start_deletion(self.patient)
+        with mock.patch.object(deletion.DeletionStep, 'run_batch', side_effect=OperationalError('locked')):
+            deletion.run_pending()
+        job = DeletionJob.objects.get()
+        self.assertEqual((job.status, job.error), ('Failed', 'OperationalError: locked'))
+        self.assertEqual(deletion.run_pending(), 0)
+        self.assertTrue(CustomUser.objects.filter(pk=self.patient.pk).exists())
+
+
+class SpecializationBackfillTests(TransactionTestCase):
+    before = [('H_app', '0016_doctorprofile_specialization_fk')]
+    after = [('H_app', '0017_backfill_doctor_specializations')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.addCleanup(self.migrate, self.executor.loader.graph.leaf_nodes())
+        self.migrate(self.before)
+
+    def migrate(self, targets):
+        self.executor.loader.build_graph()
+        self.executor.migrate(targets)
+        return self.executor.loader.project_state(targets).apps
+
+    def add_doctors(self, apps, *names):
+        User = apps.get_model('H_app', 'CustomUser')
+        DoctorProfile = apps.get_model('H_app', 'DoctorProfile')
+        for number, name in enumerate(names):
+            user = User.objects.create(username=f'doctor{number}', user_type='doctor')
+            DoctorProfile.objects.create(user=user, name=f'Doctor {number}', specialization=name)
+
+    def test_names_are_mapped_ignoring_case_and_spaces(self):
+        apps = self.migrate(self.before)
+        apps.get_model('H_app', 'Specialization').objects.create(name='Cardiology')
+        self.add_doctors(apps, 'Cardiology', ' cardiology ', 'Dermatology', '')
+        migration = importlib.import_module('H_app.migrations.0017_backfill_doctor_specializations')
+        with mock.patch.object(migration, 'BATCH_SIZE', 1):
+            apps = self.migrate(self.after)
+        doctors = apps.get_model('H_app', 'DoctorProfile').objects.order_by('pk')
+        self.assertEqual(list(doctors.values_list('specialization_fk__name', flat=True)),
+                         ['Cardiology', 'Cardiology', 'Dermatology', None])
+        self.assertEqual(apps.get_model('H_app', 'Specialization').objects.count(), 2)
+
+    def test_reversing_writes_the_names_back(self):
+        apps = self.migrate(self.before)
+        self.add_doctors(apps, 'Neurology')
+        apps = self.migrate(self.after)
+        apps.get_model('H_app', 'DoctorProfile').objects.update(specialization='')
+        apps = self.migrate(self.before)
+        doctors = apps.get_model('H_app', 'DoctorProfile').objects
+        self.assertEqual(list(doctors.values_list('specialization', flat=True)), ['Neurology'])
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient('other')
+        self.appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                                      date=date(2030, 1, 1), time=time(9))
+        self.url = reverse('sync')
+
+    def sync(self, user, cursor=None):
+        self.client.force_login(user)
+        response = self.client.get(self.url, {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_is_a_snapshot(self):
+        body = self.sync(self.patient)
+        self.assertTrue(body['reset'])
+        self.assertEqual([row['id'] for row in body['changes']['appointments']['upserts']], [self.appointment.pk])
+        self.assertEqual(len(body['changes']['patient-profiles']['upserts']), 1)
+        self.assertFalse(self.sync(self.patient, body['cursor'])['reset'])
+
+    def test_delta_sends_changed_rows_once_and_deleted_ids(self):
+        cursor = self.sync(self.patient)['cursor']
+        second = Appointment.objects.create(patient=self.patient, doctor=self.doctor,
+                                            date=date(2030, 1, 2), time=time(9))
+        second.status = 'Confirmed'
+        second.save()
+        Appointment.objects.filter(pk=self.appointment.pk).delete()
+        Appointment.objects.create(patient=self.other, doctor=self.doctor, date=date(2030, 1, 3), time=time(9))
+        body = self.sync(self.patient, cursor)
+        changes = body['changes']['appointments']
+        self.assertEqual([(row['id'], row['status']) for row in changes['upserts']], [(second.pk, 'Confirmed')])
+        self.assertEqual(changes['deletes'], [self.appointment.pk])
+        self.assertEqual(self.sync(self.patient, body['cursor'])['changes']['appointments']['upserts'], [])
+
+    def test_rows_moved_to_another_patient_are_deleted_for_the_old_one(self):
+        cursor = self.sync(self.patient)['cursor']
+        Appointment.objects.filter(pk=self.appointment.pk).update(patient=self.other)
+        self.assertEqual(self.sync(self.patient, cursor)['changes']['appointments']['deletes'], [self.appointment.pk])
+
+    def test_archived_rows_are_told_apart_from_deleted_ones(self):
+        old = Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date(2020, 1, 6),
+                                         time=time(9), status='Completed')
+        cursor = self.sync(self.patient)['cursor']
+        self.assertEqual(archive.POLICIES[0].archive(timezone.now()), 1)
+        self.assertEqual(ChangeLogEntry.objects.latest('id').action, 'archive')
+        changes = self.sync(self.patient, cursor)['changes']['appointments']
+        self.assertEqual((changes['deletes'], changes['archived']), ([], [old.pk]))
+
+    def test_doctor_gets_the_profiles_of_new_patients(self):
+        cursor = self.sync(self.doctor.user)['cursor']
+        Appointment.objects.create(patient=self.other, doctor=self.doctor, date=date(2030, 1, 3), time=time(9))
+        profiles = self.sync(self.doctor.user, cursor)['changes']['patient-profiles']['upserts']
+        self.assertEqual([row['user_id'] for row in profiles], [self.other.pk])
+
+    def test_long_deltas_are_paged(self):
+        cursor = self.sync(self.patient)['cursor']
+        for hour in (10, 11, 12):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date(2030, 1, 1),
+                                       time=time(hour))
+        pages = 0
+        with mock.patch.object(sync, 'MAX_ENTRIES', 1):
+            while True:
+                body = self.sync(self.patient, cursor)
+                cursor, pages = body['cursor'], pages + 1
+                if not body['has_more']:
+                    break
+        self.assertEqual(pages, 3)
+
+    def test_pruned_log_resets_old_cursors(self):
+        cursor = self.sync(self.patient)['cursor']
+        for hour in (10, 11):
+            Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=date(2030, 1, 1),
+                                       time=time(hour))
+        newest = ChangeLogEntry.objects.latest('id').pk
+        older = ChangeLogEntry.objects.count() - 1
+        self.assertEqual(changelog.prune(timezone.now() + timedelta(seconds=1), batch_size=2), older)
+        self.assertEqual(list(ChangeLogEntry.objects.values_list('id', flat=True)), [newest])
+        self.assertTrue(self.sync(self.patient, cursor)['reset'])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.client.force_login(make_admin())
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(self.patient)
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class CompressionTests(TestCase):
+    body = b'<p>' + b'Appointments and prescriptions. ' * 100 + b'</p>'
+
+    def respond(self, response, accept='gzip'):
+        request = RequestFactory().get('/', headers={'accept-encoding': accept})
+        return compression.CompressionMiddleware(lambda request: response)(request)
+
+    def test_accepted_codings(self):
+        self.assertEqual(compression.accepted_codings('gzip, br;q=0.5, *;q=0, bad;q=x, ;;'),
+                         {'gzip': 1.0, 'br': 0.5, '*': 0.0})
+
+    def test_negotiate(self):
+        self.assertIs(compression.negotiate('gzip;q=0.8, deflate'), compression.GzipEncoder)
+        self.assertIsNone(compression.negotiate('identity, gzip;q=0'))
+        self.assertIsNone(compression.negotiate(''))
+        with mock.patch.object(compression, 'ENCODERS', [compression.GzipEncoder]):
+            self.assertIs(compression.negotiate('*'), compression.GzipEncoder)
+
+    @skipIf(compression.brotli is None, "brotli is not installed.")
+    def test_brotli_wins_ties(self):
+        self.assertIs(compression.negotiate('gzip, br'), compression.BrotliEncoder)
+        self.assertIs(compression.negotiate('gzip, br;q=0.5'), compression.GzipEncoder)
+        response = self.respond(HttpResponse(self.body), accept='br')
+        self.assertEqual(compression.brotli.decompress(response.content), self.body)
+
+    def test_is_compressible(self):
+        self.assertTrue(compression.is_compressible(HttpResponse(self.body)))
+        self.assertTrue(compression.is_compressible(JsonResponse({'text': 'x' * 2000})))
+        self.assertFalse(compression.is_compressible(HttpResponse(b'short')))
+        self.assertFalse(compression.is_compressible(HttpResponse(self.body, content_type='application/pdf')))
+        self.assertFalse(compression.is_compressible(HttpResponse(self.body, status=206)))
+        ranged = HttpResponse(self.body)
+        ranged['Accept-Ranges'] = 'bytes'
+        self.assertFalse(compression.is_compressible(ranged))
+
+    def test_gzipped_response_gets_a_weak_etag(self):
+        response = HttpResponse(self.body)
+        response['ETag'] = '"v1"'
+        response = self.respond(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"v1"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertEqual(gzip.decompress(response.content), self.body)
+
+    def test_pages_with_a_csrf_token_are_only_gzipped(self):
+        for accept, coding in (('br, gzip', 'gzip'), ('br', None)):
+            response = HttpResponse(self.body)
+            response.set_cookie(settings.CSRF_COOKIE_NAME, 'token')
+            self.assertEqual(self.respond(response, accept=accept).get('Content-Encoding'), coding)
+
+    def test_no_transform_keeps_the_strong_etag(self):
+        response = HttpResponse(self.body)
+        response['ETag'] = '"v1"'
+        response['Cache-Control'] = 'no-transform'
+        response = self.respond(response)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['ETag'], '"v1"')
+
+    def test_uncompressible_and_unaccepted_responses_are_left_alone(self):
+        self.assertNotIn('Content-Encoding', self.respond(HttpResponse(self.body), accept='identity'))
+        self.assertFalse(self.respond(HttpResponse(b'short')).has_header('Vary'))
+
+    def test_event_streams_are_flushed_after_every_event(self):
+        events = [b'data: %d\n\n' % number for number in range(3)]
+        response = self.respond(StreamingHttpResponse(iter(events), content_type='text/event-stream'))
+        decompressor = zlib.decompressobj(wbits=31)
+        received = [decompressor.decompress(chunk) for chunk in response.streaming_content]
+        self.assertEqual(received[:3], events)
+        self.assertFalse(response.has_header('Content-Length'))
@@ -1,7 +1,7 @@
 
 
 from django.urls import path
-from . import views
+from . import api, sync, views
 from .views import (
     PatientProfileView, DoctorProfileView, AppointmentCreateView, AppointmentListView,
     BillingListView,
@@ -43,6 +43,7 @@ urlpatterns = [
     path('register-doctor/', views.register_doctor, name='register_doctor'),
 
     path('user_list/', views.user_list, name='user_list'),
+    path('search/users/', views.user_search, name='user_search'),
     path('doctors/', views.list_doctors, name='doctors_list'),
     path('doctors/delete/<int:doctor_id>/', views.delete_doctor, name='delete_doctor'),
 
@@ -51,14 +52,26 @@ urlpatterns = [
 
 
     path('appointments/', views.DoctorAppointmentListView.as_view(), name='appointment_list'),
+    path('appointments/mine/', AppointmentListView.as_view(), name='patient_appointment_list'),
     path('appointments/new/', views.AppointmentCreateView.as_view(), name='appointment_create'),
+    path('appointments/available-doctors/', views.get_available_doctors, name='available_doctors'),
     path('appointments/confirm/<int:appointment_id>/', views.confirm_appointment, name='confirm_booking'),
     path('appointments/<int:pk>/delete/', AppointmentDeleteView.as_view(), name='appointment_delete'),
+    path('appointments/waitlist/', views.my_waitlist, name='my_waitlist'),
+    path('appointments/waitlist/join/', views.join_waitlist, name='join_waitlist'),
+    path('appointments/waitlist/<int:pk>/respond/', views.respond_to_waitlist_offer, name='respond_to_waitlist_offer'),
+    path('appointments/series/new/', views.AppointmentSeriesCreateView.as_view(), name='appointment_series_create'),
+    path('appointments/series/<int:pk>/', views.AppointmentSeriesDetailView.as_view(), name='appointment_series_detail'),
+    path('appointments/series/<int:pk>/edit/', views.AppointmentSeriesUpdateView.as_view(), name='appointment_series_update'),
+    path('appointments/series/<int:pk>/cancel/', views.cancel_appointment_series, name='appointment_series_cancel'),
+    path('calendar/', views.calendar_settings, name='calendar_settings'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
     path('appointmentlist/',views.AdminAppointmentListView.as_view(), name='admin_appointment_list'),
 
 
     # Doctor Views
     path('appointments/doctor/', views.DoctorAppointmentListView.as_view(), name='doctor_appointment_list'),
+    path('appointments/doctor/agenda/', views.doctor_agenda, name='doctor_agenda'),
 
     path('patients/<int:patient_id>/medical-history/', views.add_medical_history, name='add_medical_history'),
 
@@ -67,12 +80,17 @@ urlpatterns = [
 
     path('medical-history/<int:patient_id>/', patient_medical_history, name='patient_medical_history'),
     path('prescriptions/<int:patient_id>/', patient_prescriptions, name='patient_prescriptions'),
+    path('prescriptions/print/<int:pk>/', views.print_prescription, name='print_prescription'),
+    path('prescriptions/print/<int:pk>/<str:digest>/', views.printed_prescription, name='printed_prescription'),
+    path('medical-records/<int:record_id>/attachments/new/', views.upload_attachment, name='upload_attachment'),
+    path('attachments/<int:pk>/', views.download_attachment, name='download_attachment'),
+    path('attachments/<int:pk>/thumbnail/', views.attachment_thumbnail, name='attachment_thumbnail'),
 
     # Billing
     path('billing/', BillingListView.as_view(), name='billing_list'),
 
     # E-Prescriptions
-
+    path('prescriptions/', views.PrescriptionListView.as_view(), name='prescription_list'),
     path('prescribe/<int:appointment_id>/', views.prescribe_medicine, name='prescribe_medicine'),
 
     # Facilities
@@ -101,6 +119,18 @@ urlpatterns = [
     path('admin/delete-specialization/<int:specialization_id>/', delete_specialization, name='delete_specialization'),
     path('admin/patients/<int:patient_id>/', views.admin_patient_detail, name='patient_detail'),
     path('admin/patients/', views.admin_patient_list, name='patient_list'),
+    path('reports/branches/', views.branch_report, name='branch_report'),
+    path('reports/cache/', views.cache_stats, name='cache_stats'),
+    path('reports/utilization/', views.utilization_report, name='utilization_report'),
+    path('board/', views.live_board, name='live_board'),
+    path('board/events/', views.live_board_events, name='live_board_events'),
+    path('reports/deletions/<int:job_id>/', views.deletion_job, name='deletion_job'),
+
+    # JSON API
+
+    path('api/v1/sync/', sync.sync, name='sync'),
+    path('api/v1/<slug:resource>/', api.api_list, name='api_list'),
+    path('api/v1/<slug:resource>/<int:pk>/', api.api_detail, name='api_detail'),
 
     # payment
 
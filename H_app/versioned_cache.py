@@ -0,0 +1,316 @@
+"""
+Cached values invalidated by generation counters instead of explicit deletes.
+
+Every tracked model has a generation counter in the cache, and optionally one per
+owner (e.g. per patient for Billing). `track()` connects post_save/post_delete so
+that any write bumps the model's counter and the counters of the owners involved,
+before and after the change. VersionedQuerySet does the same for update(),
+bulk_update() (which is built on update()) and bulk_create(), which send no signals.
+Bumps are applied when the transaction commits, so a reader never caches data from
+before a commit under the generation that follows it.
+
+A CachedValue declares what it depends on:
+
+    BILLS = CachedValue('patient-bills', [(Billing, 'patient')])
+    rows = BILLS.get_or_set(build, owner=request.user.pk)
+
+It stores the value together with the generations it was built under. An entry
+whose generations no longer match is stale: it is ignored and rebuilt, never
+deleted. Generation counters start from a timestamp, so a counter evicted from the
+cache never comes back at a value an old entry was stored under.
+
+Values depending on models in branch databases are cached per database. Hits and
+misses are counted per CachedValue in the cache; see `stats()` and
+`manage.py cache_stats`.
+
+Counters only work if every process bumps and reads the same ones: web workers
+and the cron commands that write (archive_cold_rows, process_deletion_jobs,
+expire_waitlist_holds, ...) must share one cache. A process-local cache such as
+LocMemCache keeps other processes' bumps from ever reaching a worker, which then
+serves stale values until they expire. `manage.py check --deploy` reports it as
+an error (check_shared_cache).
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .branches import current_database, is_sharded
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+OWNER_BATCH_SIZE = 900
+PROCESS_LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+_tracked = {}
+_registry = {}
+_pending = threading.local()
+
+
+class Tracking:
+    def __init__(self, model, owners, ignore_fields, on_create):
+        self.model = model
+        self.owners = tuple(owners)
+        self.attnames = tuple(model._meta.get_field(owner).attname for owner in owners)
+        self.ignore_fields = frozenset(ignore_fields)
+        self.on_create = on_create
+        self.label = model._meta.label_lower
+
+
+def model_key(model):
+    return f'generation:{model._meta.label_lower}'
+
+
+def owner_key(model, owner, value):
+    return f'generation:{model._meta.label_lower}:{owner}:{value}'
+
+
+def _increment(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def generation(key):
+    """
+    The current value of a generation counter, started if it does not exist yet.
+    """
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def _flush(using):
+    keys = _pending.keys.pop(using, set())
+    _increment(keys)
+
+
+def bump(keys, using):
+    """
+    Bumps generation counters once the current transaction on `using` commits.
+    """
+    if not transaction.get_connection(using).in_atomic_block:
+        _increment(set(keys))
+        return
+    if not hasattr(_pending, 'keys'):
+        _pending.keys = defaultdict(set)
+    _pending.keys[using].update(keys)
+    transaction.on_commit(lambda: _flush(using), using=using)
+
+
+def _owner_keys(tracking, rows):
+    """
+    Owner generation keys for rows of owner values, as read with values_list(*attnames).
+    """
+    return {
+        owner_key(tracking.model, owner, value)
+        for row in rows
+        for owner, value in zip(tracking.owners, row)
+        if value is not None
+    }
+
+
+def _owners_of(tracking, using, pks):
+    rows = set()
+    manager = tracking.model._base_manager.using(using)
+    for start in range(0, len(pks), OWNER_BATCH_SIZE):
+        rows.update(manager.filter(pk__in=pks[start:start + OWNER_BATCH_SIZE]).values_list(*tracking.attnames))
+    return rows
+
+
+def _remember_owners(sender, instance, using, **kwargs):
+    tracking = _tracked[sender]
+    instance._previous_owners = None
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_owners = (
+            sender._base_manager.using(using).filter(pk=instance.pk).values_list(*tracking.attnames).first()
+        )
+
+
+def _changed(sender, instance, using, created=False, update_fields=None, **kwargs):
+    tracking = _tracked[sender]
+    if created and not tracking.on_create:
+        return
+    if update_fields is not None and set(update_fields) <= tracking.ignore_fields:
+        return
+    rows = [tuple(getattr(instance, attname) for attname in tracking.attnames)]
+    previous = getattr(instance, '_previous_owners', None)
+    if previous:
+        rows.append(previous)
+    bump({model_key(sender)} | _owner_keys(tracking, rows), using)
+
+
+def bump_rows(model, rows, using):
+    """
+    Bumps `model`'s generations for rows changed without signals, given as dicts
+    holding the owners' attnames (archived rows; see archive.py).
+    """
+    tracking = _tracked.get(model)
+    if tracking is None or not rows:
+        return
+    owners = {tuple(row[attname] for attname in tracking.attnames) for row in rows}
+    bump({model_key(model)} | _owner_keys(tracking, owners), using)
+
+
+def track(model, owners=(), ignore_fields=(), on_create=True):
+    """
+    Bumps `model`'s generations whenever its rows change. `owners` are foreign keys
+    with their own counters; saves touching only `ignore_fields` are ignored, and
+    on_create=False ignores new rows (for models whose new rows cannot be in any
+    cached value yet).
+    """
+    _tracked[model] = Tracking(model, owners, ignore_fields, on_create)
+    uid = f'versioned_cache:{model._meta.label_lower}'
+    if owners:
+        pre_save.connect(_remember_owners, sender=model, dispatch_uid=uid)
+    post_save.connect(_changed, sender=model, dispatch_uid=uid)
+    post_delete.connect(_changed, sender=model, dispatch_uid=uid)
+
+
+class VersionedQuerySet(models.QuerySet):
+    """
+    Bumps generations for bulk writes on tracked models.
+    """
+
+    def update(self, **kwargs):
+        tracking = _tracked.get(self.model)
+        if tracking is None:
+            return super().update(**kwargs)
+        unordered = self.order_by()
+        before = set(unordered.values_list(*tracking.attnames).distinct()) if tracking.attnames else set()
+        reassigned = any(owner in kwargs or attname in kwargs
+                         for owner, attname in zip(tracking.owners, tracking.attnames))
+        pks = list(unordered.values_list('pk', flat=True)) if reassigned else []
+        rows = super().update(**kwargs)
+        after = _owners_of(tracking, self.db, pks) if reassigned else set()
+        bump({model_key(self.model)} | _owner_keys(tracking, before | after), self.db)
+        return rows
+
+    update.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        tracking = _tracked.get(self.model)
+        if tracking is not None and objs:
+            rows = {tuple(getattr(obj, attname) for attname in tracking.attnames) for obj in objs}
+            bump({model_key(self.model)} | _owner_keys(tracking, rows), self.db)
+        return objs
+
+
+class CachedValue:
+    def __init__(self, name, depends_on, timeout=DEFAULT_TIMEOUT):
+        """
+        `depends_on` lists models, whose every change invalidates the value, and
+        (model, owner) pairs, where only changes to the given owner's rows do.
+        """
+        self.name = name
+        self.models = [dep for dep in depends_on if not isinstance(dep, tuple)]
+        self.owned = [dep for dep in depends_on if isinstance(dep, tuple)]
+        self.per_database = any(is_sharded(model) for model in self.models + [model for model, _ in self.owned])
+        self.timeout = timeout
+        self._checked = False
+        _registry[name] = self
+
+    def _check(self):
+        for model in self.models + [model for model, _ in self.owned]:
+            if model not in _tracked:
+                raise ImproperlyConfigured(f"{self.name} depends on {model.__name__}, which is not tracked.")
+        for model, owner in self.owned:
+            if owner not in _tracked[model].owners:
+                raise ImproperlyConfigured(f"{model.__name__} is not tracked per {owner}.")
+        self._checked = True
+
+    def key(self, *parts, owner=None):
+        database = current_database() if self.per_database else ''
+        return ':'.join(['cached', self.name, database, str(owner or ''), *map(str, parts)])
+
+    def generation_keys(self, owner=None):
+        keys = [model_key(model) for model in self.models]
+        if self.owned:
+            if owner is None:
+                raise ValueError(f"{self.name} needs an owner.")
+            keys += [owner_key(model, field, owner) for model, field in self.owned]
+        return keys
+
+    def get_or_set(self, build, *parts, owner=None):
+        """
+        Returns the cached value, or build() stored under the current generations.
+        """
+        if not self._checked:
+            self._check()
+        key = self.key(*parts, owner=owner)
+        generation_keys = self.generation_keys(owner)
+        found = cache.get_many([key, *generation_keys])
+        generations = []
+        for generation_key in generation_keys:
+            if generation_key not in found:
+                found[generation_key] = generation(generation_key)
+            generations.append(found[generation_key])
+        generations = tuple(generations)
+
+        entry = found.get(key)
+        if entry is not None and entry[0] == generations:
+            _count(self.name, 'hits')
+            return entry[1]
+        _count(self.name, 'misses')
+        value = build()
+        cache.set(key, (generations, value), self.timeout)
+        return value
+
+
+def _stats_key(name, outcome):
+    return f'cached-stats:{name}:{outcome}'
+
+
+def _count(name, outcome):
+    key = _stats_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats():
+    """
+    {name: {'hits', 'misses', 'hit_rate'}} for every declared CachedValue.
+    """
+    keys = [_stats_key(name, outcome) for name in _registry for outcome in ('hits', 'misses')]
+    counts = cache.get_many(keys)
+    result = {}
+    for name in sorted(_registry):
+        hits = counts.get(_stats_key(name, 'hits'), 0)
+        misses = counts.get(_stats_key(name, 'misses'), 0)
+        result[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+    return result
+
+
+def reset_stats():
+    cache.delete_many([_stats_key(name, outcome) for name in _registry for outcome in ('hits', 'misses')])
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    A deployment runs several processes, so the cache has to be shared for
+    generation counters, agendas and rate limits to hold.
+    """
+    backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_BACKENDS:
+        return []
+    return [checks.Error(
+        f"The default cache ({backend}) is local to each process.",
+        hint="Set REDIS_URL, or configure another shared cache in CACHES: cached pages, agendas and "
+             "calendar feeds are invalidated through it, and writes from other workers and from "
+             "cron commands would not reach this one.",
+        id='H_app.E001',
+    )]
@@ -0,0 +1,30 @@
+"""
+Views, split by domain. Everything is re-exported here so `views.<name>` keeps working.
+"""
+from .pages import home, Services, Contact, About, success_page
+from .auth import (
+    signup, user_login, dashboard_redirect, patient_dashboard, doctor_dashboard, admin_dashboard, logout,
+    PatientProfileView, register_patient, register_doctor, DoctorProfileView
+)
+from .appointments import (
+    AppointmentBaseView, AppointmentListView, AppointmentCreateView, confirm_appointment,
+    DoctorAppointmentListView, doctor_agenda, AdminAppointmentListView, AppointmentDeleteView,
+    AppointmentSeriesCreateView, AppointmentSeriesDetailView, AppointmentSeriesUpdateView, cancel_appointment_series,
+    check_appointment_status, get_available_doctors, join_waitlist, my_waitlist, respond_to_waitlist_offer,
+    calendar_settings, calendar_feed
+)
+from .records import (
+    add_medical_history, patient_medical_history, PrescriptionListView, prescribe_medicine,
+    patient_prescriptions, upload_attachment, download_attachment, attachment_thumbnail, print_prescription,
+    printed_prescription
+)
+from .billing import BillingListView, make_payment, process_payment, payment_success
+from .admin import (
+    admin_add_doctor, admin_remove_doctor, manage_specializations, delete_specialization, user_list,
+    list_doctors, delete_doctor, admin_patient_detail, admin_patient_list, user_search, branch_report,
+    cache_stats, utilization_report, live_board, live_board_events, deletion_job
+)
+from .facilities import (
+    HealthEducationResourceListView, HealthEducationResourceCreateView, FacilityListView, FacilityCreateView,
+    add_health_resource, facility_create
+)
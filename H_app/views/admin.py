@@ -0,0 +1,255 @@
+"""
+Hospital administration: doctors, specializations, user/patient management and
+reports across branches.
+"""
+import time
+from datetime import date, timedelta
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db.models import Count, Q, Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+
+from ..forms import CustomUserSignupForm
+from ..models import (
+    Appointment, Billing, CustomUser, DeletionJob, DoctorProfile, MedicalRecord, Prescription, Specialization
+)
+from .. import live
+from ..audit import audit_access
+from ..branches import branches_in, current_database, fan_out, get_branches
+from ..deletion import start_deletion
+from ..projections import PATIENT_ROW
+from ..search import search_users
+from ..versioned_cache import CachedValue, stats
+
+DOCTORS = CachedValue('doctor-list', [DoctorProfile, CustomUser, Specialization])
+
+USERS_PER_PAGE = 50
+
+
+def admin_add_doctor(request):
+    if request.method == 'POST':
+        form = CustomUserSignupForm(request.POST)
+        if form.is_valid():
+            user = form.save(commit=False)
+            user.user_type = 'doctor'
+            # Doctors join the adding admin's branch unless another was picked.
+            user.branch = form.cleaned_data.get('branch') or request.user.branch
+            user.save()
+            specialization = get_object_or_404(Specialization, id=request.POST.get('specialization'))
+            DoctorProfile.objects.create(user=user, specialization=specialization)
+            return redirect('admin_dashboard')
+    else:
+        form = CustomUserSignupForm()
+    specializations = Specialization.objects.all()
+    return render(request, 'add_doctor.html', {'form': form, 'specializations': specializations})
+
+
+def admin_remove_doctor(request, doctor_id):
+    """
+    Deactivates the doctor and queues the removal of their account; their
+    appointments and records are deleted, or handed to a replacement, in the background.
+    """
+    doctor = get_object_or_404(DoctorProfile, id=doctor_id)
+    replacements = DoctorProfile.objects.filter(user__is_active=True).exclude(pk=doctor.pk).select_related('user')
+    if request.method == 'POST':
+        replacement = None
+        if request.POST.get('reassign_to'):
+            replacement = get_object_or_404(replacements, pk=request.POST['reassign_to'])
+        job = start_deletion(doctor.user, requested_by=request.user, reassign_to=replacement)
+        return redirect('deletion_job', job_id=job.pk)
+    return render(request, 'confirm_remove_doctor.html', {'doctor': doctor, 'replacements': replacements})
+
+
+def manage_specializations(request):
+    if request.method == 'POST':
+        name = request.POST.get('name')
+        if name:
+            Specialization.objects.create(name=name)
+    specializations = Specialization.objects.annotate(doctor_count=Count('doctors')).order_by('name')
+    return render(request, 'manage_specilization.html', {'specializations': specializations})
+
+
+def delete_specialization(request, specialization_id):
+    specialization = get_object_or_404(Specialization, id=specialization_id)
+    if request.method == 'POST':
+        specialization.delete()
+        return redirect('manage_specializations')
+    return render(request, 'confirm_delete_specilization.html', {'specialization': specialization})
+
+
+def user_list(request):
+    """
+    All users, USERS_PER_PAGE at a time (?page=N); the search box finds one directly.
+    """
+    User = get_user_model()
+    users = User.objects.only('username', 'email', 'user_type').order_by('username', 'pk')
+    page = Paginator(users, USERS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'user_list.html', {'users': page, 'page_obj': page})
+
+
+@login_required
+def list_doctors(request):
+    doctors = DOCTORS.get_or_set(
+        lambda: list(DoctorProfile.objects.filter(user__is_active=True).select_related('user', 'specialization'))
+    )
+    return render(request, 'doctor_list.html', {'doctors': doctors})
+
+
+def delete_doctor(request, doctor_id):
+    if request.method == "POST":
+        doctor = get_object_or_404(DoctorProfile, id=doctor_id)
+        start_deletion(doctor.user, requested_by=request.user)
+        messages.success(request, "Doctor deactivated; their profile and records are being deleted in the background.")
+        return redirect('doctors_list')
+
+
+@login_required
+def utilization_report(request):
+    """
+    Occupancy heatmaps, no-show and cancellation rates and booking lead times as JSON,
+    for ?start= to ?end= (ISO dates; by default the last 90 days), per
+    ?group_by=specialization (default) or doctor.
+    """
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        return JsonResponse({"error": "Not allowed."}, status=403)
+    # NumPy is only needed for analytics.
+    from ..analytics import DEFAULT_PERIOD_DAYS, GROUPINGS, MAX_PERIOD_DAYS, appointment_analytics
+
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else date.today()
+        start = (date.fromisoformat(request.GET['start']) if request.GET.get('start')
+                 else end - timedelta(days=DEFAULT_PERIOD_DAYS - 1))
+    except ValueError:
+        return JsonResponse({"error": "Invalid date format"}, status=400)
+    if not 0 <= (end - start).days < MAX_PERIOD_DAYS:
+        return JsonResponse({"error": f"The period must run forwards and span at most {MAX_PERIOD_DAYS} days."},
+                            status=400)
+    group_by = request.GET.get('group_by', GROUPINGS[0])
+    if group_by not in GROUPINGS:
+        return JsonResponse({"error": f"group_by must be one of {', '.join(GROUPINGS)}."}, status=400)
+    return JsonResponse(appointment_analytics(start, end, group_by))
+
+
+@login_required
+def live_board(request):
+    """
+    Today's appointments by status, kept current by live_board_events.
+    """
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        return HttpResponseForbidden("Admins only.")
+    return render(request, 'live_board.html')
+
+
+async def live_board_events(request):
+    """
+    Server-sent events for live_board: a snapshot of today's appointments, then
+    only the changes; see H_app/live.py.
+    """
+    user = await request.auser()
+    if not user.is_authenticated or (user.user_type != 'admin' and not user.is_staff):
+        return HttpResponseForbidden("Admins only.")
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("Live updates need the ASGI server.", status=501)
+    response = StreamingHttpResponse(live.events(current_database()), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def deletion_job(request, job_id):
+    """
+    Progress of a queued account removal.
+    """
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        return HttpResponseForbidden("Admins only.")
+    job = get_object_or_404(DeletionJob, pk=job_id)
+    return render(request, 'deletion_job.html', {'job': job})
+
+
+@audit_access
+def admin_patient_detail(request, patient_id):
+    patient = get_object_or_404(CustomUser, id=patient_id, user_type='patient')
+    return render(request, "patient_detail.html", {"patient": patient})
+
+
+def admin_patient_list(request):
+    patients = PATIENT_ROW(CustomUser.objects.filter(user_type='patient').order_by('id'))
+    return render(request, "patient_list.html", {"patients": patients})
+
+
+@login_required
+def user_search(request):
+    """
+    Type-ahead lookup over username, patient name and phone; returns at most 20 matches.
+    """
+    if request.user.user_type not in ('admin', 'doctor') and not request.user.is_staff:
+        return JsonResponse({"error": "Not allowed."}, status=403)
+    user_type = request.GET.get('type')
+    if user_type not in dict(CustomUser.USER_TYPES):
+        user_type = None
+    return JsonResponse({"results": search_users(request.GET.get('q', ''), user_type=user_type)})
+
+
+REPORT_COLUMNS = (
+    'scheduled', 'completed', 'canceled', 'upcoming', 'medical_records', 'prescriptions',
+    'bills', 'paid', 'pending',
+)
+
+
+def _branch_totals(database):
+    today = date.today()
+    totals = Appointment.objects.aggregate(
+        scheduled=Count('id', filter=Q(status='Scheduled')),
+        completed=Count('id', filter=Q(status='Completed')),
+        canceled=Count('id', filter=Q(status='Canceled')),
+        upcoming=Count('id', filter=Q(status='Scheduled', date__gte=today)),
+    )
+    totals.update(Billing.objects.aggregate(
+        bills=Count('id'),
+        paid=Sum('total_amount', filter=Q(payment_status='Paid')),
+        pending=Sum('total_amount', filter=Q(payment_status='Pending')),
+    ))
+    totals['medical_records'] = MedicalRecord.objects.count()
+    totals['prescriptions'] = Prescription.objects.count()
+    return {column: totals[column] or 0 for column in REPORT_COLUMNS}
+
+
+@login_required
+def branch_report(request):
+    """
+    Activity and billing per branch database, queried in parallel and merged.
+    """
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        return HttpResponseForbidden("Admins only.")
+    started = time.perf_counter()
+    results = fan_out(_branch_totals)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    names = {key: config.get('name', key) for key, config in get_branches().items()}
+    rows = [
+        {
+            'database': database,
+            'branches': ', '.join(names.get(key, 'Main hospital') for key in branches_in(database)),
+            **totals,
+        }
+        for database, totals in results.items()
+    ]
+    overall = {column: sum(row[column] for row in rows) for column in REPORT_COLUMNS}
+    return render(request, 'branch_report.html', {'rows': rows, 'overall': overall, 'elapsed_ms': elapsed_ms})
+
+
+@login_required
+def cache_stats(request):
+    """
+    Hit and miss counts of the versioned caches.
+    """
+    if request.user.user_type != 'admin' and not request.user.is_staff:
+        return JsonResponse({"error": "Not allowed."}, status=403)
+    return JsonResponse({"caches": stats()})
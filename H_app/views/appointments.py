@@ -0,0 +1,402 @@
+"""
+Booking, confirming, listing and canceling appointments, including recurring series,
+and the iCalendar feeds of appointments.
+"""
+import json
+from datetime import date, datetime, timedelta
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.generic import ListView, DetailView, CreateView, DeleteView, UpdateView
+from django.urls import reverse, reverse_lazy
+from django.http import Http404, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_safe
+
+from ..forms import AppointmentForm, AppointmentSeriesForm, AppointmentSeriesUpdateForm, WaitlistEntryForm
+from ..models import CustomUser, Appointment, AppointmentSeries, ArchivedAppointment, WaitlistEntry, lock_doctor
+from ..agenda import render_agenda
+from ..archive import wants_archived, with_archived
+from ..profiles import get_profile, get_profile_or_404
+from ..projections import APPOINTMENT_ROW
+from ..ratelimit import ratelimit
+from ..versioned_cache import CachedValue
+from .. import branches, ical, waitlist
+
+# Rows of the patient's appointment list; doctor usernames come from CustomUser.
+PATIENT_APPOINTMENTS = CachedValue('patient-appointments', [(Appointment, 'patient'), CustomUser])
+
+
+class AppointmentBaseView:
+    model = Appointment
+    context_object_name = 'appointments'
+
+
+@method_decorator(login_required, name='dispatch')
+class AppointmentListView(AppointmentBaseView, ListView):
+    
+    template_name = 'appointments/appointment_list.html'
+
+    def get_queryset(self):
+       
+        get_profile_or_404(self.request.user, 'patient')
+        
+        patient = self.request.user
+        appointments = APPOINTMENT_ROW.wrap(PATIENT_APPOINTMENTS.get_or_set(
+            lambda: APPOINTMENT_ROW.values(Appointment.objects.filter(patient=patient)), owner=patient.pk
+        ))
+        if wants_archived(self.request):
+            archived = APPOINTMENT_ROW(ArchivedAppointment.objects.filter(patient=self.request.user))
+            return with_archived(appointments, archived, 'date')
+        return appointments
+
+
+@method_decorator(login_required, name='dispatch')
+@method_decorator(ratelimit('booking', '20/h'), name='dispatch')
+class AppointmentCreateView(CreateView):
+    model = Appointment
+    form_class = AppointmentForm
+    template_name = 'appointments/appointment_form.html'
+
+    def form_valid(self, form):
+       
+        form.instance.patient = self.request.user
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse_lazy('confirm_booking', kwargs={'appointment_id': self.object.id})
+
+
+@login_required
+def confirm_appointment(request, appointment_id):
+    """
+    Displays the confirmation page for an appointment and allows the patient to confirm it.
+    """
+    
+    if get_profile(request.user, 'patient') is None:
+        return JsonResponse({"status": "error", "message": "Patient profile not found."}, status=404)
+
+    
+    appointment = get_object_or_404(Appointment, id=appointment_id, patient=request.user)
+
+    
+    if appointment.status == 'Confirmed':
+        return JsonResponse({"status": "error", "message": "Appointment is already confirmed."}, status=400)
+
+    if request.method == 'POST':
+        
+        appointment.status = 'Confirmed'
+        appointment.save()
+        
+        return JsonResponse({"status": "success", "message": "Appointment confirmed successfully!"})
+
+    
+    return render(request, 'appointments/appointment_confirm.html', {'appointment': appointment})
+
+
+@method_decorator(login_required, name='dispatch')
+class DoctorAppointmentListView(AppointmentBaseView, ListView):
+   
+    template_name = 'appointments/doctor_appointment_list.html'
+
+    def get_queryset(self):
+       
+        doctor_profile = get_profile_or_404(self.request.user, 'doctor')
+        
+        return Appointment.objects.filter(doctor=doctor_profile)
+
+
+@login_required
+def doctor_agenda(request):
+    """
+    One day of the doctor's appointments (today unless ?date=YYYY-MM-DD), served
+    from the per doctor-day cache in agenda.py.
+    """
+    doctor_profile = get_profile_or_404(request.user, 'doctor')
+    try:
+        day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        day = date.today()
+    return render(request, 'appointments/doctor_agenda.html', {
+        'day': day,
+        'previous_day': day - timedelta(days=1),
+        'next_day': day + timedelta(days=1),
+        'agenda': mark_safe(render_agenda(doctor_profile.id, day)),
+    })
+
+
+@method_decorator(login_required, name='dispatch')
+class AdminAppointmentListView(LoginRequiredMixin, ListView):
+    model = Appointment
+    template_name = 'appointments/admin_appointment_list.html'
+    context_object_name = 'appointments'
+
+    def get_queryset(self):
+        return Appointment.objects.all() 
+
+
+@method_decorator(login_required, name='dispatch')
+
+
+@method_decorator(login_required, name='dispatch')
+class AppointmentDeleteView(LoginRequiredMixin, DeleteView):
+    model = Appointment
+    template_name = 'appointments/appointment_confirm_delete.html'
+    context_object_name = 'appointment'
+
+    def get_success_url(self):
+        return reverse_lazy('admin_appointment_list')  
+
+
+def _conflict_message(conflicts):
+    dates = ', '.join(sorted({str(appointment.date) for appointment in conflicts}))
+    return f"The doctor is already booked at this time on: {dates}"
+
+
+@method_decorator(login_required, name='dispatch')
+@method_decorator(ratelimit('booking', '20/h'), name='dispatch')
+class AppointmentSeriesCreateView(CreateView):
+    """
+    Books a recurring series; all occurrences are conflict-checked and inserted at once.
+    """
+    model = AppointmentSeries
+    form_class = AppointmentSeriesForm
+    template_name = 'appointments/appointment_series_form.html'
+
+    def form_valid(self, form):
+        form.instance.patient = self.request.user
+        conflicts = form.instance.book()
+        if conflicts:
+            form.add_error(None, _conflict_message(conflicts))
+            return self.form_invalid(form)
+        self.object = form.instance
+        return HttpResponseRedirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse_lazy('appointment_series_detail', kwargs={'pk': self.object.pk})
+
+
+@method_decorator(login_required, name='dispatch')
+class AppointmentSeriesDetailView(DetailView):
+    model = AppointmentSeries
+    template_name = 'appointments/appointment_series_detail.html'
+    context_object_name = 'series'
+
+    def get_queryset(self):
+        return AppointmentSeries.objects.filter(patient=self.request.user).select_related('doctor__user')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['appointments'] = self.object.appointments.order_by('date', 'time')
+        return context
+
+
+@method_decorator(login_required, name='dispatch')
+class AppointmentSeriesUpdateView(UpdateView):
+    """
+    Edits every upcoming occurrence of a series with a single UPDATE.
+    """
+    model = AppointmentSeries
+    form_class = AppointmentSeriesUpdateForm
+    template_name = 'appointments/appointment_series_form.html'
+
+    def get_queryset(self):
+        return AppointmentSeries.objects.filter(patient=self.request.user)
+
+    def form_valid(self, form):
+        series = form.save(commit=False)
+        changes = {field: form.cleaned_data[field] for field in form.changed_data}
+        using = router.db_for_write(AppointmentSeries)
+        with transaction.atomic(using=using):
+            lock_doctor(series.doctor_id, using)
+            dates = list(series.upcoming_appointments().values_list('date', flat=True))
+            conflicts = series.find_conflicts(dates)
+            if not conflicts:
+                series.save()
+                if changes:
+                    series.update_upcoming(**changes)
+        if conflicts:
+            form.add_error(None, _conflict_message(conflicts))
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
+
+    def get_success_url(self):
+        return reverse_lazy('appointment_series_detail', kwargs={'pk': self.object.pk})
+
+
+@login_required
+def cancel_appointment_series(request, pk):
+    series = get_object_or_404(AppointmentSeries, pk=pk, patient=request.user)
+    if request.method == 'POST':
+        canceled = series.cancel()
+        messages.success(request, f"{canceled} upcoming appointments canceled.")
+        return redirect('appointment_series_detail', pk=series.pk)
+    return render(request, 'appointments/appointment_series_confirm_cancel.html', {'series': series})
+
+
+@login_required
+def join_waitlist(request):
+    if request.method == 'POST':
+        form = WaitlistEntryForm(request.POST)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.patient = request.user
+            if WaitlistEntry.objects.filter(
+                patient=request.user, doctor=entry.doctor, status__in=['Waiting', 'Offered']
+            ).exists():
+                form.add_error('doctor', "You are already on this doctor's waitlist.")
+            else:
+                entry.save()
+                messages.success(request, "You have been added to the waitlist.")
+                return redirect('my_waitlist')
+    else:
+        form = WaitlistEntryForm()
+
+    return render(request, 'appointments/waitlist_form.html', {'form': form})
+
+
+@login_required
+def my_waitlist(request):
+    """
+    The patient's waitlist entries, with their place in each doctor's queue and any held slot.
+    """
+    entries = list(
+        WaitlistEntry.objects.filter(patient=request.user).select_related('doctor__user').order_by('-requested_at')
+    )
+    for entry in entries:
+        if entry.status == 'Waiting':
+            entry.position = waitlist.queue(entry.doctor_id).filter(
+                Q(urgency__gt=entry.urgency) | Q(urgency=entry.urgency, requested_at__lt=entry.requested_at)
+            ).count() + 1
+    return render(request, 'appointments/waitlist.html', {'entries': entries})
+
+
+@login_required
+def respond_to_waitlist_offer(request, pk):
+    entry = get_object_or_404(WaitlistEntry, pk=pk, patient=request.user)
+    if request.method != 'POST':
+        return redirect('my_waitlist')
+
+    action = request.POST.get('action')
+    if action == 'accept':
+        appointment = waitlist.accept(entry)
+        if appointment:
+            messages.success(request, f"Booked for {appointment.date} at {appointment.time:%H:%M}.")
+        else:
+            messages.error(request, "Sorry, this offer is no longer available.")
+    elif action == 'decline':
+        waitlist.decline(entry)
+        messages.info(request, "Offer declined.")
+    elif action == 'withdraw':
+        if entry.status == 'Offered':
+            waitlist.decline(entry)
+        WaitlistEntry.objects.filter(pk=entry.pk, status='Waiting').update(status='Withdrawn')
+        messages.info(request, "You have left the waitlist.")
+    return redirect('my_waitlist')
+
+
+def check_appointment_status(request, pk):
+    appointment = get_object_or_404(Appointment, pk=pk)
+    return JsonResponse({"status": appointment.status})
+
+
+def _availability_on(doctor, day_of_week):
+    """
+    `availability` is entered either as JSON ({"Monday": "9-17", ...}) or as free text
+    listing the days; returns the hours for the day, or None if not available.
+    """
+    try:
+        availability = json.loads(doctor.availability or '')
+    except ValueError:
+        availability = doctor.availability or ''
+    if isinstance(availability, dict):
+        return availability.get(day_of_week)
+    return availability if day_of_week in str(availability) else None
+
+
+def get_available_doctors(request):
+    selected_date = request.GET.get('date')
+    specialization_id = request.GET.get('specialization')
+
+    if not selected_date:
+        return JsonResponse({"error": "Date is required"}, status=400)
+
+    try:
+        selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({"error": "Invalid date format"}, status=400)
+
+    day_of_week = selected_date_obj.strftime('%A')
+
+    doctors = branches.doctors()
+    if specialization_id:
+        if not specialization_id.isdigit():
+            return JsonResponse({"error": "Invalid specialization"}, status=400)
+        doctors = doctors.filter(specialization_id=specialization_id)
+
+    available_doctors = []
+    for doctor in doctors:
+        hours = _availability_on(doctor, day_of_week)
+        if hours:
+            has_conflicts = Appointment.objects.filter(
+                doctor=doctor,
+                date=selected_date_obj
+            ).exists()
+            if not has_conflicts:
+                available_doctors.append({
+                    "id": doctor.id,
+                    "name": doctor.user.get_full_name(),
+                    "specialization": doctor.specialization.name if doctor.specialization else None,
+                    "availability": hours
+                })
+
+    return JsonResponse({"available_doctors": available_doctors})
+
+
+@login_required
+def calendar_settings(request):
+    """
+    Shows the user's feed URL; POST issues a new one.
+    """
+    if request.user.user_type not in ('doctor', 'patient'):
+        messages.error(request, "Calendar feeds are available to doctors and patients.")
+        return redirect('dashboard')
+    if request.method == 'POST':
+        token = ical.reset_token(request.user)
+        messages.success(request, "Your calendar feed has a new address; the old one no longer works.")
+    else:
+        token = ical.feed_token(request.user)
+    feed_url = request.build_absolute_uri(reverse('calendar_feed', args=[token]))
+    return render(request, 'appointments/calendar_feed.html', {
+        'feed_url': feed_url,
+        'webcal_url': 'webcal://' + feed_url.split('://', 1)[1],
+        'past_days': ical.WINDOW_PAST_DAYS,
+        'future_days': ical.WINDOW_FUTURE_DAYS,
+    })
+
+
+@require_safe
+def calendar_feed(request, token):
+    """
+    The iCalendar feed of a token, for calendar apps; 304 while it is unchanged.
+    """
+    feed = ical.resolve(token)
+    if feed is None:
+        raise Http404("No calendar feed found.")
+    today = date.today()
+    etag, last_modified = ical.validators(feed, today)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(ical.stream(feed, today), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="appointments.ics"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,165 @@
+"""
+Signup, login/logout, dashboards and profile registration.
+"""
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render, redirect
+from django.contrib.auth import logout as auth_logout
+from django.contrib.auth import login
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.generic import DetailView
+
+from ..forms import CustomUserLoginForm, CustomUserSignupForm, DoctorProfileForm, PatientProfileForm
+from ..models import PatientProfile
+from ..profiles import get_or_create_profile, get_profile_or_404
+from ..recommendations import recommended_resources
+from ..ratelimit import ratelimit
+
+
+@ratelimit('signup', '5/h', keys=('ip',))
+def signup(request):
+    if request.method == 'POST':
+        form = CustomUserSignupForm(request.POST)
+        if form.is_valid():
+            form.save()
+            return redirect('user_login')
+    else:
+        form = CustomUserSignupForm()
+    return render(request, 'signup.html', {'form': form})
+
+
+@ratelimit('login', '10/m', keys=('ip', 'username'))
+def user_login(request):
+    if request.method == 'POST':
+        form = CustomUserLoginForm(data=request.POST)
+        if form.is_valid():
+            user = form.get_user()
+            login(request, user)
+            return redirect(dashboard_redirect)
+    else:
+        form = CustomUserLoginForm()
+    return render(request, 'login.html', {'form': form})
+
+
+def dashboard_redirect(request):
+    if not request.user.is_authenticated:
+        return redirect('user_login')
+
+    user_type_redirects = {
+        'patient': 'patient_dashboard',
+        'doctor': 'doctor_dashboard',
+        'admin': 'admin_dashboard'
+    }
+    return redirect(user_type_redirects.get(request.user.user_type, 'user_login'))
+
+
+@login_required
+def patient_dashboard(request):
+    return render(request, 'patient_dashboard.html', {
+        'recommended_resources': recommended_resources(request.user),
+    })
+
+
+@login_required
+def doctor_dashboard(request):
+    return render(request, 'doctor_dashboard.html')
+
+
+@login_required
+def admin_dashboard(request):
+    return render(request, 'admin_dashboard.html')
+
+
+def logout(request):
+    auth_logout(request)
+    return redirect('base')
+
+
+@method_decorator(login_required, name='dispatch')
+class PatientProfileView(DetailView):
+    """
+    Displays and allows updates to the PatientProfile for the logged-in user.
+    """
+    model = PatientProfile
+    template_name = 'patient_profile.html'
+
+    def get_object(self):
+       
+        return get_or_create_profile(self.request.user, 'patient')
+
+    def post(self, request, *args, **kwargs):
+       
+        profile = self.get_object()
+        form = PatientProfileForm(request.POST, instance=profile)
+
+        if form.is_valid():
+            form.save()
+            return redirect('patient_dashboard')  
+        else:
+           
+            return render(request, self.template_name, {'form': form, 'profile': profile})
+
+
+@login_required
+def register_patient(request):
+    
+    profile = get_or_create_profile(request.user, 'patient')
+
+    if request.method == 'POST':
+        form = PatientProfileForm(request.POST, instance=profile)
+        if form.is_valid():
+            form.save()
+            return redirect('patient_dashboard')  
+    else:
+        form = PatientProfileForm(instance=profile)
+
+    return render(request, 'patient_register.html', {'form': form})
+
+
+@login_required
+def register_doctor(request):
+    """
+    Handles doctor registration and profile creation.
+    """
+    if request.method == 'POST':
+        form = DoctorProfileForm(request.POST)
+        if form.is_valid():
+            form.save()  
+            return redirect('doctor_dashboard') 
+        else:
+            print(form.errors) 
+    else:
+        form = DoctorProfileForm()
+
+    return render(request, 'register_doctor.html', {'form': form})
+
+
+class DoctorProfileView(View):
+    template_name = 'register_doctor.html'
+
+    def get(self, request, *args, **kwargs):
+        
+        if request.user.is_authenticated:
+            profile = get_or_create_profile(request.user, 'doctor')
+            form = DoctorProfileForm(instance=profile)
+        else:
+            
+            form = DoctorProfileForm()
+        return render(request, self.template_name, {'form': form})
+
+    def post(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            
+            profile = get_profile_or_404(request.user, 'doctor')
+            form = DoctorProfileForm(request.POST, request.FILES, instance=profile)
+        else:
+           
+            form = DoctorProfileForm(request.POST, request.FILES)
+
+        if form.is_valid():
+            form.save()
+            return redirect('doctor_dashboard')
+        else:
+           
+            print(form.errors)
+        return render(request, self.template_name, {'form': form})
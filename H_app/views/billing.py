@@ -0,0 +1,89 @@
+"""
+Billing lists and payments. The payment gateway client is loaded lazily on first use.
+"""
+import json
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.generic import ListView
+from django.http import JsonResponse
+from django.conf import settings
+
+from ..forms import PaymentForm
+from ..models import Appointment, Billing, Payment
+from ..payments import get_stripe
+from ..projections import BILLING_ROW
+from ..versioned_cache import CachedValue
+
+PATIENT_BILLS = CachedValue('patient-bills', [(Billing, 'patient')])
+
+
+@method_decorator(login_required, name='dispatch')
+class BillingListView(ListView):
+    model = Billing
+    template_name = 'billing/billing_list.html'
+    context_object_name = 'billings'
+
+    def get_queryset(self):
+        patient = self.request.user
+        return BILLING_ROW.wrap(PATIENT_BILLS.get_or_set(
+            lambda: BILLING_ROW.values(Billing.objects.filter(patient=patient)), owner=patient.pk
+        ))
+
+
+def make_payment(request, appointment_id):
+    appointment = get_object_or_404(Appointment, id=appointment_id)
+    if request.method == 'POST':
+        form = PaymentForm(request.POST)
+        if form.is_valid():
+            amount = form.cleaned_data['amount']
+            stripe = get_stripe()
+            try:
+               
+                charge = stripe.Charge.create(
+                    amount=int(amount * 100),  
+                    currency="usd",
+                    description=f"Payment for Appointment ID {appointment_id}",
+                    source=request.POST['stripeToken']  
+                )
+                
+                Payment.objects.create(
+                    appointment=appointment,
+                    amount=amount,
+                    stripe_charge_id=charge['id'],
+                )
+                messages.success(request, "Payment successful!")
+                return redirect('payment_success') 
+            except stripe.error.StripeError as e:
+                messages.error(request, f"Payment error: {str(e)}")
+    else:
+        form = PaymentForm()
+    return render(request, 'payment.html', {
+        'form': form,
+        'appointment': appointment,
+        'stripe_public_key': settings.STRIPE_PUBLIC_KEY
+    })
+
+
+def process_payment(request, appointment_id):
+    if request.method == "POST":
+        appointment = get_object_or_404(Appointment, id=appointment_id)
+        data = json.loads(request.body)
+        stripe = get_stripe()
+        try:
+            
+            intent = stripe.PaymentIntent.create(
+                amount=int(appointment.fee * 100),
+                currency="usd",
+                payment_method=data["payment_method_id"],
+                confirm=True
+            )
+            return JsonResponse({"success": True})
+        except stripe.error.StripeError as e:
+            return JsonResponse({"success": False, "error": str(e)})
+
+
+def payment_success(request):
+    return render(request, "payment_success.html")
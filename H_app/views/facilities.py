@@ -0,0 +1,75 @@
+"""
+Facilities and health education resources.
+"""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render, redirect
+from django.views.generic import ListView, CreateView
+from django.urls import reverse_lazy
+
+from ..forms import FacilityForm, HealthEducationResourceForm
+from ..models import Facility, HealthEducationResource
+from ..versioned_cache import CachedValue
+
+FACILITIES = CachedValue('facility-list', [Facility])
+RESOURCES = CachedValue('resource-list', [HealthEducationResource])
+
+
+class HealthEducationResourceListView(ListView):
+    model = HealthEducationResource
+    template_name = 'education_resources/resource_list.html'
+    context_object_name = 'resources'
+
+    def get_queryset(self):
+        return RESOURCES.get_or_set(lambda: list(HealthEducationResource.objects.all()))
+
+
+class HealthEducationResourceCreateView(CreateView):
+    model = HealthEducationResource
+    form_class = HealthEducationResourceForm
+    template_name = 'education_resources/add_health_resource.html'
+    success_url = reverse_lazy('resource_list')
+
+
+class FacilityListView(ListView):
+    model = Facility
+    template_name = 'facilities/facility_list.html'
+    context_object_name = 'facilities'
+
+    def get_queryset(self):
+        return FACILITIES.get_or_set(lambda: list(Facility.objects.all()))
+
+
+class FacilityCreateView(CreateView):
+    model = Facility
+    form_class = FacilityForm
+    template_name = 'facilities/facility_form.html'
+    success_url = reverse_lazy('facility_list')
+
+
+def add_health_resource(request):
+    if request.method == 'POST':
+        form = HealthEducationResourceForm(request.POST)
+        if form.is_valid():
+            form.save()
+            messages.success(request, 'Health education resource added successfully!')
+            return redirect('add_health_resource')  
+        else:
+            messages.error(request, 'Please correct the errors below.')
+    else:
+        form = HealthEducationResourceForm()
+
+    return render(request, 'add_health_resource.html', {'form': form})
+
+
+@login_required
+def facility_create(request):
+    if request.method == 'POST':
+        form = FacilityForm(request.POST)
+        if form.is_valid():
+            form.save()
+            return redirect('facilities/facility_form') 
+    else:
+        form = FacilityForm()
+    facilities = Facility.objects.all()  
+    return render(request, 'facilities/facility_list.html', { 'form': form, 'facilities': facilities})
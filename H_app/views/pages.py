@@ -0,0 +1,24 @@
+"""
+Static informational pages.
+"""
+from django.shortcuts import render
+
+
+def home(request):
+    return render(request, 'base.html')
+
+
+def Services(request):
+    return render(request, 'services.html')
+
+
+def Contact(request):
+    return render(request, 'contact.html')
+
+
+def About(request):
+    return render(request, 'about.html')
+
+
+def success_page(request):
+    return render(request, 'success.html')
@@ -0,0 +1,237 @@
+"""
+Medical history, prescriptions and medical record attachments.
+"""
+import os
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.generic import ListView
+
+from ..forms import AttachmentForm, PrescriptionForm, MedicalRecordForm
+from ..models import (
+    CustomUser, Appointment, MedicalRecord, MedicalRecordAttachment, Prescription, ArchivedMedicalRecord,
+    ArchivedPrescription
+)
+from ..archive import wants_archived, with_archived
+from ..attachments import HashingUploadHandler, blob_path, serve_file, store, thumbnail_path
+from ..audit import audit_access, record_access
+from ..printing import content_hash, get_document, printable_row
+from ..projections import PRESCRIPTION_ROW
+
+
+@login_required
+def add_medical_history(request, patient_id):
+    patient = get_object_or_404(CustomUser, id=patient_id, user_type='patient')
+
+    
+    if not hasattr(request.user, 'doctor_profile'):
+        return redirect('error_page') 
+
+    if request.method == 'POST':
+        form = MedicalRecordForm(request.POST)
+        if form.is_valid():
+            medical_record = form.save(commit=False)
+            medical_record.patient = patient
+            medical_record.doctor = request.user.doctor_profile  
+            medical_record.save()
+            return redirect('doctor_appointment_list') 
+    else:
+        form = MedicalRecordForm()
+
+    return render(request, 'medical_records/add_medical_history.html', {'form': form, 'patient': patient})
+
+
+@login_required
+@audit_access
+def patient_medical_history(request, patient_id):
+    patient = get_object_or_404(CustomUser, id=patient_id, user_type='patient')
+
+    
+    medical_records = (
+        MedicalRecord.objects.filter(patient=patient).order_by('-created_at').prefetch_related('attachments__blob')
+    )
+    include_archived = wants_archived(request)
+    if include_archived:
+        medical_records = with_archived(
+            medical_records, ArchivedMedicalRecord.objects.filter(patient=patient), 'created_at'
+        )
+
+    return render(request, 'medical_records/patient_medical_history.html', {
+        'patient': patient,
+        'medical_records': medical_records,
+        'include_archived': include_archived,
+    })
+
+
+@method_decorator(login_required, name='dispatch')
+class PrescriptionListView(ListView):
+    model = Prescription
+    template_name = 'prescriptions/prescription_list.html'
+    context_object_name = 'prescriptions'
+
+    def get_queryset(self):
+        return PRESCRIPTION_ROW(Prescription.objects.filter(patient=self.request.user).order_by('-created_at'))
+
+
+@login_required
+def prescribe_medicine(request, appointment_id):
+    appointment = get_object_or_404(Appointment, id=appointment_id)
+
+   
+    if not hasattr(request.user, 'doctor_profile'):
+        return redirect('error_page') 
+
+    if request.method == "POST":
+        form = PrescriptionForm(request.POST)
+        if form.is_valid():
+            prescription = form.save(commit=False)
+            prescription.patient = appointment.patient 
+            prescription.doctor = request.user.doctor_profile  
+            prescription.save()
+            return redirect("doctor_appointment_list")  
+    else:
+        form = PrescriptionForm()
+
+    return render(request, "medical_records/prescribe_medicine.html", {"form": form, "appointment": appointment})
+
+
+@login_required
+@audit_access
+def patient_prescriptions(request, patient_id):
+    patient = get_object_or_404(CustomUser, id=patient_id, user_type='patient')
+
+ 
+    prescriptions = Prescription.objects.filter(patient=patient).order_by('-created_at')
+    include_archived = wants_archived(request)
+    if include_archived:
+        prescriptions = with_archived(
+            prescriptions, ArchivedPrescription.objects.filter(patient=patient), 'created_at'
+        )
+
+    return render(request, 'medical_records/patient_prescriptions.html', {
+        'patient': patient,
+        'prescriptions': prescriptions,
+        'include_archived': include_archived,
+    })
+
+
+def _can_read_records(user, patient_id):
+    return user.pk == patient_id or user.user_type in ('doctor', 'admin') or user.is_staff
+
+
+@csrf_exempt
+@login_required
+def upload_attachment(request, record_id):
+    # The upload handlers must be replaced before anything reads request.POST,
+    # which CsrfViewMiddleware would do; CSRF is checked right after instead.
+    request.upload_handlers = [HashingUploadHandler(request)]
+    return _upload_attachment(request, record_id)
+
+
+@csrf_protect
+def _upload_attachment(request, record_id):
+    record = get_object_or_404(MedicalRecord, id=record_id)
+    if request.user.pk != record.patient_id and not hasattr(request.user, 'doctor_profile'):
+        raise PermissionDenied
+
+    if request.method == 'POST':
+        form = AttachmentForm(request.POST, request.FILES)
+        if form.is_valid():
+            uploaded = form.cleaned_data['file']
+            MedicalRecordAttachment.objects.create(
+                record=record,
+                blob=store(uploaded),
+                filename=os.path.basename(uploaded.name)[:255],
+                uploaded_by=request.user,
+            )
+            return redirect('patient_medical_history', patient_id=record.patient_id)
+    else:
+        form = AttachmentForm()
+
+    return render(request, 'medical_records/upload_attachment.html', {'form': form, 'record': record})
+
+
+def _get_readable_attachment(request, pk):
+    attachment = get_object_or_404(
+        MedicalRecordAttachment.objects.select_related('blob'), pk=pk
+    )
+    patient_id = (
+        MedicalRecord.objects.filter(pk=attachment.record_id).values_list('patient_id', flat=True).first()
+        or ArchivedMedicalRecord.objects.filter(original_id=attachment.record_id)
+        .values_list('patient_id', flat=True).first()
+    )
+    if not _can_read_records(request.user, patient_id):
+        raise PermissionDenied
+    return attachment, patient_id
+
+
+@login_required
+def download_attachment(request, pk):
+    """
+    Serves the stored file; supports Range requests so large scans can be resumed.
+    """
+    attachment, patient_id = _get_readable_attachment(request, pk)
+    blob = attachment.blob
+    response = serve_file(
+        request, blob_path(blob.sha256), blob.content_type, attachment.filename, f'"{blob.sha256}"',
+        as_attachment=request.GET.get('download') == '1',
+    )
+    # A resumed download is one read; log only its first range.
+    if response.status_code == 200 or request.headers.get('Range', '').startswith('bytes=0-'):
+        record_access(request, 'download_attachment', patient_id)
+    return response
+
+
+@login_required
+def attachment_thumbnail(request, pk):
+    attachment, _ = _get_readable_attachment(request, pk)
+    if attachment.blob.thumbnail_status != 'Done':
+        raise Http404("No thumbnail available.")
+    sha256 = attachment.blob.sha256
+    return serve_file(request, thumbnail_path(sha256), 'image/jpeg', f'{sha256}.jpg', f'"{sha256}-thumb"')
+
+
+def _get_printable_prescription(request, pk):
+    row = printable_row(pk)
+    if row is None:
+        raise Http404("No prescription found.")
+    if not _can_read_records(request.user, row['patient_id']):
+        raise PermissionDenied
+    return row
+
+
+@login_required
+def print_prescription(request, pk):
+    """
+    Redirects to the content-addressed URL of the prescription's current version.
+    """
+    row = _get_printable_prescription(request, pk)
+    return redirect('printed_prescription', pk=pk, digest=content_hash(row))
+
+
+@login_required
+def printed_prescription(request, pk, digest):
+    """
+    Serves one immutable rendering; an outdated digest redirects to the current one.
+    """
+    row = _get_printable_prescription(request, pk)
+    current = content_hash(row)
+    if digest != current:
+        return redirect('printed_prescription', pk=pk, digest=current)
+
+    etag = f'"{digest}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is None:
+        response = FileResponse(open(get_document(row, digest), 'rb'), content_type='text/html; charset=utf-8')
+        record_access(request, 'printed_prescription', row['patient_id'])
+    else:
+        response = not_modified
+    response['ETag'] = etag
+    # no-transform keeps the strong ETag: compression would weaken it.
+    response['Cache-Control'] = 'private, max-age=31536000, immutable, no-transform'
+    return response
@@ -0,0 +1,164 @@
+"""
+Waitlist that refills freed appointment slots.
+
+When an appointment is canceled or deleted (see signals.py), `offer_slot` takes the
+best waiting patient for that doctor from the waitlist_queue_idx index: most urgent
+first, then earliest request. That patient gets a hold on the slot for
+WAITLIST_HOLD_MINUTES. The candidate is claimed with a conditional UPDATE, so two
+workers freeing slots at once never hand the same patient two offers.
+
+A declined or expired hold leaves the queue and the slot goes to the next
+candidate. Expired holds are swept by `manage.py expire_waitlist_holds`.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .branches import use_database
+from .models import Appointment, WaitlistEntry, lock_doctor, overlapping_appointments
+
+Slot = namedtuple('Slot', 'doctor_id date time duration_minutes location is_virtual')
+
+MAX_CLAIM_ATTEMPTS = 5
+
+
+def hold_duration():
+    return timedelta(minutes=getattr(settings, 'WAITLIST_HOLD_MINUTES', 30))
+
+
+def slot_from_appointment(appointment):
+    return Slot(appointment.doctor_id, appointment.date, appointment.time, appointment.duration_minutes,
+                appointment.location, appointment.is_virtual)
+
+
+def slot_from_entry(entry):
+    return Slot(entry.doctor_id, entry.offered_date, entry.offered_time, entry.offered_duration_minutes,
+                entry.offered_location, entry.offered_is_virtual)
+
+
+def is_upcoming(slot):
+    # Appointment dates and times are local wall-clock values, like date.today().
+    return datetime.combine(slot.date, slot.time) > datetime.now()
+
+
+def queue(doctor_id):
+    return WaitlistEntry.objects.filter(doctor_id=doctor_id, status='Waiting').order_by('-urgency', 'requested_at')
+
+
+def next_candidate(slot, exclude_patient_ids=()):
+    return (
+        queue(slot.doctor_id)
+        .filter(Q(latest_date__isnull=True) | Q(latest_date__gte=slot.date))
+        .exclude(patient_id__in=exclude_patient_ids)
+        .first()
+    )
+
+
+def offer_slot(slot, exclude_patient_ids=()):
+    """
+    Puts the freed slot on hold for the best waiting candidate. Returns the entry
+    that got the offer, or None if nobody is waiting or the slot is in the past.
+    """
+    if not is_upcoming(slot):
+        return None
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        candidate = next_candidate(slot, exclude_patient_ids)
+        if candidate is None:
+            return None
+        claimed = WaitlistEntry.objects.filter(pk=candidate.pk, status='Waiting').update(
+            status='Offered',
+            offered_date=slot.date,
+            offered_time=slot.time,
+            offered_duration_minutes=slot.duration_minutes,
+            offered_location=slot.location,
+            offered_is_virtual=slot.is_virtual,
+            offer_expires_at=timezone.now() + hold_duration(),
+        )
+        if claimed:
+            candidate.refresh_from_db()
+            return candidate
+    return None
+
+
+def release_slot(appointment):
+    """
+    Offers an appointment's slot once the surrounding transaction commits.
+    """
+    slot = slot_from_appointment(appointment)
+    patient_id = appointment.patient_id
+    database = appointment._state.db or router.db_for_write(Appointment)
+
+    def offer():
+        with use_database(database):
+            offer_slot(slot, exclude_patient_ids=[patient_id])
+
+    transaction.on_commit(offer, using=database)
+
+
+def _close_offer(entry, status):
+    """
+    Ends a hold; returns True if this call ended it.
+    """
+    return bool(WaitlistEntry.objects.filter(pk=entry.pk, status='Offered').update(status=status))
+
+
+def accept(entry):
+    """
+    Books the held slot. Returns the appointment, or None if the hold has expired
+    (the slot then moves on to the next candidate) or an appointment overlapping
+    the slot was booked directly in the meantime.
+    """
+    slot = slot_from_entry(entry)
+    if entry.status != 'Offered' or entry.offer_expires_at <= timezone.now():
+        expire(entry)
+        return None
+    using = router.db_for_write(Appointment)
+    with transaction.atomic(using=using):
+        lock_doctor(slot.doctor_id, using)
+        taken = overlapping_appointments(
+            Appointment.objects.all(), slot.doctor_id, [slot.date], slot.time, slot.duration_minutes
+        )
+        if taken:
+            _close_offer(entry, 'Expired')
+            return None
+        if not _close_offer(entry, 'Booked'):
+            return None
+        appointment = Appointment.objects.create(
+            patient_id=entry.patient_id,
+            doctor_id=slot.doctor_id,
+            date=slot.date,
+            time=slot.time,
+            duration_minutes=slot.duration_minutes,
+            location=slot.location,
+            is_virtual=slot.is_virtual,
+            appointment_notes=entry.notes,
+        )
+        WaitlistEntry.objects.filter(pk=entry.pk).update(appointment=appointment)
+    return appointment
+
+
+def decline(entry):
+    if _close_offer(entry, 'Declined'):
+        offer_slot(slot_from_entry(entry), exclude_patient_ids=[entry.patient_id])
+
+
+def expire(entry):
+    if _close_offer(entry, 'Expired'):
+        offer_slot(slot_from_entry(entry), exclude_patient_ids=[entry.patient_id])
+
+
+def expire_holds(now=None):
+    """
+    Expires overdue holds and passes their slots on; returns how many expired.
+    """
+    overdue = WaitlistEntry.objects.filter(status='Offered', offer_expires_at__lte=now or timezone.now())
+    count = 0
+    for entry in overdue.iterator():
+        if _close_offer(entry, 'Expired'):
+            count += 1
+            offer_slot(slot_from_entry(entry), exclude_patient_ids=[entry.patient_id])
+    return count